@@ -1,4 +1,5 @@
 from flask import Flask
+import json
 import os
 
 def create_app(test_config=None):
@@ -28,6 +29,103 @@ def create_app(test_config=None):
         N8N_WEBHOOK_URL='YOUR_N8N_WEBHOOK_URL',
         LAMATIC_API_KEY='YOUR_LAMATIC_API_KEY',
         LAMATIC_PROJECT_ID='YOUR_LAMATIC_PROJECT_ID',
+        # Streaming CSV ingestion: bytes read per chunk, records per store batch,
+        # and how many error messages are kept for display per upload.
+        CSV_INGEST_CHUNK_SIZE=1024 * 1024,
+        CSV_INGEST_BATCH_SIZE=5000,
+        CSV_INGEST_MAX_ERRORS=100,
+        # Uploads are parsed by background jobs (see app/jobs.py) in a pool of this many
+        # processes per worker (0 parses in the job thread); False ingests inline in the
+        # request. The default shares all but one of the host's CPUs between the gunicorn
+        # workers (WEB_CONCURRENCY).
+        CSV_INGEST_BACKGROUND=True,
+        CSV_INGEST_PROCESSES=int(os.environ.get(
+            'CSV_INGEST_PROCESSES',
+            max(1, ((os.cpu_count() or 2) - 1) // max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))))),
+        CSV_INGEST_JOBS_RETAINED=100,
+        # Number of top rows by commission kept up to date for the affiliate dashboard.
+        AFFILIATE_TOP_K=5,
+        # Rows per page for the dashboards' raw data tables and the /api/data endpoints.
+        TABLE_PAGE_SIZE=50,
+        TABLE_MAX_PAGE_SIZE=500,
+        # 'memory' or 'sqlite'. The SQLite file defaults to <instance_path>/ainexus.sqlite3.
+        STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'memory'),
+        STORAGE_SQLITE_PATH=os.environ.get('STORAGE_SQLITE_PATH'),
+        # Shared outbound HTTP pool for the website analyzer and automation webhooks (see
+        # app/http_pool.py): total and keep-alive connections, requests in flight per host,
+        # and default timeouts in seconds.
+        HTTP_POOL_HTTP2=True,
+        HTTP_POOL_MAX_CONNECTIONS=100,
+        HTTP_POOL_MAX_KEEPALIVE=20,
+        HTTP_POOL_KEEPALIVE_EXPIRY=30,
+        HTTP_POOL_PER_HOST=int(os.environ.get('HTTP_POOL_PER_HOST', 10)),
+        HTTP_POOL_TIMEOUT=10,
+        HTTP_POOL_CONNECT_TIMEOUT=5,
+        HTTP_POOL_USER_AGENT='AI-Nexus/1.0',
+        # Site crawl mode of the system analyzer (see app/site_audit.py): link depth and
+        # pages crawled (requests may ask for less), links checked, and requests in flight
+        # per analyzer run (crawl or not).
+        ANALYZER_CRAWL_MAX_DEPTH=3,
+        ANALYZER_CRAWL_MAX_PAGES=200,
+        ANALYZER_CRAWL_MAX_LINKS=2000,
+        ANALYZER_CRAWL_CONCURRENCY=16,
+        # Requests in flight per host start at ANALYZER_HOST_CONCURRENCY_INITIAL and adapt to
+        # the host's latency and errors (see app/link_scheduler.py).
+        ANALYZER_HOST_CONCURRENCY_INITIAL=2,
+        ANALYZER_HOST_CONCURRENCY_MAX=8,
+        ANALYZER_HOST_LATENCY_TARGET_MS=1000,
+        # Analyzer link status cache (see app/link_cache.py): seconds a check is reused
+        # without a request, and how long it is kept for conditional revalidation.
+        LINK_CACHE_ENABLED=True,
+        LINK_CACHE_TTL=int(os.environ.get('LINK_CACHE_TTL', 900)),
+        LINK_CACHE_MAX_AGE=7 * 86400,
+        LINK_CACHE_MAX_ENTRIES=50_000,
+        # Gemini models by alias (see app/ai_models.py); a value is a model name or a dict
+        # with model_name, generation_config and system_instruction.
+        GEMINI_MODELS={
+            'default': 'gemini-1.5-flash',
+            'code': 'gemini-1.5-flash',
+        },
+        # 'gemini', or 'local' for the stand-in model (app/ai_local.py) configured by
+        # AI_LOCAL_MODEL, e.g. {'first_token_ms': 800, 'error_rate': 0.02}.
+        GEMINI_BACKEND=os.environ.get('GEMINI_BACKEND', 'gemini'),
+        AI_LOCAL_MODEL=json.loads(os.environ.get('AI_LOCAL_MODEL', '{}')),
+        # Provider quota for Gemini calls, shared by every request thread in a process, and
+        # the limits for /ai-services/batch (tasks per request, model calls in flight).
+        AI_RATE_LIMIT_RPM=int(os.environ.get('AI_RATE_LIMIT_RPM', 300)),
+        AI_RATE_LIMIT_BURST=10,
+        AI_RATE_LIMIT_MAX_WAIT=30,
+        AI_BATCH_MAX_TASKS=500,
+        AI_BATCH_CONCURRENCY=int(os.environ.get('AI_BATCH_CONCURRENCY', 8)),
+        # Model calls in flight per process, of which the last AI_INTERACTIVE_RESERVED are
+        # only used by interactive requests (see app/ai_scheduler.py).
+        AI_MAX_CONCURRENT_CALLS=int(os.environ.get('AI_MAX_CONCURRENT_CALLS', 16)),
+        AI_INTERACTIVE_RESERVED=4,
+        AI_GATE_MAX_WAIT=60,
+        # Prompt images are downscaled to fit AI_IMAGE_MAX_SIDE pixels and re-encoded
+        # (see app/ai_images.py); larger uploads than AI_IMAGE_MAX_SOURCE_BYTES are dropped.
+        AI_IMAGE_MAX_SIDE=1536,
+        AI_IMAGE_JPEG_QUALITY=85,
+        AI_IMAGE_MAX_SOURCE_BYTES=25 * 1024 * 1024,
+        AI_IMAGE_WORKERS=2,
+        AI_IMAGE_CACHE_ENTRIES=64,
+        # Gemini response cache (see app/ai_cache.py): seconds an answer stays fresh, and
+        # the memory tier's entry/byte limits. AI_CACHE_PATH enables the on-disk tier.
+        AI_CACHE_ENABLED=True,
+        AI_CACHE_TTL=int(os.environ.get('AI_CACHE_TTL', 3600)),
+        AI_CACHE_MAX_ENTRIES=1024,
+        AI_CACHE_MAX_BYTES=32 * 1024 * 1024,
+        AI_CACHE_PATH=os.environ.get('AI_CACHE_PATH'),
+        AI_CACHE_DISK_MAX_ENTRIES=100_000,
+        # Near-duplicate cache for social posts, ad optimization and Business Chimp copy
+        # (see app/ai_similar.py): estimated Jaccard similarity of the user's text needed
+        # to reuse a response, MinHash size, and bounds.
+        AI_SIMILAR_CACHE_ENABLED=True,
+        AI_SIMILAR_THRESHOLD=float(os.environ.get('AI_SIMILAR_THRESHOLD', 0.9)),
+        AI_SIMILAR_NUM_PERM=64,
+        AI_SIMILAR_MAX_ENTRIES=5000,
+        AI_SIMILAR_TTL=3600,
+        AI_SIMILAR_MAX_CHARS=2000,
     )
 
     if test_config is None:
@@ -37,11 +135,42 @@ def create_app(test_config=None):
         # Load the test config if passed in
         app.config.from_mapping(test_config)
 
-    # In-memory data stores for MVP
-    app.affiliate_data_store = []
-    app.ad_campaign_data_store = []
-    app.cloud_service_data_store = []
-    app.mailchimp_data_store = []
+    # Data stores: in-memory per process by default, or persisted in SQLite so that
+    # several gunicorn workers share them (see app/storage.py).
+    from .storage import init_storage
+    init_storage(app)
+
+    from .jobs import IngestJobManager
+    app.ingest_jobs = IngestJobManager(app)
+
+    from .http_pool import HttpPool
+    app.http_pool = HttpPool.from_config(app.config)
+
+    from .link_cache import LinkStatusCache
+    app.link_cache = LinkStatusCache.from_config(app.config)
+
+    from .ai_cache import ResponseCache, SingleFlight
+    app.ai_cache = ResponseCache.from_config(app.config)
+    app.ai_inflight = SingleFlight()
+
+    from .ai_similar import SimilarityCache
+    app.ai_similar = SimilarityCache.from_config(app.config)
+
+    from .ai_scheduler import PriorityGate
+    app.ai_gate = PriorityGate.from_config(app.config)
+
+    from .ratelimit import TokenBucket
+    app.ai_rate_limiter = TokenBucket.per_minute(app.config['AI_RATE_LIMIT_RPM'], app.config['AI_RATE_LIMIT_BURST'])
+
+    from .ai_images import ImagePipeline
+    app.ai_images = ImagePipeline.from_config(app.config)
+
+    from .ai_metrics import AIMetrics
+    app.ai_metrics = AIMetrics()
+
+    from .ai_models import GeminiModelRegistry
+    app.gemini_models = GeminiModelRegistry.from_config(app.config)
+    app.gemini_models.warm()
 
     # Register blueprints
     from .routes import main_bp
@@ -0,0 +1,68 @@
+# Batched AI generation for /ai-services/batch.
+#
+# Marketers generate hundreds of social posts and ad variants at a time. Sending them one
+# HTTP request each means one serial model call per round trip. A batch takes N
+# heterogeneous tasks, runs them on a thread pool bounded by AI_BATCH_CONCURRENCY, and
+# returns the results in task order. A bad task gets its own error entry and does not fail
+# the batch.
+#
+# Provider quota is enforced where the model is called: generate_content_with_gemini takes
+# a token from app.ai_rate_limiter (AI_RATE_LIMIT_RPM / AI_RATE_LIMIT_BURST) before every
+# uncached model call. Batches, single requests and streams therefore share one budget per
+# process, and cache hits cost nothing. Batch calls run at BATCH priority, so the model call
+# gate (app/ai_scheduler.py) keeps slots free for interactive requests during a big batch.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from .ai_scheduler import BATCH, call_priority
+from .services import (
+    generate_social_media_post_service, optimize_ads_service, generate_business_chimp_content,
+    debug_code_service, generate_content_with_gemini,
+)
+
+# task type -> (service function, required fields, optional fields)
+BATCH_TASKS: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...], Tuple[str, ...]]] = {
+    'social_post': (generate_social_media_post_service, ('description',), ()),
+    'optimize_ads': (optimize_ads_service, ('prompt',), ()),
+    'business_chimp': (generate_business_chimp_content, ('topic',), ('context',)),
+    'debug': (debug_code_service, ('code', 'language'), ()),
+    'generate': (generate_content_with_gemini, ('prompt',), ()),
+}
+
+
+def _task_call(task: Any) -> Tuple[Callable[..., Any], Dict[str, Any]]:
+    """Validates one task object, returning the service function and its keyword arguments."""
+    if not isinstance(task, dict):
+        raise ValueError("Task must be a JSON object")
+    kind = task.get('type')
+    if kind not in BATCH_TASKS:
+        raise ValueError(f"Unknown task type '{kind}' (expected one of: {', '.join(BATCH_TASKS)})")
+    func, required, optional = BATCH_TASKS[kind]
+    missing = [name for name in required if not task.get(name)]
+    if missing:
+        raise ValueError(f"Task type '{kind}' requires: {', '.join(missing)}")
+    return func, {name: task[name] for name in required + optional if name in task}
+
+
+def run_ai_batch(app, tasks: List[Any], max_concurrency: int) -> List[Dict[str, Any]]:
+    """Runs tasks concurrently under app's context. Each result is {"index", "type", "result"}
+    or {"index", "type", "error"}, in task order."""
+    def run(index: int, task: Any) -> Dict[str, Any]:
+        entry = {"index": index, "type": task.get('type') if isinstance(task, dict) else None}
+        started = time.perf_counter()
+        try:
+            func, kwargs = _task_call(task)
+            with app.app_context(), call_priority(BATCH, f"batch.{task['type']}"):
+                entry["result"] = func(**kwargs)
+        except Exception as e:
+            entry["error"] = str(e)
+        entry["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+        return entry
+
+    if not tasks:
+        return []
+    workers = max(1, min(max_concurrency, len(tasks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-batch') as pool:
+        return list(pool.map(run, range(len(tasks)), tasks))
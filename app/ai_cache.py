@@ -0,0 +1,222 @@
+# Response cache for generate_content_with_gemini.
+#
+# Identical prompts are common: dashboard reloads ask for the same cloud recommendations,
+# and marketers regenerate the same Business Chimp topic. The cache is keyed on a SHA-256
+# of the model name, the prompt as sent and the image bytes (if any), so a hit returns
+# exactly what the model was asked for.
+#
+# The memory tier is an LRU (OrderedDict) with a TTL, bounded both by entry count and by
+# the total size of the cached text. Evicted and expired entries are counted.
+#
+# The optional disk tier (AI_CACHE_PATH) is a SQLite table in WAL mode that survives
+# restarts and is shared by the gunicorn workers. A memory miss falls back to it, and a
+# disk hit is promoted back into memory. Only real model responses are stored: mock
+# responses (no API key) and errors are never cached.
+#
+# The cache only helps once a response exists. When a campaign link goes out, many
+# requests for the same prompt arrive together, before the first answer is back.
+# SingleFlight coalesces them: the first caller for a key makes the model call, and
+# concurrent callers with the same key wait for it and share its result (or its error).
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from .storage import SQLiteDatabase
+
+# Expired rows are purged from the disk tier once every this many writes.
+_DISK_PURGE_INTERVAL = 256
+
+
+def cache_key(model_name: str, prompt: str, image_bytes: Optional[bytes] = None) -> str:
+    """Hex SHA-256 over the model name, prompt and image bytes (length-prefixed, so the
+    parts cannot run into each other)."""
+    digest = hashlib.sha256()
+    for part in (model_name.encode(), prompt.encode(), image_bytes or b''):
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of model responses, with an optional SQLite disk tier."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024,
+                 path: Optional[str] = None, disk_max_entries: int = 100_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+        # key -> (response, expires_at, size in bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk: Optional[SQLiteDatabase] = None
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._disk = SQLiteDatabase(path)
+            self._disk.connection().execute(
+                'CREATE TABLE IF NOT EXISTS ai_response_cache '
+                '(key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    @classmethod
+    def from_config(cls, config) -> 'ResponseCache':
+        return cls(ttl=config['AI_CACHE_TTL'], max_entries=config['AI_CACHE_MAX_ENTRIES'],
+                   max_bytes=config['AI_CACHE_MAX_BYTES'], path=config.get('AI_CACHE_PATH'),
+                   disk_max_entries=config['AI_CACHE_DISK_MAX_ENTRIES'])
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+                self.expirations += 1
+        if self._disk is not None:
+            row = self._disk.connection().execute(
+                'SELECT response, expires_at FROM ai_response_cache WHERE key = ? AND expires_at > ?',
+                (key, now)).fetchone()
+            if row is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, row[0], row[1])
+                return row[0]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self.stores += 1
+            self._insert(key, response, expires_at)
+        if self._disk is not None:
+            self._write_disk(key, response, expires_at)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self._disk is not None:
+            self._disk.connection().execute('DELETE FROM ai_response_cache')
+
+    def _insert(self, key: str, response: str, expires_at: float) -> None:
+        size = len(response.encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (response, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._bytes -= self._entries.pop(key)[2]
+
+    def _write_disk(self, key: str, response: str, expires_at: float) -> None:
+        conn = self._disk.connection()
+        conn.execute('INSERT OR REPLACE INTO ai_response_cache (key, response, expires_at) VALUES (?, ?, ?)',
+                     (key, response, expires_at))
+        with self._lock:
+            self._disk_writes += 1
+            purge = self._disk_writes % _DISK_PURGE_INTERVAL == 0
+        if purge:
+            # Drop expired rows, then the soonest-expiring (i.e. oldest) rows beyond the cap.
+            conn.execute('DELETE FROM ai_response_cache WHERE expires_at <= ?', (time.time(),))
+            conn.execute('DELETE FROM ai_response_cache WHERE key IN (SELECT key FROM ai_response_cache '
+                         'ORDER BY expires_at DESC LIMIT -1 OFFSET ?)', (self.disk_max_entries,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            stats = {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'disk_enabled': self._disk is not None,
+            }
+        if self._disk is not None:
+            stats['disk_entries'] = self._disk.connection().execute(
+                'SELECT COUNT(*) FROM ai_response_cache').fetchone()[0]
+        return stats
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its outcome."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+                leader = True
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._flights),
+                'waiting': sum(flight.waiters for flight in self._flights.values()),
+            }
@@ -0,0 +1,148 @@
+# Preprocessing for images attached to Gemini prompts.
+#
+# An uploaded image arrives as a base64 string (often a data: URL). The old code on the
+# request thread:
+#   - split the string, decoded it, and opened it with PIL
+#   - passed the full-size image to the SDK, which re-encodes any PIL image to lossless
+#     WebP before upload
+# So a 20 MB phone photo cost several large copies, a slow lossless encode, and a
+# 20+ MB request to the model.
+#
+# ImagePipeline does this work on a small thread pool instead; PIL releases the GIL
+# while decoding, resizing and encoding. Steps:
+#   - decode straight from a memoryview of the payload, with no split copy
+#   - if the image is larger than AI_IMAGE_MAX_SIDE pixels, downscale it, using JPEG
+#     draft mode so the decoder itself does most of the reduction
+#   - re-encode as JPEG, or PNG when there is transparency
+#   - pass the encoded bytes to the SDK as an inline blob, so it uploads them as they are
+# Images already within the limits are sent unchanged. Results are kept in a small LRU
+# keyed by the SHA-256 of the payload, so re-sending the same image skips all of this.
+
+import binascii
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from PIL import Image, ImageOps
+
+# Formats the model accepts as-is when no resizing is needed.
+_PASSTHROUGH_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp'}
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """An image ready to send to the model."""
+    mime_type: str
+    data: bytes
+    width: int
+    height: int
+    source_bytes: int
+
+    def as_part(self) -> Dict[str, Any]:
+        """Inline blob content part for generate_content."""
+        return {'mime_type': self.mime_type, 'data': self.data}
+
+
+def _payload_view(image_data: str) -> memoryview:
+    """The base64 payload of a data: URL or bare base64 string, without copying the slice."""
+    raw = memoryview(image_data.encode('ascii'))
+    comma = image_data.find(',', 0, 256)
+    return raw[comma + 1:] if comma >= 0 else raw
+
+
+class ImagePipeline:
+    """Decodes, downscales and re-encodes prompt images on a thread pool, deduplicating repeats."""
+
+    def __init__(self, max_side: int = 1536, jpeg_quality: int = 85, max_source_bytes: int = 25 * 1024 * 1024,
+                 workers: int = 2, cache_entries: int = 64, timeout: float = 30):
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self.max_source_bytes = max_source_bytes
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-image')
+        self._cache: 'OrderedDict[bytes, PreparedImage]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.resized = 0
+        self.dedupe_hits = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'ImagePipeline':
+        return cls(max_side=config['AI_IMAGE_MAX_SIDE'], jpeg_quality=config['AI_IMAGE_JPEG_QUALITY'],
+                   max_source_bytes=config['AI_IMAGE_MAX_SOURCE_BYTES'], workers=config['AI_IMAGE_WORKERS'],
+                   cache_entries=config['AI_IMAGE_CACHE_ENTRIES'])
+
+    def prepare(self, image_data: str) -> PreparedImage:
+        """Processes a base64 image (data: URL or bare) on the pool; raises ValueError for bad input."""
+        return self._pool.submit(self._prepare, image_data).result(timeout=self.timeout)
+
+    def _prepare(self, image_data: str) -> PreparedImage:
+        payload = _payload_view(image_data)
+        if len(payload) * 3 // 4 > self.max_source_bytes:
+            raise ValueError(f"Image exceeds {self.max_source_bytes // (1024 * 1024)} MB")
+        digest = hashlib.sha256(payload).digest()
+        with self._lock:
+            prepared = self._cache.get(digest)
+            if prepared is not None:
+                self._cache.move_to_end(digest)
+                self.dedupe_hits += 1
+                return prepared
+        try:
+            source = binascii.a2b_base64(payload)
+        except binascii.Error as e:
+            raise ValueError(f"Invalid base64 image data: {e}") from None
+        prepared, resized = self._encode(source)
+        with self._lock:
+            self.processed += 1
+            self.resized += resized
+            self.bytes_in += len(source)
+            self.bytes_out += len(prepared.data)
+            self._cache[digest] = prepared
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return prepared
+
+    def _encode(self, source: bytes):
+        img = Image.open(io.BytesIO(source))
+        width, height = img.size
+        mime_type = _PASSTHROUGH_FORMATS.get(img.format)
+        if mime_type and max(width, height) <= self.max_side:
+            img.verify()
+            return PreparedImage(mime_type, source, width, height, len(source)), False
+
+        limit = (self.max_side, self.max_side)
+        if img.format == 'JPEG':
+            # Let the JPEG decoder scale down by a power of two while decoding.
+            img.draft('RGB', limit)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(limit)
+        out = io.BytesIO()
+        if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+            img.save(out, format='PNG')
+            mime_type = 'image/png'
+        else:
+            img.convert('RGB').save(out, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            mime_type = 'image/jpeg'
+        return PreparedImage(mime_type, out.getvalue(), img.width, img.height, len(source)), True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'processed': self.processed,
+                'resized': self.resized,
+                'dedupe_hits': self.dedupe_hits,
+                'cached': len(self._cache),
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'max_side': self.max_side,
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,130 @@
+# Local stand-in for the Gemini backend.
+#
+# With GEMINI_BACKEND = 'local', the model registry hands out LocalModel instances instead of
+# genai.GenerativeModel, so the AI routes can be exercised and load-tested without an API key
+# or network access. LocalModel implements the part of the SDK surface the services use:
+# generate_content(content) returns an object with .text, and generate_content(content,
+# stream=True) returns an iterable of chunks with .text.
+#
+# Latency is drawn from a configurable distribution (AI_LOCAL_MODEL): a time to first token
+# plus a delay per streamed chunk, spent sleeping so request threads behave as they do while
+# waiting on the real API. error_rate injects failures. Responses are deterministic per
+# prompt and shaped like the real ones where the services parse them ([HTML]/[CSS] sections,
+# JSON recommendation lists), so parsing paths run too.
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+_DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+class LocalModelError(RuntimeError):
+    """Injected failure (stands in for quota, server and network errors)."""
+
+
+@dataclass(frozen=True)
+class LocalModelOptions:
+    """Settings for LocalModel, from the AI_LOCAL_MODEL config dict."""
+    distribution: str = 'lognormal'  # fixed | uniform | lognormal
+    first_token_ms: float = 400.0     # fixed value, uniform midpoint or lognormal median
+    spread: float = 0.5               # uniform: +/- fraction of first_token_ms; lognormal: sigma
+    chunk_ms: float = 15.0            # delay between streamed chunks
+    chunks: int = 20                  # chunks per response
+    response_chars: int = 2000        # approximate response length
+    error_rate: float = 0.0           # fraction of calls that raise LocalModelError
+    seed: Any = None
+
+    def __post_init__(self):
+        if self.distribution not in _DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{self.distribution}' (expected one of: {', '.join(_DISTRIBUTIONS)})")
+
+
+class _Chunk:
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class LocalModel:
+    """Drop-in for genai.GenerativeModel that sleeps for a sampled latency and returns canned text."""
+
+    def __init__(self, model_name: str, options: LocalModelOptions):
+        self.model_name = model_name
+        self.options = options
+        self._random = random.Random(options.seed)
+        self._lock = threading.Lock()
+
+    def _sample(self):
+        """(time to first token in seconds, whether to fail) for one call."""
+        options = self.options
+        with self._lock:
+            if options.distribution == 'fixed':
+                ms = options.first_token_ms
+            elif options.distribution == 'uniform':
+                ms = options.first_token_ms * self._random.uniform(1 - options.spread, 1 + options.spread)
+            else:
+                ms = self._random.lognormvariate(0, options.spread) * options.first_token_ms
+            fail = self._random.random() < options.error_rate
+        return max(0.0, ms) / 1000, fail
+
+    def generate_content(self, content: List[Any], stream: bool = False):
+        prompt = content[0] if content and isinstance(content[0], str) else ''
+        first_token, fail = self._sample()
+        chunks = _split(_response_text(prompt, self.options.response_chars), self.options.chunks)
+        if not stream:
+            time.sleep(first_token + self.options.chunk_ms * (len(chunks) - 1) / 1000)
+            if fail:
+                raise LocalModelError("Injected local model failure")
+            return _Chunk(''.join(chunks))
+        return self._stream(chunks, first_token, fail)
+
+    def _stream(self, chunks: List[str], first_token: float, fail: bool) -> Iterator[_Chunk]:
+        time.sleep(first_token)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.options.chunk_ms / 1000)
+            if fail and i == len(chunks) // 2:
+                raise LocalModelError("Injected local model failure mid-stream")
+            yield _Chunk(chunk)
+
+
+def _split(text: str, parts: int) -> List[str]:
+    size = max(1, -(-len(text) // max(1, parts)))
+    return [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+
+def _filler(seed: str, chars: int) -> str:
+    words = ['campaign', 'conversion', 'audience', 'engagement', 'budget', 'creative', 'growth', 'funnel',
+             'retention', 'optimize', 'latency', 'module', 'request', 'render', 'value', 'signal']
+    rng = random.Random(hashlib.sha256(seed.encode()).digest())
+    out, length = [], 0
+    while length < chars:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return ' '.join(out)
+
+
+def _response_text(prompt: str, chars: int) -> str:
+    """Deterministic response for prompt, in the format the calling service expects."""
+    body = _filler(prompt, chars)
+    if '[HTML]' in prompt:
+        half = chars // 2
+        return (f"[HTML]\n<main><h1>Local stand-in</h1><p>{body[:half]}</p></main>\n[/HTML]\n"
+                f"[CSS]\nmain {{ font-family: sans-serif; }} /* {body[half:]} */\n[/CSS]\n")
+    if 'JSON list' in prompt:
+        names = re.findall(r'^- (.+?) \(', prompt, re.MULTILINE)
+        return json.dumps([{"service_name": name, "recommendation": body[:120], "priority": "Medium"}
+                           for name in names])
+    return body
+
+
+def local_model_options(config: Dict[str, Any]) -> LocalModelOptions:
+    return LocalModelOptions(**(config or {}))
@@ -0,0 +1,114 @@
+# Counters and latency summaries for the AI services, reported by /api/ai/stats.
+#
+# Each latency series keeps its count and total plus a bounded window of recent
+# samples; percentiles are computed from that window.
+#
+# record_call() instruments one generate_content_with_gemini call. It records the origin
+# (route), priority class, model alias, outcome, prompt/response size and latency. It
+# updates per-outcome and per-origin counters and a per-origin latency series, and keeps
+# the most recent calls for /api/ai/calls.
+
+import threading
+import time
+from collections import defaultdict, deque
+from statistics import quantiles
+from typing import Any, Dict, List
+
+_SAMPLE_WINDOW = 1024
+_RECENT_CALLS = 200
+
+
+class LatencySeries:
+    """Count, mean and recent p50/p95/max of one latency, in milliseconds."""
+
+    __slots__ = ('count', 'total', 'samples')
+
+    def __init__(self, window: int = _SAMPLE_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {'count': 0}
+        recent = sorted(self.samples)
+        cuts = quantiles(recent, n=20, method='inclusive') if len(recent) > 1 else [recent[0]] * 19
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 1),
+            'p50_ms': round(cuts[9] * 1000, 1),
+            'p95_ms': round(cuts[18] * 1000, 1),
+            'max_ms': round(recent[-1] * 1000, 1),
+        }
+
+
+class AIMetrics:
+    """Thread-safe named counters and latency series."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._series: Dict[str, LatencySeries] = {}
+        self._recent_calls = deque(maxlen=_RECENT_CALLS)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = LatencySeries()
+            series.observe(seconds)
+
+    def record_call(self, origin: str, priority: str, model: str, outcome: str, prompt_chars: int,
+                    response_chars: int, seconds: float, image_bytes: int = 0, stream: bool = False) -> None:
+        """Instruments one model call; outcome is e.g. 'ok', 'error', 'cache_hit' or 'coalesced'."""
+        call = {
+            'time': time.time(),
+            'origin': origin,
+            'priority': priority,
+            'model': model,
+            'outcome': outcome,
+            'stream': stream,
+            'prompt_chars': prompt_chars,
+            'image_bytes': image_bytes,
+            'response_chars': response_chars,
+            'latency_ms': round(seconds * 1000, 1),
+        }
+        with self._lock:
+            counters = self._counters
+            counters['calls'] += 1
+            counters[f'calls.outcome.{outcome}'] += 1
+            counters[f'calls.origin.{origin}'] += 1
+            counters[f'calls.priority.{priority}'] += 1
+            counters['calls.prompt_chars'] += prompt_chars
+            counters['calls.response_chars'] += response_chars
+            counters['calls.image_bytes'] += image_bytes
+            series = self._series.get(f'call.{origin}')
+            if series is None:
+                series = self._series[f'call.{origin}'] = LatencySeries()
+            series.observe(seconds)
+            self._recent_calls.append(call)
+
+    def recent_calls(self) -> List[Dict[str, Any]]:
+        """The most recent model calls, newest first."""
+        with self._lock:
+            return list(reversed(self._recent_calls))
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': dict(sorted(self._counters.items())),
+                'latency': {name: series.summary() for name, series in sorted(self._series.items())},
+            }
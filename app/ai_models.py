@@ -0,0 +1,107 @@
+# Process-wide registry of Gemini models.
+#
+# generate_content_with_gemini used to call genai.configure() and build a new
+# GenerativeModel on every request. That repeated the SDK setup and rewrote global SDK
+# state while other request threads were using it. create_app now builds one
+# GeminiModelRegistry: it configures the SDK once, holds one GenerativeModel per alias
+# from GEMINI_MODELS, and builds them all at startup (warm) so the first request doesn't
+# pay for it. Service functions ask for a model by alias, e.g. 'default' or 'code', so an
+# alias can be pointed at another model or generation config without touching call sites.
+#
+# GEMINI_BACKEND = 'local' swaps every model for the stand-in in app/ai_local.py, which
+# needs no API key.
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Mapping, Optional
+
+import google.generativeai as genai
+
+from .ai_local import LocalModel, LocalModelOptions, local_model_options
+
+DEFAULT_MODEL_ALIAS = 'default'
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """How to construct the GenerativeModel behind one alias."""
+    model_name: str
+    generation_config: Dict[str, Any] = field(default_factory=dict)
+    system_instruction: Optional[str] = None
+
+    @property
+    def cache_name(self) -> str:
+        """Identifies the model and its settings in response cache keys."""
+        settings = ','.join(f'{k}={v}' for k, v in sorted(self.generation_config.items()))
+        return f'{self.model_name}|{settings}|{self.system_instruction or ""}'
+
+
+def api_key_configured(api_key: Optional[str]) -> bool:
+    """False for a missing key or one of the placeholder/mock keys."""
+    return bool(api_key) and 'YOUR_GOOGLE_API_KEY' not in api_key and api_key != 'MOCK_KEY'
+
+
+class GeminiModelRegistry:
+    """Thread-safe alias -> GenerativeModel map, configured once per process."""
+
+    def __init__(self, api_key: Optional[str], specs: Mapping[str, Any], backend: str = 'gemini',
+                 local_options: Optional[LocalModelOptions] = None):
+        if backend not in ('gemini', 'local'):
+            raise ValueError(f"Unknown GEMINI_BACKEND '{backend}' (expected 'gemini' or 'local')")
+        self.backend = backend
+        self._local_options = local_options or LocalModelOptions()
+        self.configured = backend == 'local' or api_key_configured(api_key)
+        self._specs: Dict[str, ModelSpec] = {}
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        for alias, spec in specs.items():
+            self.register(alias, spec)
+        if self.configured and backend == 'gemini':
+            genai.configure(api_key=api_key)
+
+    @classmethod
+    def from_config(cls, config) -> 'GeminiModelRegistry':
+        return cls(config.get('GOOGLE_API_KEY'), config['GEMINI_MODELS'], backend=config['GEMINI_BACKEND'],
+                   local_options=local_model_options(config.get('AI_LOCAL_MODEL')))
+
+    def register(self, alias: str, spec: Any) -> None:
+        """Adds or replaces an alias. spec is a ModelSpec, a dict of its fields or a model name."""
+        if isinstance(spec, str):
+            spec = ModelSpec(spec)
+        elif isinstance(spec, Mapping):
+            spec = ModelSpec(**spec)
+        with self._lock:
+            self._specs[alias] = spec
+            self._models.pop(alias, None)
+
+    def spec(self, alias: str = DEFAULT_MODEL_ALIAS) -> ModelSpec:
+        try:
+            return self._specs[alias]
+        except KeyError:
+            raise ValueError(f"Unknown Gemini model alias '{alias}'") from None
+
+    def get(self, alias: str = DEFAULT_MODEL_ALIAS):
+        """The GenerativeModel for alias, built on first use."""
+        model = self._models.get(alias)
+        if model is not None:
+            return model
+        spec = self.spec(alias)
+        with self._lock:
+            model = self._models.get(alias)
+            if model is None:
+                if self.backend == 'local':
+                    model = LocalModel(spec.model_name, self._local_options)
+                else:
+                    model = genai.GenerativeModel(spec.model_name, generation_config=spec.generation_config or None,
+                                                  system_instruction=spec.system_instruction)
+                self._models[alias] = model
+        return model
+
+    def warm(self) -> None:
+        """Builds every registered model up front; a no-op without an API key."""
+        if self.configured:
+            for alias in list(self._specs):
+                self.get(alias)
+
+    def aliases(self) -> Dict[str, str]:
+        return {alias: spec.model_name for alias, spec in self._specs.items()}
@@ -0,0 +1,144 @@
+# Priority admission for model calls.
+#
+# Every AI feature funnels into generate_content_with_gemini. Without admission control, a
+# batch of cloud recommendations or 500 batch tasks can fill all the provider capacity and
+# leave an interactive /ai-services/debugger call queueing behind them. PriorityGate bounds
+# the model calls in flight per process (AI_MAX_CONCURRENT_CALLS). The last
+# AI_INTERACTIVE_RESERVED slots only go to interactive calls. When a slot frees up, it goes
+# to the highest-priority waiter that may use it, first come first served within a class.
+#
+# Each call's class comes from call_priority(), a context manager the batch runner and the
+# background services use. Calls made while handling a request default to interactive,
+# and calls made outside one default to background. The same context carries the call's
+# origin for instrumentation: the Flask endpoint, or the label given to call_priority.
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from flask import has_request_context, request
+
+INTERACTIVE, BACKGROUND, BATCH = 'interactive', 'background', 'batch'
+PRIORITIES = {INTERACTIVE: 0, BACKGROUND: 1, BATCH: 2}
+
+# (priority class, origin label) set by call_priority for the current thread/task.
+_call_context: ContextVar[Optional[Tuple[str, str]]] = ContextVar('ai_call_context', default=None)
+
+
+class GateTimeout(RuntimeError):
+    """No model call slot became available within the wait limit."""
+
+
+@contextmanager
+def call_priority(priority: str, origin: Optional[str] = None):
+    """Runs the enclosed model calls at `priority`, attributed to `origin` (default: the request endpoint)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown call priority '{priority}'")
+    token = _call_context.set((priority, origin or _request_origin() or priority))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def _request_origin() -> Optional[str]:
+    return request.endpoint if has_request_context() else None
+
+
+def current_call() -> Tuple[str, str]:
+    """(priority class, origin) for a model call made now."""
+    context = _call_context.get()
+    if context is not None:
+        return context
+    origin = _request_origin()
+    return (INTERACTIVE, origin) if origin else (BACKGROUND, BACKGROUND)
+
+
+class PriorityGate:
+    """Bounds concurrent model calls, keeping `reserved` slots for interactive calls."""
+
+    def __init__(self, capacity: int, reserved: int = 0):
+        if capacity < 1:
+            raise ValueError("Gate capacity must be at least 1")
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity - 1)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = []  # heap of (priority rank, seq, event, priority)
+        self._seq = itertools.count()
+        self.admitted: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self.queued: Dict[str, int] = {name: 0 for name in PRIORITIES}
+        self.waited_seconds: Dict[str, float] = {name: 0.0 for name in PRIORITIES}
+
+    @classmethod
+    def from_config(cls, config) -> 'PriorityGate':
+        return cls(config['AI_MAX_CONCURRENT_CALLS'], config['AI_INTERACTIVE_RESERVED'])
+
+    def _limit(self, priority: str) -> int:
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+
+    @contextmanager
+    def slot(self, priority: str, timeout: Optional[float] = None):
+        """Holds one call slot for the enclosed model call."""
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, priority: str, timeout: Optional[float] = None) -> None:
+        started = time.monotonic()
+        event = threading.Event()
+        entry = (PRIORITIES[priority], next(self._seq), event, priority)
+        with self._lock:
+            heapq.heappush(self._waiters, entry)
+            self._admit_waiters()
+            if event.is_set():
+                self.admitted[priority] += 1
+                return
+            self.queued[priority] += 1
+        if not event.wait(timeout):
+            with self._lock:
+                if not event.is_set():
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                    raise GateTimeout(f"No {priority} model call slot within {timeout:.0f}s")
+        # _admit_waiters counted this call as in flight when it set the event.
+        with self._lock:
+            self.admitted[priority] += 1
+            self.waited_seconds[priority] += time.monotonic() - started
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._admit_waiters()
+
+    def _admit_waiters(self) -> None:
+        # Waiters are ordered by class; a background/batch waiter at the head that cannot use
+        # the reserved slots blocks lower classes too, but never an interactive one.
+        while self._waiters:
+            rank, seq, event, priority = self._waiters[0]
+            if self._in_flight >= self._limit(priority):
+                return
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+            event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            waiting = {name: 0 for name in PRIORITIES}
+            for _, _, _, priority in self._waiters:
+                waiting[priority] += 1
+            return {
+                'capacity': self.capacity,
+                'reserved_interactive': self.reserved,
+                'in_flight': self._in_flight,
+                'waiting': waiting,
+                'admitted': dict(self.admitted),
+                'queued': dict(self.queued),
+                'waited_seconds': {name: round(seconds, 3) for name, seconds in self.waited_seconds.items()},
+            }
@@ -0,0 +1,177 @@
+# Near-duplicate response cache for the marketing content generators.
+#
+# Marketers resend the same social post, ad or Business Chimp request with a word or some
+# punctuation changed. The exact-match cache (app/ai_cache.py) misses all of these. This
+# cache matches on the user's input text, not on the full prompt; the prompt templates are
+# shared by every request and would make unrelated inputs look alike.
+#
+# Matching uses MinHash and LSH:
+#   - The input is normalized: lowercased, punctuation dropped, whitespace collapsed.
+#   - It is split into character 5-shingles, which survive single-word edits far better
+#     than word shingles on short inputs.
+#   - A MinHash signature (AI_SIMILAR_NUM_PERM hash minimums) estimates the Jaccard
+#     similarity between two shingle sets.
+#   - An LSH index over bands of the signature finds candidates without comparing
+#     against every entry. Band sizes are chosen so pairs at the threshold almost always
+#     share a band.
+#   - Each candidate is verified against AI_SIMILAR_THRESHOLD before its response is
+#     served.
+#
+# Everything is local and bounded: at most AI_SIMILAR_MAX_ENTRIES signatures in LRU order,
+# each expiring after AI_SIMILAR_TTL seconds. Entries are scoped (one scope per service),
+# so a social post is never served for an ad request. Inputs longer than
+# AI_SIMILAR_MAX_CHARS bypass the cache, since signing them in pure Python costs more.
+
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_PRIME = (1 << 61) - 1
+_SHINGLE = 5
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub(' ', _NON_WORD.sub('', text.lower())).strip()
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """(bands, rows per band) for num_perm hashes. Picks the most rows whose S-curve midpoint
+    (1/bands) ** (1/rows) stays 0.1 below threshold, so that pairs at the threshold are nearly
+    always candidates. Candidates are verified, so extra ones only cost a comparison."""
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.1:
+            best = (bands, rows)
+    return best
+
+
+@dataclass
+class _Entry:
+    scope: str
+    signature: Tuple[int, ...]
+    response: Any
+    expires_at: float
+
+
+class SimilarityCache:
+    """Bounded MinHash/LSH index from input text to a cached response, per scope."""
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, max_entries: int = 5000, ttl: float = 3600,
+                 max_chars: int = 2000, seed: int = 1):
+        if not 0 < threshold <= 1:
+            raise ValueError("Similarity threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_chars = max_chars
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(_PRIME)) for _ in range(num_perm)]
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, int], Set[int]] = defaultdict(set)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.candidates_checked = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'SimilarityCache':
+        return cls(threshold=config['AI_SIMILAR_THRESHOLD'], num_perm=config['AI_SIMILAR_NUM_PERM'],
+                   max_entries=config['AI_SIMILAR_MAX_ENTRIES'], ttl=config['AI_SIMILAR_TTL'],
+                   max_chars=config['AI_SIMILAR_MAX_CHARS'])
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of text's shingles, or None if text is too long to sign."""
+        if len(text) > self.max_chars:
+            return None
+        text = normalize(text)
+        shingles = list({zlib.crc32(text[i:i + _SHINGLE].encode())
+                         for i in range(max(1, len(text) - _SHINGLE + 1))})
+        return tuple(min([(a * x + b) % _PRIME for x in shingles]) for a, b in self._perms)
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]) -> List[Tuple[str, int, int]]:
+        rows = self.rows
+        return [(scope, band, hash(signature[band * rows:(band + 1) * rows])) for band in range(self.bands)]
+
+    def similarity(self, a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity: the fraction of equal signature positions."""
+        return sum(x == y for x, y in zip(a, b)) / self.num_perm
+
+    def lookup(self, scope: str, text: str) -> Tuple[Optional[Any], Optional[Tuple[int, ...]]]:
+        """(cached response or None, signature of text to pass to store())."""
+        signature = self.signature(text)
+        if signature is None:
+            with self._lock:
+                self.bypassed += 1
+            return None, None
+        now = time.time()
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(key, ()))
+            best, best_score = None, self.threshold
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.expires_at <= now:
+                    continue
+                self.candidates_checked += 1
+                score = self.similarity(signature, entry.signature)
+                if score >= best_score:
+                    best, best_score = entry_id, score
+            if best is None:
+                self.misses += 1
+                return None, signature
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best].response, signature
+
+    def store(self, scope: str, signature: Optional[Tuple[int, ...]], response: Any) -> None:
+        if signature is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, signature, response, time.time() + self.ttl)
+            for key in self._band_keys(scope, signature):
+                self._buckets[key].add(entry_id)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _evict(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        for key in self._band_keys(entry.scope, entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'threshold': self.threshold,
+                'bands': self.bands,
+                'rows_per_band': self.rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypassed': self.bypassed,
+                'stores': self.stores,
+                'evictions': self.evictions,
+                'candidates_checked': self.candidates_checked,
+            }
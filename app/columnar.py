@@ -0,0 +1,524 @@
+# Column-oriented in-memory stores for the CSV-uploaded performance data.
+#
+# A list of dataclass instances costs several hundred bytes per row (object header,
+# __dict__, boxed ints/floats, a str per name). Here each field lives in its own typed
+# array instead: dates as day ordinals, counts as int64, money as float64, and the
+# repeated names (affiliate_name, campaign_name, platform) dictionary-encoded as uint32
+# codes into a per-column list of distinct strings. Optional fields carry a validity
+# bitmap (bit set = value present) next to the value array.
+#
+# The stores behave like the lists they replace for the existing routes and templates
+# (len, iteration, indexing, append/extend); records are materialized on access.
+#
+# CSV uploads go through upsert() instead of extend(): a hash index from each row's
+# key_fields to its row id lets a re-uploaded, overlapping export overwrite the rows it
+# repeats rather than appending duplicates.
+
+import heapq
+import sys
+import threading
+from array import array
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .models import (
+    AffiliatePerformanceRecord, AdCampaignPerformanceRecord,
+    epc_column, ctr_column, cpc_column, cpa_column,
+)
+from .rollups import AffiliateRollup, AffiliateTotals
+
+# _BITS[b] is the 8 validity flags packed into byte b, least significant bit first;
+# _PACK is the inverse mapping.
+_BITS = [tuple(bool(b >> i & 1) for i in range(8)) for b in range(256)]
+_PACK = {bits: b for b, bits in enumerate(_BITS)}
+
+# How many in-place rewrites a store remembers the changes of (see changes_since).
+_REWRITE_LOG_ENTRIES = 8
+
+
+class Bitmap:
+    """Packed bit vector used as a validity (non-null) mask."""
+
+    def __init__(self):
+        self._bytes = bytearray()
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, i: int) -> bool:
+        return bool(self._bytes[i >> 3] >> (i & 7) & 1)
+
+    def set(self, i: int, bit: bool) -> None:
+        if bit:
+            self._bytes[i >> 3] |= 1 << (i & 7)
+        else:
+            self._bytes[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def append(self, bit: bool) -> None:
+        i = self._length
+        if not i & 7:
+            self._bytes.append(0)
+        if bit:
+            self._bytes[i >> 3] |= 1 << (i & 7)
+        self._length = i + 1
+
+    def extend(self, bits: Iterable[bool]) -> None:
+        bits = [bool(bit) for bit in bits]
+        i = 0
+        while self._length & 7 and i < len(bits):
+            self.append(bits[i])
+            i += 1
+        full = i + (len(bits) - i) // 8 * 8
+        if all(bits[i:full]):
+            self._bytes.extend(b'\xff' * ((full - i) // 8))
+        else:
+            self._bytes.extend(_PACK[tuple(bits[j:j + 8])] for j in range(i, full, 8))
+        self._length += full - i
+        for bit in bits[full:]:
+            self.append(bit)
+
+    def to_list(self, start: int = 0, end: Optional[int] = None) -> List[bool]:
+        """Expands bits [start, end) to one bool per row, e.g. for the *_column metric helpers."""
+        end = self._length if end is None else min(end, self._length)
+        first = start >> 3
+        flags = [bit for byte in self._bytes[first:(end + 7) >> 3] for bit in _BITS[byte]]
+        return flags[start - (first << 3):end - (first << 3)]
+
+    def nbytes(self) -> int:
+        return len(self._bytes)
+
+
+# Materialized rows share date objects instead of allocating one per row.
+_date_from_ordinal = lru_cache(maxsize=8192)(date.fromordinal)
+
+
+class DateColumn:
+    """Dates stored as proleptic Gregorian ordinals (int32)."""
+
+    def __init__(self):
+        self.values = array('i')
+
+    def append(self, value: date) -> None:
+        self.values.append(value.toordinal())
+
+    def get(self, i: int) -> date:
+        return _date_from_ordinal(self.values[i])
+
+    def set(self, i: int, value: date) -> None:
+        self.values[i] = value.toordinal()
+
+    def extend_from(self, other: 'DateColumn') -> None:
+        self.values.extend(other.values)
+
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values)
+
+
+class NumericColumn:
+    """Optional int64 ('q') or float64 ('d') values with a validity bitmap."""
+
+    def __init__(self, typecode: str):
+        self.values = array(typecode)
+        self.valid = Bitmap()
+
+    def append(self, value) -> None:
+        if value is None:
+            self.values.append(0)
+            self.valid.append(False)
+        else:
+            self.values.append(value)
+            self.valid.append(True)
+
+    def extend(self, values: List[Any]) -> None:
+        """Appends a whole column of values (None for missing) at once."""
+        self.values.extend([0 if v is None else v for v in values])
+        self.valid.extend([v is not None for v in values])
+
+    def extend_from(self, other: 'NumericColumn') -> None:
+        self.values.extend(other.values)
+        self.valid.extend(other.valid.to_list())
+
+    def get(self, i: int):
+        return self.values[i] if self.valid[i] else None
+
+    def set(self, i: int, value) -> None:
+        self.values[i] = 0 if value is None else value
+        self.valid.set(i, value is not None)
+
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values) + self.valid.nbytes()
+
+
+class DictionaryColumn:
+    """Strings dictionary-encoded as uint32 codes into a list of distinct values."""
+
+    def __init__(self, nullable: bool = False):
+        self.codes = array('I')
+        self.dictionary: List[str] = []
+        self._lookup: Dict[str, int] = {}
+        self.valid = Bitmap() if nullable else None
+
+    def encode(self, value: str) -> int:
+        code = self._lookup.get(value)
+        if code is None:
+            value = sys.intern(value)
+            code = self._lookup[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def append(self, value: Optional[str]) -> None:
+        if self.valid is not None:
+            self.valid.append(value is not None)
+            if value is None:
+                self.codes.append(0)
+                return
+        self.codes.append(self.encode(value))
+
+    def extend(self, values: List[Optional[str]]) -> None:
+        """Appends a whole column of strings (None only if nullable) at once."""
+        if self.valid is not None:
+            self.valid.extend([v is not None for v in values])
+        lookup, encode = self._lookup, self.encode
+        self.codes.extend([0 if v is None else (lookup[v] if v in lookup else encode(v)) for v in values])
+
+    def extend_from(self, other: 'DictionaryColumn') -> None:
+        remap = [self.encode(value) for value in other.dictionary]
+        self.codes.extend([remap[code] for code in other.codes] if remap else other.codes)
+        if self.valid is not None:
+            self.valid.extend(other.valid.to_list())
+
+    def get(self, i: int) -> Optional[str]:
+        if self.valid is not None and not self.valid[i]:
+            return None
+        return self.dictionary[self.codes[i]]
+
+    def set(self, i: int, value: Optional[str]) -> None:
+        if self.valid is not None:
+            self.valid.set(i, value is not None)
+        self.codes[i] = 0 if value is None else self.encode(value)
+
+    def nbytes(self) -> int:
+        size = self.codes.itemsize * len(self.codes)
+        return size + (self.valid.nbytes() if self.valid is not None else 0)
+
+
+@dataclass
+class UpsertCounts:
+    """Outcome of ColumnStore.upsert: rows inserted, rows that changed a stored row, and rows
+    skipped (identical to the stored row, or repeated later in the same batch)."""
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+
+
+@dataclass
+class UpsertPlan:
+    """How a batch's rows map onto a store: batch rows to insert, (store row, batch row)
+    pairs to overwrite, and the number of batch rows skipped."""
+    inserts: List[int] = field(default_factory=list)
+    updates: List[Tuple[int, int]] = field(default_factory=list)
+    skipped: int = 0
+
+
+class ColumnStore:
+    """Base class: one column per field of record_type, in dataclass field order."""
+
+    record_type: type = None
+    # The field free-text search applies to (see app/pagination.py).
+    name_field: str = None
+    # The fields identifying a row; upsert() overwrites rows that share them.
+    key_fields: Tuple[str, ...] = ()
+
+    def __init__(self, records: Iterable[Any] = ()):
+        self._columns = self._make_columns()
+        self._length = 0
+        # Bumped on every mutation so derived structures (sort orders, indexes) can tell they are stale.
+        self.version = 0
+        # Bumped when rows are overwritten in place, for structures that only handle appends.
+        self.rewrites = 0
+        # (rewrites, changes) of the last few in-place rewrites, oldest first.
+        self._rewrite_log = deque(maxlen=_REWRITE_LOG_ENTRIES)
+        # Row key -> row id, built on the first upsert and kept current by _rows_added.
+        self._key_index: Optional[Dict[Tuple, int]] = None
+        # Held from plan_upsert through apply_upsert, so concurrent upserts of one key
+        # cannot both plan an insert.
+        self._upsert_lock = threading.Lock()
+        self.extend(records)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Batches parsed in worker processes are pickled back; locks do not pickle.
+        state = self.__dict__.copy()
+        del state['_upsert_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._upsert_lock = threading.Lock()
+
+    def _make_columns(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(self._length):
+            yield self.row(i)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.row(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(f"{type(self).__name__} index out of range")
+        return self.row(index)
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} rows={self._length}>"
+
+    def row(self, i: int) -> Any:
+        """Materializes row i as a record_type instance."""
+        return self.record_type(*[column.get(i) for column in self._columns.values()])
+
+    def column(self, name: str):
+        return self._columns[name]
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._columns)
+
+    def _rows_added(self, start: int) -> None:
+        """Hook called after rows [start, len(self)) were appended."""
+        self.version += 1
+        if self._key_index is not None:
+            self._index_keys(start)
+
+    def _rows_updated(self, changes: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Hook called after rows were overwritten in place, with each row's previous values."""
+        self.version += 1
+        self.rewrites += 1
+        self._rewrite_log.append((self.rewrites, changes))
+
+    def changes_since(self, rewrites: int) -> Tuple[int, Optional[List[Tuple[int, Dict[str, Any]]]]]:
+        """The current rewrite count, and the (row, previous values) changes of the rewrites
+        after the given count, oldest first; None if the log no longer reaches back that far."""
+        log = list(self._rewrite_log)
+        current = log[-1][0] if log else self.rewrites
+        entries = [(count, changes) for count, changes in log if count > rewrites]
+        if current > rewrites and (not entries or entries[0][0] != rewrites + 1):
+            return current, None
+        return current, [change for _, changes in entries for change in changes]
+
+    def append(self, record: Any) -> None:
+        for name, column in self._columns.items():
+            column.append(getattr(record, name))
+        self._length += 1
+        self._rows_added(self._length - 1)
+
+    def extend(self, records: Iterable[Any]) -> None:
+        start = self._length
+        if isinstance(records, type(self)):
+            # Column-wise concatenation, used when a batch was parsed straight into columns.
+            for name, column in self._columns.items():
+                column.extend_from(records._columns[name])
+            self._length += len(records)
+        else:
+            for record in records:
+                for name, column in self._columns.items():
+                    column.append(getattr(record, name))
+                self._length += 1
+        self._rows_added(start)
+
+    def extend_columns(self, length: int, **columns) -> None:
+        """Appends length rows given as one list per field (date columns as day ordinals)."""
+        for name, column in self._columns.items():
+            if isinstance(column, DateColumn):
+                column.values.extend(columns[name])
+            else:
+                column.extend(columns[name])
+        self._length += length
+        self._rows_added(self._length - length)
+
+    # --- Upserts ---
+
+    def _keys(self, start: int, end: int) -> List[Tuple]:
+        """Keys of rows [start, end), decoded a column at a time. Dates stay ordinals:
+        keys only need to hash and compare."""
+        parts = []
+        for name in self.key_fields:
+            column = self._columns[name]
+            if isinstance(column, DateColumn):
+                parts.append(column.values[start:end])
+                continue
+            dictionary = column.dictionary
+            codes = column.codes[start:end]
+            if column.valid is None:
+                parts.append([dictionary[code] for code in codes])
+            else:
+                # Null rows hold code 0, which is not a valid code while the dictionary is empty.
+                parts.append([dictionary[code] if ok else None
+                              for code, ok in zip(codes, column.valid.to_list(start, end))])
+        return list(zip(*parts))
+
+    def _value_getters(self) -> List[Callable[[int], Any]]:
+        return [column.get for name, column in self._columns.items() if name not in self.key_fields]
+
+    def _index_keys(self, start: int) -> None:
+        self._key_index.update(zip(self._keys(start, self._length), range(start, self._length)))
+
+    def plan_upsert(self, batch: 'ColumnStore') -> UpsertPlan:
+        """Matches each row of batch (a store of the same type) to a stored row by key.
+
+        Only the last row for each key in the batch counts; earlier ones are skipped. Work
+        per row is one hash lookup and, for keys already stored, a comparison of the other
+        fields. Nothing is modified; see apply_upsert.
+        """
+        if self._key_index is None:
+            self._key_index = {}
+            self._index_keys(0)
+        index = self._key_index
+        keys = batch._keys(0, len(batch))
+        last = {key: i for i, key in enumerate(keys)}
+        plan = UpsertPlan(skipped=len(keys) - len(last))
+        batch_values, stored_values = batch._value_getters(), self._value_getters()
+        for i, key in enumerate(keys):
+            if last[key] != i:
+                continue
+            row = index.get(key)
+            if row is None:
+                plan.inserts.append(i)
+            elif [get(i) for get in batch_values] == [get(row) for get in stored_values]:
+                plan.skipped += 1
+            else:
+                plan.updates.append((row, i))
+        return plan
+
+    def apply_upsert(self, batch: 'ColumnStore', plan: UpsertPlan) -> UpsertCounts:
+        """Writes a plan from plan_upsert: overwrites the matched rows, then appends the new ones."""
+        if plan.updates:
+            value_fields = [name for name in self._columns if name not in self.key_fields]
+            changes = []
+            for row, i in plan.updates:
+                previous = {}
+                for name in value_fields:
+                    column = self._columns[name]
+                    previous[name] = column.get(row)
+                    column.set(row, batch._columns[name].get(i))
+                changes.append((row, previous))
+            self._rows_updated(changes)
+        if len(plan.inserts) == len(batch):
+            self.extend(batch)
+        elif plan.inserts:
+            columns = {}
+            for name, column in batch._columns.items():
+                get = column.values.__getitem__ if isinstance(column, DateColumn) else column.get
+                columns[name] = [get(i) for i in plan.inserts]
+            self.extend_columns(len(plan.inserts), **columns)
+        return UpsertCounts(inserted=len(plan.inserts), updated=len(plan.updates), skipped=plan.skipped)
+
+    def upsert(self, records: Iterable[Any]) -> UpsertCounts:
+        """Inserts records whose key_fields are new and overwrites the stored row otherwise.
+        Records identical to the stored row are skipped."""
+        batch = records if isinstance(records, type(self)) else type(self)(records)
+        with self._upsert_lock:
+            return self.apply_upsert(batch, self.plan_upsert(batch))
+
+    def column_sum(self, name: str):
+        """Sum of a numeric column (nulls are stored as 0), or None if no row has a value."""
+        column = self._columns[name]
+        if not any(column.valid[i] for i in range(self._length)):
+            return None
+        return sum(column.values)
+
+    def top_rows(self, name: str, k: int) -> List[Any]:
+        """The k records with the largest values of a numeric column (nulls as 0), earlier rows first on ties."""
+        values = self._columns[name].values
+        return [self.row(i) for i in heapq.nlargest(k, range(self._length), key=values.__getitem__)]
+
+    def nbytes(self) -> int:
+        """Approximate payload size of all columns (excluding dictionary strings)."""
+        return sum(column.nbytes() for column in self._columns.values())
+
+    def _metric(self, func, numerator: str, denominator: str) -> List[Optional[float]]:
+        num, den = self._columns[numerator], self._columns[denominator]
+        return func(num.values, num.valid.to_list(), den.values, den.valid.to_list())
+
+
+class AffiliateColumnStore(ColumnStore):
+    """Columnar store of AffiliatePerformanceRecord rows."""
+
+    record_type = AffiliatePerformanceRecord
+    name_field = 'affiliate_name'
+    key_fields = ('report_date', 'affiliate_name')
+
+    def __init__(self, records: Iterable[Any] = (), top_k: Optional[int] = None):
+        # Only the app's long-lived store keeps a rollup; parse batches don't need one.
+        self.rollup = AffiliateRollup(top_k) if top_k else None
+        super().__init__(records)
+
+    def _rows_added(self, start: int) -> None:
+        super()._rows_added(start)
+        if self.rollup is not None:
+            self.rollup.add_rows(self._columns, start, self._length)
+
+    def _rows_updated(self, changes: List[Tuple[int, Dict[str, Any]]]) -> None:
+        super()._rows_updated(changes)
+        if self.rollup is not None:
+            self.rollup.update_rows(self._columns, changes)
+
+    def top_records(self) -> List[AffiliatePerformanceRecord]:
+        """The rollup's top-K rows by commission_amount, highest first."""
+        return [self.row(i) for i in self.rollup.top_rows(self._columns)]
+
+    def totals_by_affiliate(self) -> Dict[str, AffiliateTotals]:
+        return self.rollup.by_affiliate(self._columns['affiliate_name'].dictionary)
+
+    def _make_columns(self):
+        return {
+            'report_date': DateColumn(),
+            'affiliate_name': DictionaryColumn(),
+            'impressions': NumericColumn('q'),
+            'clicks': NumericColumn('q'),
+            'conversions': NumericColumn('q'),
+            'commission_amount': NumericColumn('d'),
+        }
+
+    def epc(self) -> List[Optional[float]]:
+        """Earnings Per Click for every row."""
+        return self._metric(epc_column, 'commission_amount', 'clicks')
+
+
+class AdCampaignColumnStore(ColumnStore):
+    """Columnar store of AdCampaignPerformanceRecord rows."""
+
+    record_type = AdCampaignPerformanceRecord
+    name_field = 'campaign_name'
+    key_fields = ('report_date', 'campaign_name', 'platform')
+
+    def _make_columns(self):
+        return {
+            'report_date': DateColumn(),
+            'campaign_name': DictionaryColumn(),
+            'platform': DictionaryColumn(nullable=True),
+            'impressions': NumericColumn('q'),
+            'clicks': NumericColumn('q'),
+            'cost': NumericColumn('d'),
+            'conversions': NumericColumn('q'),
+        }
+
+    def ctr(self) -> List[Optional[float]]:
+        """Click-Through Rate (%) for every row."""
+        return self._metric(ctr_column, 'clicks', 'impressions')
+
+    def cpc(self) -> List[Optional[float]]:
+        """Cost Per Click for every row."""
+        return self._metric(cpc_column, 'cost', 'clicks')
+
+    def cpa(self) -> List[Optional[float]]:
+        """Cost Per Acquisition for every row."""
+        return self._metric(cpa_column, 'cost', 'conversions')
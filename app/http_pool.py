@@ -0,0 +1,243 @@
+# Shared outbound HTTP connection pool.
+#
+# The website analyzer and the n8n / Lamatic integrations used to open a new
+# httpx.AsyncClient for every call (the analyzer opened two). Each call therefore paid a
+# fresh DNS lookup and TCP and TLS handshake, and no connection was ever reused.
+#
+# HttpPool owns one httpx.AsyncClient for the life of the app. An AsyncClient is bound to
+# the event loop it first runs on, and Flask runs each async view on its own short-lived
+# loop. So the client lives on a dedicated event loop thread, and callers on any loop (or
+# on plain threads, via request_sync) submit requests to it. Keep-alive connections then
+# survive across requests:
+#   - HTTP/2 (HTTP_POOL_HTTP2) multiplexes requests to one host over a single connection.
+#     It needs the h2 package, installed by httpx[http2]; without it the pool uses HTTP/1.1.
+#   - HTTP_POOL_MAX_CONNECTIONS / HTTP_POOL_MAX_KEEPALIVE bound the pool as a whole.
+#     HTTP_POOL_PER_HOST bounds the requests in flight to any one host, so a page with
+#     hundreds of links to one site cannot take every connection.
+#   - HTTP_POOL_TIMEOUT / HTTP_POOL_CONNECT_TIMEOUT are the defaults; a request may pass its
+#     own timeout.
+# stream() hands the body to the caller chunk by chunk as it downloads, so a page can be
+# parsed while it is still arriving.
+#
+# The loop thread starts on first use, so each forked gunicorn worker starts its own.
+
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+_END = object()
+
+
+class PooledStream:
+    """A response whose body is still arriving on the pool's loop."""
+
+    def __init__(self, response: httpx.Response, queue: 'asyncio.Queue'):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+        self._queue = queue
+
+    def raise_for_status(self) -> None:
+        self.response.raise_for_status()
+
+    async def aiter_bytes(self) -> AsyncIterator[bytes]:
+        while True:
+            item = await self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class HttpPool:
+    """App-lifetime httpx.AsyncClient on its own event loop thread, with per-host limits."""
+
+    def __init__(self, http2: bool = True, max_connections: int = 100, max_keepalive: int = 20,
+                 keepalive_expiry: float = 30, per_host: int = 10, timeout: float = 10,
+                 connect_timeout: float = 5, headers: Optional[Dict[str, str]] = None):
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        self.per_host = per_host
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive,
+                                    keepalive_expiry=keepalive_expiry)
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._headers = headers or {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self._pid = None
+        # Only touched on the pool's loop.
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_active: Dict[str, int] = defaultdict(int)
+        self._host_waiting: Dict[str, int] = defaultdict(int)
+        self.requests = 0
+        self.errors = 0
+        self.connects = 0
+        self.tls_handshakes = 0
+        self.request_seconds = 0.0
+
+    @classmethod
+    def from_config(cls, config) -> 'HttpPool':
+        return cls(http2=config['HTTP_POOL_HTTP2'], max_connections=config['HTTP_POOL_MAX_CONNECTIONS'],
+                   max_keepalive=config['HTTP_POOL_MAX_KEEPALIVE'],
+                   keepalive_expiry=config['HTTP_POOL_KEEPALIVE_EXPIRY'], per_host=config['HTTP_POOL_PER_HOST'],
+                   timeout=config['HTTP_POOL_TIMEOUT'], connect_timeout=config['HTTP_POOL_CONNECT_TIMEOUT'],
+                   headers={'User-Agent': config['HTTP_POOL_USER_AGENT']})
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            # First use, or first use in a forked child: the parent's loop thread is not here.
+            loop = asyncio.new_event_loop()
+            self._transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self._limits)
+            self._client = httpx.AsyncClient(transport=self._transport, timeout=self._timeout,
+                                             headers=self._headers)
+            self._host_slots.clear()
+            threading.Thread(target=loop.run_forever, name='http-pool', daemon=True).start()
+            self._loop, self._pid = loop, os.getpid()
+            return loop
+
+    async def _trace(self, event: str, info: Dict[str, Any]) -> None:
+        if event == 'connection.connect_tcp.complete':
+            self.connects += 1
+        elif event == 'connection.start_tls.complete':
+            self.tls_handshakes += 1
+
+    @asynccontextmanager
+    async def _host_slot(self, host: str):
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        self._host_waiting[host] += 1
+        try:
+            await slots.acquire()
+        finally:
+            self._host_waiting[host] -= 1
+        self._host_active[host] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.requests += 1
+            self.request_seconds += time.perf_counter() - started
+            self._host_active[host] -= 1
+            if not self._host_active[host] and not self._host_waiting[host]:
+                del self._host_active[host], self._host_waiting[host], self._host_slots[host]
+            slots.release()
+
+    def _with_trace(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {**kwargs, 'extensions': {**kwargs.get('extensions', {}), 'trace': self._trace}}
+
+    async def _request(self, method: str, url: str, kwargs: Dict[str, Any]) -> httpx.Response:
+        async with self._host_slot(urlsplit(url).netloc):
+            return await self._client.request(method, url, **self._with_trace(kwargs))
+
+    async def _pump(self, method: str, url: str, kwargs: Dict[str, Any], deliver: Callable[[Any], None]) -> None:
+        # Runs on the pool's loop: hands the response head, then each body chunk, then _END
+        # (or the exception) to the caller's loop.
+        try:
+            async with self._host_slot(urlsplit(url).netloc):
+                async with self._client.stream(method, url, **self._with_trace(kwargs)) as response:
+                    deliver(response)
+                    async for chunk in response.aiter_bytes():
+                        deliver(chunk)
+            deliver(_END)
+        except BaseException as e:
+            deliver(e)
+            raise
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Sends a request through the pool from any event loop; kwargs are httpx.AsyncClient.request's.
+        The response body is read before it is returned. Cancelling the caller cancels the request."""
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, kwargs), self._ensure_started())
+        return await asyncio.wrap_future(future)
+
+    def request_sync(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """request() for callers that are not running an event loop."""
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, kwargs), self._ensure_started())
+        return future.result()
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator['PooledStream']:
+        """Like request(), but yields the response as soon as its head arrives; read the body
+        with aiter_bytes(). Leaving the block early abandons the rest of the download."""
+        loop = asyncio.get_running_loop()
+        queue: 'asyncio.Queue' = asyncio.Queue()
+
+        def deliver(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # the caller's loop has already closed
+
+        future = asyncio.run_coroutine_threadsafe(self._pump(method, url, kwargs, deliver), self._ensure_started())
+        try:
+            head = await queue.get()
+            if isinstance(head, BaseException):
+                raise head
+            yield PooledStream(head, queue)
+        finally:
+            future.cancel()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('HEAD', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    def close(self) -> None:
+        """Closes the pooled connections and stops the loop thread."""
+        with self._lock:
+            loop, client = self._loop, self._client
+            self._loop = self._client = self._transport = None
+        if loop is None or self._pid != os.getpid():
+            return
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _connections(self) -> Dict[str, int]:
+        # httpcore's pool is not part of httpx's public API; report nothing if it moves.
+        pool = getattr(self._transport, '_pool', None)
+        counts = {'open': 0, 'idle': 0, 'http2': 0}
+        for connection in list(getattr(pool, 'connections', ())):
+            counts['open'] += 1
+            counts['idle'] += connection.is_idle()
+            counts['http2'] += connection.info().startswith('HTTP/2')
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            started = self._loop is not None
+        return {
+            'started': started,
+            'http2': self.http2,
+            'max_connections': self._limits.max_connections,
+            'max_keepalive': self._limits.max_keepalive_connections,
+            'per_host': self.per_host,
+            'connections': self._connections() if started else {'open': 0, 'idle': 0, 'http2': 0},
+            'hosts_active': {host: n for host, n in list(self._host_active.items()) if n},
+            'hosts_waiting': {host: n for host, n in list(self._host_waiting.items()) if n},
+            'requests': self.requests,
+            'errors': self.errors,
+            'connects': self.connects,
+            'tls_handshakes': self.tls_handshakes,
+            'mean_request_ms': round(self.request_seconds / self.requests * 1000, 1) if self.requests else 0,
+        }
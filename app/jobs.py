@@ -0,0 +1,265 @@
+# Background CSV ingestion jobs.
+#
+# Parsing a large export inline ties up a request thread and holds the GIL, stalling
+# every other request served by the (single) gunicorn worker. An upload route instead
+# spools the file to disk and submits an IngestJob, returning its id straight away.
+#
+# One merge thread per app runs jobs in submission order. It reads and splits the CSV
+# (csv.reader is C code), ships each row block to a process pool for the column
+# conversion (parse_row_block), and upserts the parsed batches into the store in
+# order under an app context. Only a bounded number of blocks is in flight at once, so
+# memory stays proportional to the batch size. /api/jobs/<id> reports progress, including
+# the errors of the batches merged so far.
+#
+# With the SQLite storage backend several gunicorn workers share the data, and a status
+# poll may land on any of them, so job state is written to an ingest_jobs table in the
+# same database on every change. With the in-memory backend (one worker) it stays in
+# memory. CSV_INGEST_PROCESSES is per worker; its default splits the host's CPUs between
+# the WEB_CONCURRENCY workers.
+#
+# The pool uses the 'forkserver' start method where available, else 'spawn'. It is
+# started from the merge thread of a multithreaded worker, and a plain fork there could
+# copy locks held by other threads into the children. The fork server imports the parsing
+# code once and forks each child from that clean, single-threaded process.
+
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .services import CsvIngestError, CsvIngestProgress, ingest_affiliate_csv_stream, ingest_ad_campaign_csv_stream
+
+# kind -> (ingest function, name of the app attribute holding the target store)
+INGEST_KINDS = {
+    'affiliate': (ingest_affiliate_csv_stream, 'affiliate_data_store'),
+    'ad_campaign': (ingest_ad_campaign_csv_stream, 'ad_campaign_data_store'),
+}
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp else None
+
+
+@dataclass
+class IngestJob:
+    """State of one background CSV ingestion, as reported by the status endpoint."""
+    id: str
+    kind: str
+    filename: str
+    total_bytes: int
+    status: str = 'queued'  # queued -> running -> done | failed
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: CsvIngestProgress = field(default_factory=CsvIngestProgress)
+    errors: List[str] = field(default_factory=list)
+    failure: Optional[str] = None
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if not self.started_at:
+            return None
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return round(self.progress.rows_processed / elapsed, 1) if elapsed > 0 else None
+
+    def as_dict(self) -> Dict[str, Any]:
+        progress = self.progress
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'filename': self.filename,
+            'status': self.status,
+            'submitted_at': _isoformat(self.submitted_at),
+            'started_at': _isoformat(self.started_at),
+            'finished_at': _isoformat(self.finished_at),
+            'bytes_read': progress.bytes_read,
+            'total_bytes': self.total_bytes,
+            'rows_processed': progress.rows_processed,
+            'records_added': progress.records_added,
+            'records_updated': progress.records_updated,
+            'records_skipped': progress.records_skipped,
+            'batches': progress.batches,
+            'error_count': progress.error_count,
+            'errors': list(self.errors),
+            'rows_per_second': self.rows_per_second,
+            'failure': self.failure,
+        }
+
+
+class MemoryJobTable:
+    """The most recent jobs of this process, in memory."""
+
+    def __init__(self, retained: int):
+        self._retained = retained
+        self._jobs: 'OrderedDict[str, IngestJob]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, job: IngestJob) -> None:
+        # Jobs are updated in place, so only a new job needs storing.
+        with self._lock:
+            if job.id in self._jobs:
+                return
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._retained:
+                oldest = next(iter(self._jobs.values()))
+                if oldest.status in ('queued', 'running'):
+                    break
+                self._jobs.popitem(last=False)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def recent(self) -> List[IngestJob]:
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+
+class SQLiteJobTable:
+    """The most recent jobs of all workers, in the shared SQLite database."""
+
+    def __init__(self, db, retained: int):
+        self._db = db
+        self._retained = retained
+        db.connection().execute('CREATE TABLE IF NOT EXISTS ingest_jobs (id TEXT PRIMARY KEY, '
+                                'submitted_at REAL NOT NULL, status TEXT NOT NULL, state TEXT NOT NULL)')
+
+    def save(self, job: IngestJob) -> None:
+        conn = self._db.connection()
+        conn.execute('INSERT OR REPLACE INTO ingest_jobs (id, submitted_at, status, state) VALUES (?, ?, ?, ?)',
+                     (job.id, job.submitted_at, job.status, json.dumps(asdict(job))))
+        if job.status == 'queued':
+            conn.execute("DELETE FROM ingest_jobs WHERE status NOT IN ('queued', 'running') AND id NOT IN "
+                         "(SELECT id FROM ingest_jobs ORDER BY submitted_at DESC LIMIT ?)", (self._retained,))
+
+    @staticmethod
+    def _load(state: str) -> IngestJob:
+        data = json.loads(state)
+        data['progress'] = CsvIngestProgress(**data['progress'])
+        return IngestJob(**data)
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        row = self._db.connection().execute('SELECT state FROM ingest_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def recent(self) -> List[IngestJob]:
+        rows = self._db.connection().execute('SELECT state FROM ingest_jobs ORDER BY submitted_at DESC LIMIT ?',
+                                             (self._retained,))
+        return [self._load(state) for state, in rows]
+
+
+class IngestJobManager:
+    """Queues CSV ingestion jobs for one app and keeps the most recent ones for status queries."""
+
+    def __init__(self, app):
+        self._app = app
+        self._processes = app.config['CSV_INGEST_PROCESSES']
+        retained = app.config['CSV_INGEST_JOBS_RETAINED']
+        db = getattr(app, 'storage_db', None)
+        self._table = MemoryJobTable(retained) if db is None else SQLiteJobTable(db, retained)
+        self._merge_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='csv-ingest')
+        self._pool: Optional[Executor] = None
+
+    def _parse_pool(self) -> Optional[Executor]:
+        """The process pool, started on first use (so each gunicorn worker gets its own)."""
+        if self._processes <= 0:
+            return None
+        if self._pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            if context.get_start_method() == 'forkserver':
+                context.set_forkserver_preload([ingest_affiliate_csv_stream.__module__])
+            self._pool = ProcessPoolExecutor(max_workers=self._processes, mp_context=context)
+        return self._pool
+
+    def _map_blocks(self, func: Callable, tasks: Iterator[Tuple]) -> Iterator[Tuple[int, Any, List[str]]]:
+        """Parses blocks in the process pool, yielding results in submission order with at
+        most two blocks per process in flight."""
+        pool = self._parse_pool()
+        if pool is None:
+            yield from (func(*task) for task in tasks)
+            return
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(pool.submit(func, *task))
+                if len(pending) >= 2 * self._processes:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def spool(file_storage) -> str:
+        """Saves an uploaded file to a temporary path and returns the path."""
+        fd, path = tempfile.mkstemp(prefix='ingest-', suffix='.csv')
+        with os.fdopen(fd, 'wb') as out:
+            file_storage.save(out)
+        return path
+
+    def submit(self, kind: str, path: str, filename: str) -> IngestJob:
+        """Queues the spooled CSV at path for ingestion; the file is deleted once the job ends."""
+        if kind not in INGEST_KINDS:
+            raise ValueError(f"Unknown ingestion kind '{kind}'")
+        job = IngestJob(id=uuid.uuid4().hex, kind=kind, filename=filename, total_bytes=os.path.getsize(path))
+        self._table.save(job)
+        self._merge_thread.submit(self._run, job, path)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._table.get(job_id)
+
+    def recent(self) -> List[IngestJob]:
+        """Retained jobs, newest first."""
+        return self._table.recent()
+
+    def _run(self, job: IngestJob, path: str) -> None:
+        ingest, store_attr = INGEST_KINDS[job.kind]
+        app = self._app
+        with app.app_context():
+            job.status = 'running'
+            job.started_at = time.time()
+            self._table.save(job)
+            try:
+                with open(path, 'rb') as stream:
+                    job.progress, job.errors = ingest(stream, getattr(app, store_attr), on_progress=self._tracker(job),
+                                                      map_blocks=self._map_blocks, errors=job.errors)
+                job.status = 'done'
+                app.logger.info(f"Ingest job {job.id} ({job.kind}, {job.filename}) finished: "
+                                f"{job.progress.rows_processed} rows at {job.rows_per_second} rows/sec, "
+                                f"{job.progress.error_count} errors.")
+            except Exception as e:
+                job.status = 'failed'
+                job.failure = str(e)
+                if isinstance(e, CsvIngestError):
+                    job.progress = e.progress
+                app.logger.error(f"Ingest job {job.id} ({job.kind}, {job.filename}) failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                self._table.save(job)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _tracker(self, job: IngestJob) -> Callable[[CsvIngestProgress], None]:
+        def track(progress: CsvIngestProgress) -> None:
+            # Called after each merged batch; progress and job.errors are updated in place.
+            job.progress = progress
+            self._table.save(job)
+        return track
+
+    def shutdown(self) -> None:
+        self._merge_thread.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
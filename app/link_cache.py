@@ -0,0 +1,131 @@
+# Link status cache for the system analyzer.
+#
+# Re-auditing a site used to request every link again, even though most links on a site
+# that has barely changed give the same answer as last time. LinkStatusCache remembers,
+# per normalized URL, the last check's status, time, ETag and Last-Modified. For crawled
+# pages it also remembers the links found on the page. An entry is then used in two
+# ways:
+#   - Fresh (checked less than LINK_CACHE_TTL seconds ago): the link is not requested
+#     at all, and a crawled page's links come from the cache.
+#   - Stale but within LINK_CACHE_MAX_AGE: the link is re-checked with a conditional
+#     request (If-None-Match / If-Modified-Since). A 304 confirms the entry, and for a
+#     page it saves downloading and parsing the body again.
+# Request errors, 5xx responses, 408 Request Timeout and 429 Too Many Requests are never
+# cached, since they are usually transient.
+#
+# The cache is in memory, LRU-ordered and bounded by LINK_CACHE_MAX_ENTRIES, and shared
+# by all analyzer runs in the process.
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class LinkStatus:
+    """The outcome of one link check."""
+    status: int
+    time_ms: int
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    checked_at: float = 0.0
+    links: Optional[Tuple[Dict[str, str], ...]] = None  # a crawled page's links
+    final_url: Optional[str] = None  # where a crawled page's redirects ended
+
+    def validators(self) -> Dict[str, str]:
+        """Headers that make a request conditional on the resource having changed."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+_TRANSIENT_STATUSES = (408, 429)
+
+
+def cacheable(status) -> bool:
+    return isinstance(status, int) and status < 500 and status not in _TRANSIENT_STATUSES
+
+
+class LinkStatusCache:
+    """Thread-safe LRU of LinkStatus by normalized URL, with a freshness TTL."""
+
+    def __init__(self, ttl: float = 900, max_age: float = 86400, max_entries: int = 50_000):
+        self.ttl = ttl
+        self.max_age = max(max_age, ttl)
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, LinkStatus]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config) -> 'LinkStatusCache':
+        return cls(ttl=config['LINK_CACHE_TTL'], max_age=config['LINK_CACHE_MAX_AGE'],
+                   max_entries=config['LINK_CACHE_MAX_ENTRIES'])
+
+    def lookup(self, url: str, page: bool = False) -> Tuple[Optional[LinkStatus], bool]:
+        """(entry or None, whether it is fresh). A stale entry is returned for revalidation.
+        With page=True, an entry without the page's links (a HEAD check) does not count."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None and now - entry.checked_at >= self.max_age:
+                del self._entries[url]
+                entry = None
+            if entry is None or (page and entry.links is None):
+                self.misses += 1
+                return None, False
+            self._entries.move_to_end(url)
+            fresh = now - entry.checked_at < self.ttl
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale += 1
+            return entry, fresh
+
+    def put(self, url: str, entry: LinkStatus) -> None:
+        with self._lock:
+            self.stores += 1
+            self._entries[url] = replace(entry, checked_at=time.time())
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def confirm(self, url: str, entry: LinkStatus) -> None:
+        """Records a 304 for entry: it is fresh again."""
+        with self._lock:
+            self.revalidated += 1
+        self.put(url, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'stale': self.stale,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions,
+            }
+
+
+def link_status(status: int, elapsed: float, headers, links: Optional[List[Dict[str, str]]] = None,
+                final_url: Optional[str] = None) -> LinkStatus:
+    """A LinkStatus from a response's status, headers and time taken."""
+    return LinkStatus(status, round(elapsed * 1000), headers.get('etag'), headers.get('last-modified'),
+                      links=None if links is None else tuple(links), final_url=final_url)
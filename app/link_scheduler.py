@@ -0,0 +1,170 @@
+# Per-host scheduling for the analyzer's requests.
+#
+# The analyzer used to start every link check at once. A page with 200 links to one slow
+# origin then had all 200 requests queued on that host: they timed out together, while the
+# other hosts were done in a moment. HostScheduler instead keeps one FIFO queue per host
+# and starts requests round-robin across hosts, within a global limit
+# (ANALYZER_CRAWL_CONCURRENCY). Each URL is scheduled once per run, compared in normalized
+# form.
+#
+# The number of requests in flight to each host adapts to how the host responds (AIMD,
+# as in TCP congestion control):
+#   - It starts at ANALYZER_HOST_CONCURRENCY_INITIAL.
+#   - Each good response adds 1/limit, so the limit grows by about one per round trip,
+#     up to ANALYZER_HOST_CONCURRENCY_MAX.
+#   - A slow response halves the limit, to a minimum of 1. Slow means both over
+#     ANALYZER_HOST_LATENCY_TARGET_MS and more than twice the host's fastest response.
+#     A timeout or other error, a 429 or a 5xx also halves it. Only requests started
+#     after the last cut can cut it again, so one burst of failures counts once.
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+# What a job reports about the request it made: (seconds to response, whether the host
+# coped). None means it made no request (e.g. a cache hit).
+JobResult = Optional[Tuple[float, bool]]
+
+
+@dataclass
+class AIMDLimit:
+    """Additive-increase, multiplicative-decrease concurrency limit for one host."""
+    limit: float
+    minimum: float = 1
+    maximum: float = 8
+    latency_target: float = 1.0
+    _last_cut: float = 0.0
+    _fastest: float = float('inf')
+
+    def on_result(self, started: float, seconds: float, ok: bool) -> None:
+        self._fastest = min(self._fastest, seconds)
+        # Slow means over the target and at least twice the host's best: a host that is
+        # always slow is not overloaded by being asked more.
+        slow = seconds > self.latency_target and seconds > 2 * self._fastest
+        if ok and not slow:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        elif started >= self._last_cut:
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_cut = time.monotonic()
+
+
+@dataclass
+class _Host:
+    limit: AIMDLimit
+    queue: Deque[Callable[[], Awaitable[JobResult]]] = field(default_factory=deque)
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    seconds: float = 0.0
+
+    def ready(self) -> bool:
+        return bool(self.queue) and self.in_flight < int(self.limit.limit)
+
+
+class HostScheduler:
+    """Runs request jobs with per-host FIFO queues, AIMD per-host limits and a global limit."""
+
+    def __init__(self, max_concurrency: int = 16, initial: float = 2, maximum: float = 8,
+                 latency_target: float = 1.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.initial = initial
+        self.maximum = max(maximum, initial)
+        self.latency_target = latency_target
+        self._hosts: Dict[str, _Host] = {}
+        self._ready: Deque[str] = deque()  # round-robin order of hosts with queued jobs
+        self._seen: Set[str] = set()
+        self._in_flight = 0
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_config(cls, config) -> 'HostScheduler':
+        return cls(max_concurrency=config['ANALYZER_CRAWL_CONCURRENCY'],
+                   initial=config['ANALYZER_HOST_CONCURRENCY_INITIAL'],
+                   maximum=config['ANALYZER_HOST_CONCURRENCY_MAX'],
+                   latency_target=config['ANALYZER_HOST_LATENCY_TARGET_MS'] / 1000)
+
+    def submit(self, url: str, job: Callable[[], Awaitable[JobResult]]) -> bool:
+        """Queues job, a request to url; False (and nothing queued) if url was already submitted."""
+        if url in self._seen:
+            return False
+        self._seen.add(url)
+        name = urlsplit(url).netloc
+        host = self._hosts.get(name)
+        if host is None:
+            host = self._hosts[name] = _Host(AIMDLimit(self.initial, maximum=self.maximum,
+                                                       latency_target=self.latency_target))
+        if not host.queue:
+            self._ready.append(name)
+        host.queue.append(job)
+        self._pending += 1
+        self._idle.clear()
+        self._start_jobs()
+        return True
+
+    def _start_jobs(self) -> None:
+        # Hosts at their limit are skipped and revisited when one of their jobs finishes.
+        checked = 0
+        while self._ready and self._in_flight < self.max_concurrency and checked < len(self._ready):
+            name = self._ready.popleft()
+            host = self._hosts[name]
+            if not host.ready():
+                self._ready.append(name)
+                checked += 1
+                continue
+            checked = 0
+            job = host.queue.popleft()
+            if host.queue:
+                self._ready.append(name)
+            host.in_flight += 1
+            self._in_flight += 1
+            task = asyncio.create_task(self._run(name, host, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, name: str, host: _Host, job: Callable[[], Awaitable[JobResult]]) -> None:
+        started = time.monotonic()
+        try:
+            result = await job()
+        except Exception:
+            result = (time.monotonic() - started, False)
+        finally:
+            host.in_flight -= 1
+            self._in_flight -= 1
+        if result is not None:
+            seconds, ok = result
+            host.requests += 1
+            host.seconds += seconds
+            host.failures += not ok
+            host.limit.on_result(started, seconds, ok)
+        if host.queue and name not in self._ready:
+            self._ready.append(name)
+        self._pending -= 1
+        if not self._pending:
+            self._idle.set()
+        self._start_jobs()
+
+    async def join(self) -> None:
+        """Waits until every submitted job, including ones submitted meanwhile, has finished."""
+        await self._idle.wait()
+
+    def cancel(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per host: the adapted concurrency limit, requests made, failures and mean latency."""
+        return {
+            name: {
+                'limit': round(host.limit.limit, 2),
+                'requests': host.requests,
+                'failures': host.failures,
+                'mean_ms': round(host.seconds / host.requests * 1000) if host.requests else None,
+            }
+            for name, host in self._hosts.items()
+        }
@@ -4,7 +4,7 @@
 
 from dataclasses import dataclass, field
 from datetime import date
-from typing import Optional, List
+from typing import Optional, List, Sequence
 
 # In-memory storage for Phase 1
 # These will be lists of dataclass instances.
@@ -22,8 +22,77 @@ from typing import Optional, List
 # It's better to initialize these in app.py or a service layer.
 # For now, just defining the models.
 
+# --- Derived metrics ---
+# All ratio metrics (CTR, CPC, CPA, EPC) share one definition: the ratio is only defined
+# when the denominator is positive and the numerator is present, and is rounded to 2 places.
+# The *_column variants apply the same rule to every row of a pair of typed column arrays
+# and their validity flags, returning a list. They are a plain Python loop, not vectorized
+# arithmetic: they save the column stores in app/columnar.py from materializing a record
+# per row, not the per-row work. The properties below use the scalar form.
+
+def ratio_metric(numerator: Optional[float], denominator: Optional[float], scale: float = 1.0) -> Optional[float]:
+    """Scalar ratio metric, e.g. ratio_metric(cost, clicks) is CPC."""
+    if denominator and denominator > 0 and numerator is not None:
+        return round((numerator / denominator) * scale, 2)
+    return None
+
+def ratio_metric_column(numerators: Sequence[float], numerator_valid: Sequence[bool],
+                        denominators: Sequence[float], denominator_valid: Sequence[bool],
+                        scale: float = 1.0) -> List[Optional[float]]:
+    """ratio_metric for each row of the given columns, as a list comprehension over them.
+    *_valid flags mark which entries are present (not None)."""
+    return [
+        round((n / d) * scale, 2) if nv and dv and d > 0 else None
+        for n, nv, d, dv in zip(numerators, numerator_valid, denominators, denominator_valid)
+    ]
+
+def epc_column(commission_amount, commission_valid, clicks, clicks_valid) -> List[Optional[float]]:
+    """Earnings Per Click for each row of the columns."""
+    return ratio_metric_column(commission_amount, commission_valid, clicks, clicks_valid)
+
+def ctr_column(clicks, clicks_valid, impressions, impressions_valid) -> List[Optional[float]]:
+    """Click-Through Rate (%) for each row of the columns."""
+    return ratio_metric_column(clicks, clicks_valid, impressions, impressions_valid, 100)
+
+def cpc_column(cost, cost_valid, clicks, clicks_valid) -> List[Optional[float]]:
+    """Cost Per Click for each row of the columns."""
+    return ratio_metric_column(cost, cost_valid, clicks, clicks_valid)
+
+def cpa_column(cost, cost_valid, conversions, conversions_valid) -> List[Optional[float]]:
+    """Cost Per Acquisition for each row of the columns."""
+    return ratio_metric_column(cost, cost_valid, conversions, conversions_valid)
+
+# The metric properties live in slot-less mixins so that the mutable dataclasses and their
+# compact variants (see the end of this file) share them.
+
+class AffiliateMetrics:
+    __slots__ = ()
+
+    @property
+    def epc(self) -> Optional[float]:
+        """Earnings Per Click."""
+        return ratio_metric(self.commission_amount, self.clicks)
+
+class AdCampaignMetrics:
+    __slots__ = ()
+
+    @property
+    def ctr(self) -> Optional[float]:
+        """Click-Through Rate."""
+        return ratio_metric(self.clicks, self.impressions, 100)
+
+    @property
+    def cpc(self) -> Optional[float]:
+        """Cost Per Click."""
+        return ratio_metric(self.cost, self.clicks)
+
+    @property
+    def cpa(self) -> Optional[float]:
+        """Cost Per Acquisition/Conversion."""
+        return ratio_metric(self.cost, self.conversions)
+
 @dataclass
-class AffiliatePerformanceData:
+class AffiliatePerformanceData(AffiliateMetrics):
     """Represents performance data for an affiliate for a specific period."""
     report_date: date
     affiliate_name: str
@@ -32,15 +101,8 @@ class AffiliatePerformanceData:
     conversions: Optional[int] = None
     commission_amount: Optional[float] = None
 
-    @property
-    def epc(self) -> Optional[float]:
-        """Earnings Per Click."""
-        if self.clicks and self.clicks > 0 and self.commission_amount is not None:
-            return round(self.commission_amount / self.clicks, 2)
-        return None
-
 @dataclass
-class AdCampaignPerformanceData:
+class AdCampaignPerformanceData(AdCampaignMetrics):
     """Represents performance data for an ad campaign for a specific period."""
     report_date: date
     campaign_name: str
@@ -51,27 +113,6 @@ class AdCampaignPerformanceData:
     conversions: Optional[int] = None
     # Potentially add more fields as needed, like spend, revenue for ROAS etc.
 
-    @property
-    def ctr(self) -> Optional[float]:
-        """Click-Through Rate."""
-        if self.impressions and self.impressions > 0 and self.clicks is not None:
-            return round((self.clicks / self.impressions) * 100, 2)
-        return None
-
-    @property
-    def cpc(self) -> Optional[float]:
-        """Cost Per Click."""
-        if self.clicks and self.clicks > 0 and self.cost is not None:
-            return round(self.cost / self.clicks, 2)
-        return None
-
-    @property
-    def cpa(self) -> Optional[float]:
-        """Cost Per Acquisition/Conversion."""
-        if self.conversions and self.conversions > 0 and self.cost is not None:
-            return round(self.cost / self.conversions, 2)
-        return None
-
     # ROAS (Return on Ad Spend) would require revenue data, which is not included yet.
     # If revenue is added:
     # revenue: Optional[float] = None
@@ -106,6 +147,60 @@ class MailchimpData:
     click_rate: float # percentage
     conversions: Optional[int] = 0
 
+# --- Compact record types ---
+# Frozen, __slots__-based variants of the dataclasses above, with the same fields and
+# metrics. A slotted instance has no per-instance __dict__, which roughly halves its size;
+# together with interned name strings and shared date objects (see the CSV parsers in
+# services.py) this is what the parsers, column stores and mock data now produce.
+# benchmarks/bench_record_memory.py measures the difference. Keep the field lists in sync
+# with the mutable classes.
+
+@dataclass(frozen=True, slots=True)
+class AffiliatePerformanceRecord(AffiliateMetrics):
+    """Immutable, compact AffiliatePerformanceData."""
+    report_date: date
+    affiliate_name: str
+    impressions: Optional[int] = None
+    clicks: Optional[int] = None
+    conversions: Optional[int] = None
+    commission_amount: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class AdCampaignPerformanceRecord(AdCampaignMetrics):
+    """Immutable, compact AdCampaignPerformanceData."""
+    report_date: date
+    campaign_name: str
+    platform: Optional[str] = None
+    impressions: Optional[int] = None
+    clicks: Optional[int] = None
+    cost: Optional[float] = None
+    conversions: Optional[int] = None
+
+@dataclass(frozen=True, slots=True)
+class CloudServiceRecord:
+    """Immutable, compact CloudServiceData."""
+    service_name: str
+    service_type: str
+    provider: str
+    report_date: date
+    cost: float
+    uptime: float
+    usage_metric: str
+    usage_value: float
+    ai_optimization_score: float = 0.0
+
+@dataclass(frozen=True, slots=True)
+class MailchimpRecord:
+    """Immutable, compact MailchimpData."""
+    campaign_id: str
+    campaign_title: str
+    subject_line: str
+    report_date: date
+    emails_sent: int
+    open_rate: float
+    click_rate: float
+    conversions: Optional[int] = 0
+
 # For Phase 1, we'll manage lists of these objects globally or within app context.
 # Example:
 # affiliate_data_store: List[AffiliatePerformanceData] = []
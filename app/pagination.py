@@ -0,0 +1,266 @@
+# Server-side sorting, filtering and pagination over the column stores.
+#
+# The dashboards used to render every stored row into one HTML table. Instead, a
+# TableQuery (sort field, direction, filters) is resolved into an ordering of row ids,
+# which is cached per store version, and only one page of rows is materialized.
+#
+# The JSON API pages with opaque keyset cursors rather than offsets: a cursor records the
+# sort key and row id of the last row served, and the next page starts right after that
+# position in the current ordering. Rows appended between requests therefore don't shift
+# or repeat what the client has already seen.
+
+import base64
+import binascii
+import bisect
+import json
+import math
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields as dataclass_fields
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from .columnar import ColumnStore, DateColumn, NumericColumn
+
+_ORDER_CACHE_ENTRIES = 8
+_order_cache: 'weakref.WeakKeyDictionary[ColumnStore, OrderedDict]' = weakref.WeakKeyDictionary()
+_order_cache_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class TableQuery:
+    """How to order and filter a store's rows. search is a case-insensitive substring match
+    on the store's name field; filters are exact matches on dictionary-encoded fields."""
+    sort: str = 'report_date'
+    descending: bool = False
+    search: str = ''
+    filters: Tuple[Tuple[str, str], ...] = ()
+
+    @classmethod
+    def from_args(cls, store: ColumnStore, args, filter_fields: Tuple[str, ...] = ()) -> 'TableQuery':
+        """Builds a query from request args (sort, order, q and filter_fields). Raises ValueError on bad input."""
+        sort = args.get('sort') or 'report_date'
+        if sort not in store.fields:
+            raise ValueError(f"Cannot sort by '{sort}'. Valid fields: {', '.join(store.fields)}")
+        order = (args.get('order') or 'asc').lower()
+        if order not in ('asc', 'desc'):
+            raise ValueError("order must be 'asc' or 'desc'")
+        filters = tuple((name, args[name]) for name in filter_fields if args.get(name))
+        return cls(sort=sort, descending=order == 'desc', search=(args.get('q') or '').strip(), filters=filters)
+
+    def as_args(self) -> Dict[str, str]:
+        """The query as URL parameters, for building page and sort links."""
+        params = {'sort': self.sort, 'order': 'desc' if self.descending else 'asc'}
+        if self.search:
+            params['q'] = self.search
+        params.update(self.filters)
+        return params
+
+
+@dataclass
+class Page:
+    """One page of a paginated table, as rendered by the dashboards."""
+    rows: List[Any]
+    number: int
+    per_page: int
+    total: int
+    query: TableQuery = field(default_factory=TableQuery)
+
+    @property
+    def pages(self) -> int:
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self) -> bool:
+        return self.number > 1
+
+    @property
+    def has_next(self) -> bool:
+        return self.number < self.pages
+
+
+def _cached(store: ColumnStore, key: Tuple, build):
+    """Per-store LRU of derived structures, keyed on the store version so mutations invalidate them.
+
+    The lock covers the lookup and the insert but not build(), which may itself use the
+    cache; two requests missing at once both build, and the later result is kept.
+    """
+    cache_key = (store.version,) + key
+    with _order_cache_lock:
+        cache = _order_cache.setdefault(store, OrderedDict())
+        value = cache.get(cache_key)
+        if value is not None:
+            cache.move_to_end(cache_key)
+            return value
+    value = build()
+    with _order_cache_lock:
+        cache[cache_key] = value
+        cache.move_to_end(cache_key)
+        while len(cache) > _ORDER_CACHE_ENTRIES:
+            cache.popitem(last=False)
+    return value
+
+
+def _sort_keys(store: ColumnStore, name: str):
+    """Returns (numeric key per row, validity bitmap or None, raw value -> key) for a field."""
+    return _cached(store, ('keys', name), lambda: _build_sort_keys(store, name))
+
+
+def _build_sort_keys(store: ColumnStore, name: str):
+    column = store.column(name)
+    if isinstance(column, DateColumn):
+        return column.values, None, lambda value: date.fromisoformat(value).toordinal()
+    if isinstance(column, NumericColumn):
+        return column.values, column.valid, float
+    # Dictionary-encoded strings sort by the rank of their value among the distinct values.
+    ordered = sorted(column.dictionary)
+    rank = {value: i for i, value in enumerate(ordered)}
+    by_code = [rank[value] for value in column.dictionary]
+    if column.valid is None:
+        keys = [by_code[code] for code in column.codes]
+    else:
+        # Null rows hold code 0, which has no rank while the dictionary is empty; their
+        # key sorts after every value, though _build_order puts them last anyway.
+        null_key = len(ordered)
+        keys = [by_code[code] if ok else null_key for code, ok in zip(column.codes, column.valid.to_list())]
+
+    def key_of(value):
+        # A value no longer present falls between its neighbours.
+        i = bisect.bisect_left(ordered, value)
+        return i if i < len(ordered) and ordered[i] == value else i - 0.5
+    return keys, column.valid, key_of
+
+
+def _matching_rows(store: ColumnStore, query: TableQuery) -> Optional[List[int]]:
+    """Row ids passing the query's search and filters, or None if it has neither."""
+    conditions = []
+    if query.search:
+        column = store.column(store.name_field)
+        needle = query.search.casefold()
+        conditions.append((column, {code for code, value in enumerate(column.dictionary) if needle in value.casefold()}))
+    for name, wanted in query.filters:
+        column = store.column(name)
+        code = column.dictionary.index(wanted) if wanted in column.dictionary else None
+        conditions.append((column, {code} if code is not None else set()))
+    if not conditions:
+        return None
+    rows = range(len(store))
+    for column, allowed in conditions:
+        codes = column.codes
+        if column.valid is not None:
+            valid = column.valid
+            rows = [r for r in rows if codes[r] in allowed and valid[r]]
+        else:
+            rows = [r for r in rows if codes[r] in allowed]
+    return list(rows)
+
+
+def _ordered_rows(store: ColumnStore, query: TableQuery) -> array:
+    """Row ids matching query in display order (nulls last, ties by row id); cached per store version."""
+    return _cached(store, ('order', query), lambda: _build_order(store, query))
+
+
+def _build_order(store: ColumnStore, query: TableQuery) -> array:
+    keys, valid, _ = _sort_keys(store, query.sort)
+    rows = _matching_rows(store, query)
+    if rows is None:
+        rows = list(range(len(store)))
+    nulls: List[int] = []
+    if valid is not None:
+        nulls = [r for r in rows if not valid[r]]
+        if nulls:
+            rows = [r for r in rows if valid[r]]
+    rows.sort(key=keys.__getitem__, reverse=query.descending)
+    order = array('L', rows)
+    order.extend(nulls)
+    return order
+
+
+def paginate(store: ColumnStore, query: TableQuery, page: int, per_page: int) -> Page:
+    """Returns page number `page` (1-based) of the rows matching query."""
+    order = _ordered_rows(store, query)
+    page = max(1, page)
+    start = (page - 1) * per_page
+    return Page(rows=[store.row(r) for r in order[start:start + per_page]],
+                number=page, per_page=per_page, total=len(order), query=query)
+
+
+def _position_key(keys, valid, descending: bool):
+    def key(row: int):
+        if valid is not None and not valid[row]:
+            return (1, 0, row)
+        return (0, -keys[row] if descending else keys[row], row)
+    return key
+
+
+def encode_cursor(query: TableQuery, record: Any, row: int) -> str:
+    value = getattr(record, query.sort)
+    if isinstance(value, date):
+        value = value.isoformat()
+    payload = json.dumps({'q': [query.sort, query.descending, query.search, list(query.filters)],
+                          'v': value, 'r': row}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[TableQuery, Any, int]:
+    """Returns (query, last sort value, last row id). Raises ValueError for malformed cursors."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        sort, descending, search, filters = payload['q']
+        query = TableQuery(sort=sort, descending=bool(descending), search=search,
+                           filters=tuple((name, value) for name, value in filters))
+        return query, payload['v'], int(payload['r'])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def _check_query(store: ColumnStore, query: TableQuery) -> None:
+    if query.sort not in store.fields:
+        raise ValueError(f"Cannot sort by '{query.sort}'")
+    for name, _ in query.filters:
+        if name not in store.fields or not hasattr(store.column(name), 'dictionary'):
+            raise ValueError(f"Cannot filter on '{name}'")
+
+
+def page_after(store: ColumnStore, query: TableQuery, cursor: Optional[str], limit: int) -> Tuple[List[Any], Optional[str], int]:
+    """Keyset pagination: up to limit rows after cursor (or from the start).
+
+    Returns (records, next cursor or None, total matching rows). A cursor carries its own
+    query, which takes precedence over the one passed in.
+    """
+    start = 0
+    if cursor:
+        query, last_value, last_row = decode_cursor(cursor)
+        _check_query(store, query)
+    order = _ordered_rows(store, query)
+    if cursor:
+        keys, valid, key_of = _sort_keys(store, query.sort)
+        if last_value is None:
+            target = (1, 0, last_row)
+        else:
+            try:
+                last_key = key_of(last_value)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {e}")
+            target = (0, -last_key if query.descending else last_key, last_row)
+        start = bisect.bisect_right(order, target, key=_position_key(keys, valid, query.descending))
+    rows = order[start:start + limit]
+    records = [store.row(r) for r in rows]
+    next_cursor = None
+    if start + limit < len(order) and records:
+        next_cursor = encode_cursor(query, records[-1], rows[-1])
+    return records, next_cursor, len(order)
+
+
+def serialize_record(record: Any) -> Dict[str, Any]:
+    """JSON-ready dict of a record's fields plus its derived metrics."""
+    data = {}
+    for f in dataclass_fields(record):
+        value = getattr(record, f.name)
+        data[f.name] = value.isoformat() if isinstance(value, date) else value
+    for metric in ('ctr', 'cpc', 'cpa', 'epc'):
+        if hasattr(record, metric):
+            data[metric] = getattr(record, metric)
+    return data
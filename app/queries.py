@@ -0,0 +1,262 @@
+# Date-range and group-by metrics over the ad campaign store (see /api/ads/metrics).
+#
+# For each requested grouping (e.g. platform, or platform + campaign_name), a GroupIndex
+# hashes every row's dictionary codes into a posting: the row ids of that group sorted by
+# report_date, with the dates and running totals of each metric alongside. A query bisects
+# each posting for the [from, to] window and reads its sums as the difference of two
+# running totals, so its cost depends on the number of groups, not on the number of rows
+# in the window. With no grouping there is a single posting, i.e. a date-sorted index of
+# the whole store.
+#
+# Indexes are built on first use and extended incrementally as rows are appended. An
+# upsert that overwrites rows in place (store.rewrites changes) invalidates the running
+# totals of the groups it touched: the next query re-sorts and re-sums only those
+# postings, from the changes the store logs (ColumnStore.changes_since). If the index fell
+# further behind than the log reaches, it is rebuilt.
+# CTR/CPC/CPA are derived from the summed components of each group, not averaged per row.
+
+import bisect
+import threading
+import weakref
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from itertools import accumulate, islice
+from operator import itemgetter, le
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .columnar import ColumnStore, DictionaryColumn
+from .models import ratio_metric
+
+_AD_METRIC_FIELDS = ('impressions', 'clicks', 'cost', 'conversions')
+
+_indexes: 'weakref.WeakKeyDictionary[Any, Dict[Tuple[str, ...], GroupIndex]]' = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+class _Posting:
+    """Row ids of one group in report_date order, with their date ordinals for bisect and
+    running totals of each metric column, so a window's sums are two lookups."""
+
+    __slots__ = ('dates', 'rows', 'prefix')
+
+    def __init__(self):
+        self.dates = array('i')
+        self.rows = array('L')
+        # prefix[name][i] is the sum of the first i rows' values (one more entry than rows).
+        self.prefix: Dict[str, array] = {}
+
+    def add(self, rows: Sequence[int], date_values: array, metric_values: Dict[str, array]) -> None:
+        """Appends rows (in row order), re-sorting the posting only if they break its date order."""
+        dates = _gather(date_values, rows)
+        in_order = (not self.dates or dates[0] >= self.dates[-1]) and all(map(le, dates, dates[1:]))
+        if in_order:
+            self.dates.extend(dates)
+            self.rows.extend(rows)
+            for name, values in metric_values.items():
+                prefix = self.prefix.setdefault(name, array(values.typecode, [0]))
+                prefix.extend(islice(accumulate(_gather(values, rows), initial=prefix[-1]), 1, None))
+        else:
+            pairs = sorted(zip(list(self.dates) + list(dates), list(self.rows) + list(rows)))
+            self.dates = array('i', [d for d, _ in pairs])
+            self.rows = array('L', [r for _, r in pairs])
+            for name, values in metric_values.items():
+                self.prefix[name] = array(values.typecode, accumulate(_gather(values, self.rows), initial=0))
+
+    def window(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """Slice bounds of the rows dated within [start, end] (ordinals, inclusive)."""
+        lo = 0 if start is None else bisect.bisect_left(self.dates, start)
+        hi = len(self.dates) if end is None else bisect.bisect_right(self.dates, end)
+        return lo, max(lo, hi)
+
+    def window_sum(self, name: str, lo: int, hi: int):
+        prefix = self.prefix[name]
+        return prefix[hi] - prefix[lo]
+
+
+def _gather(values, rows):
+    """values at the given row ids (a list, or a range for consecutive rows), gathered in C."""
+    if isinstance(rows, range):
+        return values[rows.start:rows.stop]
+    if len(rows) == 1:
+        return [values[rows[0]]]
+    return itemgetter(*rows)(values) if rows else ()
+
+
+class GroupIndex:
+    """Postings of a store's rows keyed by the codes of the group_by fields (null platform as None)."""
+
+    def __init__(self, group_by: Tuple[str, ...], metric_fields: Tuple[str, ...]):
+        self.group_by = group_by
+        self.metric_fields = metric_fields
+        self.postings: Dict[Tuple, _Posting] = {}
+        self.length = 0
+        self.rewrites = 0
+        self._lock = threading.Lock()
+
+    def update(self, store: ColumnStore) -> None:
+        """Re-sums the groups of rows rewritten and indexes rows appended since the last update."""
+        with self._lock:
+            if store.rewrites != self.rewrites:
+                rewrites, changes = store.changes_since(self.rewrites)
+                if changes is None:
+                    self.postings = {}
+                    self.length = 0
+                else:
+                    self._rewrite(store, changes)
+                self.rewrites = rewrites
+            end = len(store)
+            start = self.length
+            if start >= end:
+                return
+            key_columns = []
+            for name in self.group_by:
+                column = store.column(name)
+                codes = column.codes[start:end]
+                if column.valid is not None:
+                    codes = [code if ok else None for code, ok in zip(codes, column.valid.to_list(start, end))]
+                key_columns.append(codes)
+
+            new_rows: Dict[Tuple, List[int]] = defaultdict(list)
+            if key_columns:
+                for row, key in zip(range(start, end), zip(*key_columns)):
+                    new_rows[key].append(row)
+            else:
+                new_rows[()] = range(start, end)
+
+            date_values = store.column('report_date').values
+            metric_values = {name: store.column(name).values for name in self.metric_fields}
+            for key, rows in new_rows.items():
+                posting = self.postings.get(key)
+                if posting is None:
+                    posting = self.postings[key] = _Posting()
+                posting.add(rows, date_values, metric_values)
+            self.length = end
+
+    def _rewrite(self, store: ColumnStore, changes: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Rebuilds the postings of the groups that rows overwritten in place left or joined.
+        Rows not indexed yet are left to the append pass, which reads their current values."""
+        columns = [store.column(name) for name in self.group_by]
+        moved_in: Dict[Tuple, List[int]] = defaultdict(list)
+        moved_out: Dict[Tuple, set] = defaultdict(set)
+        touched = set()
+        seen = set()
+        for row, previous in changes:
+            # A row's earliest logged change holds the values the index last saw.
+            if row >= self.length or row in seen:
+                continue
+            seen.add(row)
+            key = tuple(None if column.valid is not None and not column.valid[row] else column.codes[row]
+                        for column in columns)
+            old = tuple((None if previous[name] is None else column.encode(previous[name]))
+                        if name in previous else code
+                        for name, column, code in zip(self.group_by, columns, key))
+            touched.add(old)
+            if old != key:
+                moved_out[old].add(row)
+                moved_in[key].append(row)
+                touched.add(key)
+
+        date_values = store.column('report_date').values
+        metric_values = {name: store.column(name).values for name in self.metric_fields}
+        for key in touched:
+            posting = self.postings.pop(key, None)
+            leaving = moved_out.get(key, ())
+            rows = [row for row in posting.rows if row not in leaving] if posting is not None else []
+            rows.extend(moved_in.get(key, ()))
+            if rows:
+                posting = self.postings[key] = _Posting()
+                posting.add(rows, date_values, metric_values)
+
+    def window_sums(self, start: Optional[int], end: Optional[int]) -> List[Tuple[Tuple, int, Dict[str, Any]]]:
+        """(key, rows, metric sums) of each group with rows dated within [start, end]. Runs
+        under the index lock, so a concurrent update() cannot change postings mid-read."""
+        sums = []
+        with self._lock:
+            for key, posting in self.postings.items():
+                lo, hi = posting.window(start, end)
+                if lo != hi:
+                    sums.append((key, hi - lo, {name: posting.window_sum(name, lo, hi) for name in self.metric_fields}))
+        return sums
+
+
+def group_index(store: ColumnStore, group_by: Tuple[str, ...], metric_fields: Tuple[str, ...]) -> GroupIndex:
+    """The store's up-to-date index for group_by, built on first use."""
+    with _indexes_lock:
+        by_grouping = _indexes.setdefault(store, {})
+        index = by_grouping.get(group_by)
+        if index is None:
+            index = by_grouping[group_by] = GroupIndex(group_by, metric_fields)
+    index.update(store)
+    return index
+
+
+@dataclass(frozen=True)
+class MetricsQuery:
+    """An inclusive report_date window (either end may be open) and the fields to group by."""
+    start: Optional[date] = None
+    end: Optional[date] = None
+    group_by: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_args(cls, store: ColumnStore, args) -> 'MetricsQuery':
+        """Builds a query from request args (from, to, group_by). Raises ValueError on bad input."""
+        bounds = []
+        for name in ('from', 'to'):
+            value = args.get(name)
+            try:
+                bounds.append(date.fromisoformat(value) if value else None)
+            except ValueError:
+                raise ValueError(f"'{name}' must be a date in YYYY-MM-DD format, got '{value}'")
+        start, end = bounds
+        if start and end and start > end:
+            raise ValueError("'from' must not be after 'to'")
+        groupable = [name for name in store.fields if isinstance(store.column(name), DictionaryColumn)]
+        group_by = tuple(name.strip() for name in (args.get('group_by') or '').split(',') if name.strip())
+        for name in group_by:
+            if name not in groupable:
+                raise ValueError(f"Cannot group by '{name}'. Valid fields: {', '.join(groupable)}")
+        if len(set(group_by)) != len(group_by):
+            raise ValueError("group_by fields must not repeat")
+        return cls(start=start, end=end, group_by=group_by)
+
+
+def _ad_metrics(totals: Dict[str, Any]) -> Dict[str, Any]:
+    # Money sums come from differences of running totals; drop the float noise.
+    totals['cost'] = round(totals['cost'], 2)
+    totals['ctr'] = ratio_metric(totals['clicks'], totals['impressions'], 100)
+    totals['cpc'] = ratio_metric(totals['cost'], totals['clicks'])
+    totals['cpa'] = ratio_metric(totals['cost'], totals['conversions'])
+    return totals
+
+
+def ad_campaign_metrics(store: ColumnStore, query: MetricsQuery) -> Dict[str, Any]:
+    """Summed impressions, clicks, cost and conversions, with CTR/CPC/CPA derived from
+    the sums, for the rows in query's window: overall and per group."""
+    index = group_index(store, query.group_by, _AD_METRIC_FIELDS)
+    start = query.start.toordinal() if query.start else None
+    end = query.end.toordinal() if query.end else None
+    dictionaries = [store.column(name).dictionary for name in query.group_by]
+
+    groups = []
+    for key, rows, sums in index.window_sums(start, end):
+        entry = {name: (None if code is None else dictionary[code])
+                 for name, dictionary, code in zip(query.group_by, dictionaries, key)}
+        entry['rows'] = rows
+        entry.update(sums)
+        groups.append(entry)
+
+    totals = {'rows': sum(g['rows'] for g in groups)}
+    for name in _AD_METRIC_FIELDS:
+        totals[name] = sum(g[name] for g in groups)
+    for entry in groups:
+        _ad_metrics(entry)
+    groups.sort(key=lambda g: tuple((g[name] is None, g[name] or '') for name in query.group_by))
+    return {
+        'from': query.start.isoformat() if query.start else None,
+        'to': query.end.isoformat() if query.end else None,
+        'group_by': list(query.group_by),
+        'totals': _ad_metrics(totals),
+        'groups': groups if query.group_by else [],
+    }
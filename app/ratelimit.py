@@ -0,0 +1,76 @@
+# Token-bucket rate limiting for outbound provider calls.
+#
+# A bucket refills at `rate` tokens per second up to `capacity` (the allowed burst).
+# acquire() takes a token, sleeping until one is available, so callers from any number of
+# threads are paced to the provider's quota instead of hitting it and being throttled.
+
+import threading
+import time
+from typing import Optional
+
+
+class RateLimitTimeout(RuntimeError):
+    """No token became available within the caller's timeout."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket. rate is in tokens per second; rate <= 0 disables limiting."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: float) -> 'TokenBucket':
+        return cls(requests_per_minute / 60.0, burst)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> None:
+        """Takes tokens, waiting as needed; raises RateLimitTimeout if that would exceed timeout.
+
+        Waiters reserve their tokens up front (the balance goes negative), so they are served
+        in arrival order and a burst of callers is spread out at exactly `rate`.
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = (tokens - self._tokens) / self.rate if self._tokens < tokens else 0.0
+            if timeout is not None and wait > timeout:
+                raise RateLimitTimeout(f"Rate limit: next slot in {wait:.1f}s exceeds the {timeout:.1f}s wait limit")
+            self._tokens -= tokens
+            if wait:
+                self.waits += 1
+                self.waited_seconds += wait
+        if wait:
+            time.sleep(wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate_per_minute': round(self.rate * 60, 2),
+                'burst': self.capacity,
+                'tokens': round(self._tokens, 2),
+                'waits': self.waits,
+                'waited_seconds': round(self.waited_seconds, 2),
+            }
@@ -0,0 +1,132 @@
+# Aggregates for the affiliate dashboard, maintained as rows are ingested.
+#
+# /affiliate-marketing used to re-sum clicks, conversions and commission over every
+# stored record and sort the whole list to pick the top 5 on each page view. The rollup
+# below is updated by AffiliateColumnStore whenever rows are appended or overwritten by an
+# upsert, so the page only reads a handful of counters and the K rows held in a min-heap.
+
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AffiliateTotals:
+    """Summed metrics over a set of affiliate rows. Null values count as 0 in the sums."""
+
+    __slots__ = ('rows', 'impressions', 'clicks', 'conversions', 'commission_amount')
+
+    def __init__(self):
+        self.rows = 0
+        self.impressions = 0
+        self.clicks = 0
+        self.conversions = 0
+        self.commission_amount = 0.0
+
+    @property
+    def epc(self) -> Optional[float]:
+        """Earnings Per Click over the summed values."""
+        if self.clicks > 0:
+            return round(self.commission_amount / self.clicks, 2)
+        return None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__} | {'epc': self.epc}
+
+
+class AffiliateRollup:
+    """Global totals, per-affiliate totals and the top-K rows by commission_amount."""
+
+    def __init__(self, top_k: int = 5):
+        self.top_k = top_k
+        self.totals = AffiliateTotals()
+        # Whether any row had a value for the field at all; the dashboard shows N/A otherwise.
+        self.present = {'impressions': False, 'clicks': False, 'conversions': False, 'commission_amount': False}
+        self._by_affiliate: Dict[int, AffiliateTotals] = {}
+        # Min-heap of (commission, -row). Ties keep the earlier row, as a stable sort would.
+        self._top: List[Tuple[float, int]] = []
+        self._top_stale = False
+
+    def add_rows(self, columns: Dict[str, Any], start: int, end: int) -> None:
+        """Folds rows [start, end) of an AffiliateColumnStore's columns into the aggregates."""
+        if start >= end:
+            return
+        codes = columns['affiliate_name'].codes[start:end]
+        impressions = columns['impressions'].values[start:end]
+        clicks = columns['clicks'].values[start:end]
+        conversions = columns['conversions'].values[start:end]
+        commission = columns['commission_amount'].values[start:end]
+
+        # Null values are stored as 0 in the value arrays, so plain sums skip them.
+        totals = self.totals
+        totals.rows += end - start
+        totals.impressions += sum(impressions)
+        totals.clicks += sum(clicks)
+        totals.conversions += sum(conversions)
+        totals.commission_amount += sum(commission)
+        for name, seen in self.present.items():
+            if not seen:
+                valid = columns[name].valid
+                self.present[name] = any(valid[i] for i in range(start, end))
+
+        by_affiliate = self._by_affiliate
+        for code, imp, clk, conv, comm in zip(codes, impressions, clicks, conversions, commission):
+            entry = by_affiliate.get(code)
+            if entry is None:
+                entry = by_affiliate[code] = AffiliateTotals()
+            entry.rows += 1
+            entry.impressions += imp
+            entry.clicks += clk
+            entry.conversions += conv
+            entry.commission_amount += comm
+
+        top, k = self._top, self.top_k
+        for offset, comm in enumerate(commission):
+            item = (comm, -(start + offset))
+            if len(top) < k:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+    def update_rows(self, columns: Dict[str, Any], changes: List[Tuple[int, Dict[str, Any]]]) -> None:
+        """Applies rows overwritten in place, given each row's previous values, as deltas."""
+        codes = columns['affiliate_name'].codes
+        totals, by_affiliate = self.totals, self._by_affiliate
+        top = self._top
+        for row, previous in changes:
+            entry = by_affiliate[codes[row]]
+            for name in self.present:
+                new = columns[name].get(row)
+                delta = (new or 0) - (previous[name] or 0)
+                setattr(totals, name, getattr(totals, name) + delta)
+                setattr(entry, name, getattr(entry, name) + delta)
+                if new is not None:
+                    self.present[name] = True
+            if self._top_stale:
+                continue
+            old_item = (previous['commission_amount'] or 0, -row)
+            item = (columns['commission_amount'].values[row], -row)
+            if old_item in top:
+                if item < old_item:
+                    # A row outside the heap may now outrank it; recompute on next read.
+                    self._top_stale = True
+                else:
+                    top[top.index(old_item)] = item
+                    heapq.heapify(top)
+            elif len(top) < self.top_k:
+                heapq.heappush(top, item)
+            elif item > top[0]:
+                heapq.heapreplace(top, item)
+
+    def top_rows(self, columns: Optional[Dict[str, Any]] = None) -> List[int]:
+        """Row indices of the top-K rows, highest commission first. columns (the store's) are
+        needed to recompute the heap after a top row's commission was lowered."""
+        if self._top_stale and columns is not None:
+            commission = columns['commission_amount'].values
+            self._top = [(commission[row], -row) for row in range(len(commission))]
+            self._top = heapq.nlargest(self.top_k, self._top)
+            heapq.heapify(self._top)
+            self._top_stale = False
+        return [-neg_row for _, neg_row in sorted(self._top, reverse=True)]
+
+    def by_affiliate(self, dictionary: List[str]) -> Dict[str, AffiliateTotals]:
+        """Per-affiliate totals keyed by name (dictionary is the affiliate_name column's)."""
+        return {dictionary[code]: totals for code, totals in self._by_affiliate.items()}
@@ -1,5 +1,7 @@
-import io
-from flask import Blueprint, render_template, session, current_app, flash, redirect, url_for, request, jsonify
+import json
+import time
+from flask import (Blueprint, render_template, session, current_app, flash, redirect, url_for, request, jsonify,
+                   Response, stream_with_context)
 
 # Facebook SDK imports
 from facebook_business.api import FacebookAdsApi
@@ -11,16 +13,21 @@ import uuid
 
 # Local (app-specific) imports
 from .services import (
-    parse_affiliate_csv, parse_ad_campaign_csv,
+    ingest_affiliate_csv_stream, ingest_ad_campaign_csv_stream,
     initialize_fb_api, get_fan_ad_placements_mock, get_fan_performance_data_mock,
     get_google_ads_client, list_accessible_google_ads_customers, # Added Google Ads services
-    get_mock_cloud_service_data, get_ai_cloud_recommendations, # Added Cloud Optimization services
-    generate_content_with_gemini,
-    get_mailchimp_campaigns_mock, generate_business_chimp_content, # Business Chimp services
+    get_ai_cloud_recommendations, # Added Cloud Optimization services
+    generate_content_with_gemini, stream_content_with_gemini,
+    generate_business_chimp_content, # Business Chimp services
     generate_website_service, generate_game_service, generate_app_service, generate_backend_service,
+    SOFTWARE_ENGINEER_PROMPTS, stream_software_engineer_service, parse_website_response,
     debug_code_service, generate_social_media_post_service, optimize_ads_service, analyze_website_service,
     run_gumloop_flow, trigger_n8n_webhook, run_lamatic_flow
 )
+from .pagination import TableQuery, paginate, page_after, serialize_record
+from .queries import MetricsQuery, ad_campaign_metrics
+from .ai_batch import run_ai_batch
+from .sections import SectionExtractor
 # Note: GoogleAdsException is handled in services.py, not directly in routes typically
 
 main_bp = Blueprint('main', __name__)
@@ -31,17 +38,77 @@ def index():
     # When deployed, the React frontend is served from the static folder
     return current_app.send_static_file('index.html')
 
+def _table_page(store, filter_fields=()):
+    """Resolves the sort/filter/page request args for a dashboard's raw data table into a Page."""
+    try:
+        query = TableQuery.from_args(store, request.args, filter_fields)
+    except ValueError as e:
+        flash(str(e), 'warning')
+        query = TableQuery()
+    per_page = request.args.get('per_page', current_app.config['TABLE_PAGE_SIZE'], type=int)
+    per_page = min(max(1, per_page), current_app.config['TABLE_MAX_PAGE_SIZE'])
+    return paginate(store, query, request.args.get('page', 1, type=int), per_page)
+
 @main_bp.route('/affiliate-marketing')
 def affiliate_marketing():
     """Serves the affiliate marketing placeholder page."""
-    return render_template('affiliate_marketing.html', affiliate_data=current_app.affiliate_data_store)
+    store = current_app.affiliate_data_store
+    return render_template(
+        'affiliate_marketing.html',
+        affiliate_data=store,
+        summary=store.rollup.totals if store else None,
+        present=store.rollup.present if store else None,
+        top_affiliates=store.top_records() if store else [],
+        page=_table_page(store)
+    )
+
+# Datasets exposed by the JSON table API: store attribute and fields allowed as exact-match filters.
+_TABLE_DATASETS = {
+    'affiliate': ('affiliate_data_store', ()),
+    'ad-campaigns': ('ad_campaign_data_store', ('platform',)),
+}
+
+@main_bp.route('/api/data/<dataset>')
+def table_data_api(dataset):
+    """Cursor-paginated JSON rows of a stored dataset, for loading large tables lazily.
+
+    Query args: limit, cursor (from the previous response's next_cursor), sort, order, q
+    and, for ad campaigns, platform.
+    """
+    if dataset not in _TABLE_DATASETS:
+        return {"error": f"Unknown dataset '{dataset}'. Valid datasets: {', '.join(_TABLE_DATASETS)}"}, 404
+    store_attr, filter_fields = _TABLE_DATASETS[dataset]
+    store = getattr(current_app, store_attr)
+    limit = request.args.get('limit', current_app.config['TABLE_PAGE_SIZE'], type=int)
+    limit = min(max(1, limit), current_app.config['TABLE_MAX_PAGE_SIZE'])
+    try:
+        query = TableQuery.from_args(store, request.args, filter_fields)
+        records, next_cursor, total = page_after(store, query, request.args.get('cursor'), limit)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return jsonify({
+        "data": [serialize_record(record) for record in records],
+        "next_cursor": next_cursor,
+        "total": total,
+    }), 200
+
+@main_bp.route('/api/ads/metrics')
+def ad_metrics_api():
+    """Ad campaign totals over a report_date window, optionally grouped.
+
+    Query args: from, to (inclusive YYYY-MM-DD, either may be omitted) and group_by, a
+    comma-separated list of platform and/or campaign_name.
+    """
+    store = current_app.ad_campaign_data_store
+    try:
+        query = MetricsQuery.from_args(store, request.args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return jsonify(ad_campaign_metrics(store, query)), 200
 
 @main_bp.route('/business-chimp', methods=['GET', 'POST'])
 def business_chimp():
     """Serves the Business Chimp (Mailchimp + Content Gen) page."""
-    if not current_app.mailchimp_data_store:
-        current_app.mailchimp_data_store = get_mailchimp_campaigns_mock()
-
     generated_content = None
     if request.method == 'POST':
         action = request.form.get('action')
@@ -63,9 +130,6 @@ def business_chimp():
 @main_bp.route('/cloud-optimization')
 def cloud_optimization():
     """Serves the cloud optimization page."""
-    if not current_app.cloud_service_data_store:
-        current_app.cloud_service_data_store = get_mock_cloud_service_data()
-
     recommendations = get_ai_cloud_recommendations(current_app.cloud_service_data_store)
 
     return render_template(
@@ -146,9 +210,14 @@ def ads_optimization():
             else:
                 flash('Please connect to Google Ads first.', 'warning')
 
+    ad_store = current_app.ad_campaign_data_store
+    ad_summary = {name: ad_store.column_sum(name) for name in ('impressions', 'clicks', 'cost', 'conversions')} if ad_store else None
     return render_template(
         'ads_optimization.html',
-        ad_campaign_data=current_app.ad_campaign_data_store,
+        ad_campaign_data=ad_store,
+        ad_summary=ad_summary,
+        top_campaigns=ad_store.top_rows('conversions', 5) if ad_store else [],
+        page=_table_page(ad_store, ('platform',)),
         fb_connected=fb_connected,
         fan_placements=fan_placements,
         fan_performance_data=fan_performance_data,
@@ -167,14 +236,12 @@ def upload_affiliate_csv_route():
         if file.filename == '': flash('No selected file', 'danger'); return redirect(request.url)
         if file and file.filename.endswith('.csv'):
             try:
-                csv_content = file.stream.read().decode('utf-8'); file_stream = io.StringIO(csv_content)
-                new_data, errors = parse_affiliate_csv(file_stream)
-                if errors:
-                    for error in errors: flash(f'Error processing CSV: {error}', 'danger')
-                if new_data:
-                    current_app.affiliate_data_store.extend(new_data)
-                    flash(f'Successfully uploaded and processed {len(new_data)} affiliate records.', 'success')
-                elif not errors: flash('CSV processed, but no new valid data found.', 'warning')
+                if current_app.config['CSV_INGEST_BACKGROUND']:
+                    return _submit_ingest_job('affiliate', file, 'main.affiliate_marketing')
+                progress, errors = ingest_affiliate_csv_stream(file.stream, current_app.affiliate_data_store,
+                                                               on_progress=_log_ingest_progress('affiliate'))
+                _flash_ingest_errors(progress, errors)
+                _flash_ingest_summary(progress, errors, 'affiliate')
                 return redirect(url_for('main.affiliate_marketing'))
             except Exception as e: current_app.logger.error(f"Err affiliate CSV: {e}"); flash(f'Err: {e}', 'danger'); return redirect(request.url)
         else: flash('Invalid file type. CSV only.', 'danger'); return redirect(request.url)
@@ -188,19 +255,64 @@ def upload_ad_csv_route():
         if file.filename == '': flash('No selected file', 'danger'); return redirect(request.url)
         if file and file.filename.endswith('.csv'):
             try:
-                csv_content = file.stream.read().decode('utf-8'); file_stream = io.StringIO(csv_content)
-                new_data, errors = parse_ad_campaign_csv(file_stream)
-                if errors:
-                    for error in errors: flash(f'Error processing CSV: {error}', 'danger')
-                if new_data:
-                    current_app.ad_campaign_data_store.extend(new_data)
-                    flash(f'Successfully processed {len(new_data)} ad campaign records.', 'success')
-                elif not errors: flash('CSV processed, but no new valid data found.', 'warning')
+                if current_app.config['CSV_INGEST_BACKGROUND']:
+                    return _submit_ingest_job('ad_campaign', file, 'main.ads_optimization')
+                progress, errors = ingest_ad_campaign_csv_stream(file.stream, current_app.ad_campaign_data_store,
+                                                                 on_progress=_log_ingest_progress('ad campaign'))
+                _flash_ingest_errors(progress, errors)
+                _flash_ingest_summary(progress, errors, 'ad campaign')
                 return redirect(url_for('main.ads_optimization'))
             except Exception as e: current_app.logger.error(f"Err ad CSV: {e}"); flash(f'Err: {e}', 'danger'); return redirect(request.url)
         else: flash('Invalid file type. CSV only.', 'danger'); return redirect(request.url)
     return render_template('upload_ad_data.html')
 
+def _submit_ingest_job(kind, file, dashboard_endpoint):
+    """Spools an upload and queues it as a background ingestion job. JSON clients get 202 with
+    the job; browsers are redirected to the dashboard with the job id flashed."""
+    jobs = current_app.ingest_jobs
+    job = jobs.submit(kind, jobs.spool(file), file.filename)
+    status_url = url_for('main.ingest_job_status', job_id=job.id)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.as_dict()), 202, {'Location': status_url}
+    flash(f'Upload received and queued for processing as job {job.id}. Track it at {status_url}.', 'info')
+    return redirect(url_for(dashboard_endpoint))
+
+@main_bp.route('/api/jobs/<job_id>')
+def ingest_job_status(job_id):
+    """Status of a background CSV ingestion job: rows processed, errors and rows/sec."""
+    job = current_app.ingest_jobs.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'"}, 404
+    return jsonify(job.as_dict()), 200
+
+@main_bp.route('/api/jobs')
+def ingest_jobs_list():
+    """Recent background CSV ingestion jobs, newest first."""
+    return jsonify({"jobs": [job.as_dict() for job in current_app.ingest_jobs.recent()]}), 200
+
+def _log_ingest_progress(label):
+    """Returns a progress callback that logs each committed batch of a streaming CSV upload."""
+    def log(progress):
+        current_app.logger.info(
+            f"Ingesting {label} CSV: {progress.rows_processed} rows read ({progress.bytes_read} bytes), "
+            f"{progress.records_added} inserted, {progress.records_updated} updated, {progress.records_skipped} unchanged "
+            f"in {progress.batches} batches, {progress.error_count} errors."
+        )
+    return log
+
+def _flash_ingest_errors(progress, errors):
+    for error in errors: flash(f'Error processing CSV: {error}', 'danger')
+    if progress.error_count > len(errors):
+        flash(f'... and {progress.error_count - len(errors)} more errors not shown.', 'danger')
+
+def _flash_ingest_summary(progress, errors, label):
+    if progress.records_added or progress.records_updated:
+        flash(f'Successfully processed {label} CSV: {progress.records_added} new records, '
+              f'{progress.records_updated} updated, {progress.records_skipped} skipped as duplicates.', 'success')
+    elif progress.records_skipped:
+        flash(f'CSV processed: all {progress.records_skipped} valid rows duplicate existing {label} records.', 'info')
+    elif not errors: flash('CSV processed, but no new valid data found.', 'warning')
+
 # ... (Facebook OAuth routes - connect_facebook_fan, fb_oauth_callback - remain unchanged)
 @main_bp.route('/connect-facebook-fan')
 def connect_facebook_fan():
@@ -286,6 +398,8 @@ def generate_script_proxy():
 
     prompt = data['prompt']
     image_data = data.get('image') # Optional base64 image
+    if _wants_stream(data):
+        return _sse_response(stream_content_with_gemini(prompt, image_data))
     try:
         content = generate_content_with_gemini(prompt, image_data)
         return {"response": content}, 200
@@ -293,6 +407,61 @@ def generate_script_proxy():
         current_app.logger.error(f"Error in generate_script_proxy: {e}")
         return {"error": str(e)}, 500
 
+def _wants_stream(data):
+    """Streaming is requested with ?stream=1, "stream": true in the JSON body, or Accept: text/event-stream."""
+    if request.args.get('stream') in ('1', 'true') or data.get('stream') is True:
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream'
+
+def _sse_event(payload, event=None):
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(payload)}\n\n"
+
+def _sse_response(chunks, finish=None, sections=None):
+    """Streams text chunks as Server-Sent Events: a data event {"text": ...} per chunk, then a
+    'done' event (with finish(full_text) merged in) or an 'error' event. With a
+    SectionExtractor, a 'section' event {"name", "content"} is sent as soon as each section
+    closes. If the client disconnects, the server closes this generator, which closes
+    chunks and so stops the model stream."""
+    def events():
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield _sse_event({"text": chunk})
+                if sections is not None:
+                    for name, content in sections.feed(chunk):
+                        yield _sse_event({"name": name, "content": content}, 'section')
+            done = {"chunks": len(parts)}
+            if finish is not None:
+                done.update(finish(''.join(parts)))
+            yield _sse_event(done, 'done')
+        except Exception as e:
+            current_app.logger.error(f"Error while streaming AI response: {e}")
+            yield _sse_event({"error": str(e)}, 'error')
+        finally:
+            chunks.close()
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main_bp.route('/api/ai/stats')
+def ai_stats_api():
+    """Counters of the AI caches, coalescing, rate limiter, call gate and image pipeline, plus the AI call metrics."""
+    return jsonify({"cache": current_app.ai_cache.stats(), "metrics": current_app.ai_metrics.snapshot(),
+                    "coalescing": current_app.ai_inflight.stats(), "rate_limit": current_app.ai_rate_limiter.stats(),
+                    "images": current_app.ai_images.stats(), "similar": current_app.ai_similar.stats(),
+                    "gate": current_app.ai_gate.stats()}), 200
+
+@main_bp.route('/api/http/stats')
+def http_stats_api():
+    """Utilization of the shared outbound HTTP connection pool, and the analyzer's link status cache."""
+    return jsonify({**current_app.http_pool.stats(), "link_cache": current_app.link_cache.stats()}), 200
+
+@main_bp.route('/api/ai/calls')
+def ai_calls_api():
+    """The most recent model calls with their origin, priority, sizes, latency and outcome."""
+    return jsonify({"calls": current_app.ai_metrics.recent_calls()}), 200
+
 @main_bp.route('/ai-services')
 def ai_services_dashboard():
     """Serves the AI Services dashboard."""
@@ -304,6 +473,13 @@ def software_engineer_route():
     action = data.get('action')
     prompt = data.get('prompt')
     if not prompt: return {"error": "Prompt is required"}, 400
+    if _wants_stream(data):
+        if action not in SOFTWARE_ENGINEER_PROMPTS: return {"error": "Invalid action"}, 400
+        if action == 'website':
+            sections = SectionExtractor()
+            return _sse_response(stream_software_engineer_service(action, prompt), sections=sections,
+                                 finish=lambda text: parse_website_response(text, sections))
+        return _sse_response(stream_software_engineer_service(action, prompt))
 
     try:
         if action == 'website': result = generate_website_service(prompt)
@@ -338,13 +514,39 @@ def marketer_route():
         return jsonify(result), 200
     except Exception as e: return {"error": str(e)}, 500
 
+@main_bp.route('/ai-services/batch', methods=['POST'])
+def batch_route():
+    """Runs {"tasks": [{"type": ..., ...}, ...]} concurrently; results come back in task order."""
+    data = request.get_json(silent=True) or {}
+    tasks = data.get('tasks')
+    if not isinstance(tasks, list) or not tasks:
+        return {"error": "'tasks' must be a non-empty list"}, 400
+    max_tasks = current_app.config['AI_BATCH_MAX_TASKS']
+    if len(tasks) > max_tasks:
+        return {"error": f"At most {max_tasks} tasks per batch"}, 400
+    started = time.perf_counter()
+    results = run_ai_batch(current_app._get_current_object(), tasks, current_app.config['AI_BATCH_CONCURRENCY'])
+    return jsonify({
+        "results": results,
+        "errors": sum(1 for r in results if "error" in r),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000),
+    }), 200
+
 @main_bp.route('/ai-services/system-analyzer', methods=['POST'])
 async def system_analyzer_route():
     data = request.get_json()
     url = data.get('url')
     if not url: return {"error": "URL is required"}, 400
+    limits = {}
+    for name in ('max_depth', 'max_pages'):
+        value = data.get(name)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+            return {"error": f"'{name}' must be a non-negative integer"}, 400
+        limits[name] = int(value)
     try:
-        result = await analyze_website_service(url)
+        result = await analyze_website_service(url, crawl=bool(data.get('crawl')), **limits)
         return jsonify(result), 200
     except Exception as e: return {"error": str(e)}, 500
 
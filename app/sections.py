@@ -0,0 +1,96 @@
+# Incremental extraction of the [HTML]/[CSS] sections of generated website code.
+#
+# parse_website_response used to wait for the whole response and then run up to four
+# re.search(..., DOTALL) passes over it: tagged [HTML]...[/HTML] and [CSS]...[/CSS]
+# sections, falling back to ```html / ```css fenced blocks. SectionExtractor is fed the
+# model output chunk by chunk and keeps one forward scanner per kind of section, each
+# finding the first opener and then the first closer after it, exactly as its regex did.
+# The scanners run independently, so a tagged section inside a fenced block is still
+# found. Each section is reported as soon as its closing marker arrives, so a streamed
+# response can deliver the HTML while the CSS is still being generated.
+#
+# Only a few characters are carried between chunks, so that a marker split across two
+# chunks is still found; text is never rescanned. As before, a tagged section takes
+# precedence over a fenced one, and the first complete section of each kind wins.
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+# (name, style) -> (opening marker, closing marker); markers match case-insensitively.
+_MARKERS = {
+    ('html', 'tag'): ('[HTML]', '[/HTML]'),
+    ('css', 'tag'): ('[CSS]', '[/CSS]'),
+    ('html', 'fence'): ('```html\n', '```'),
+    ('css', 'fence'): ('```css\n', '```'),
+}
+
+
+class _SectionScanner:
+    """Finds the first opener ... closer section of one kind in text fed chunk by chunk."""
+
+    def __init__(self, opener: str, closer: str):
+        self._open = re.compile(re.escape(opener), re.IGNORECASE)
+        self._close = re.compile(re.escape(closer), re.IGNORECASE)
+        self._open_tail = len(opener) - 1
+        self._close_tail = len(closer) - 1
+        self._inside = False
+        self._parts: List[str] = []
+        self._length = 0
+        self._tail = ''
+        self.content: Optional[str] = None
+
+    def feed(self, chunk: str) -> bool:
+        """Consumes the next chunk; True when it closed the section (see content)."""
+        if not self._inside:
+            window = self._tail + chunk
+            match = self._open.search(window)
+            if match is None:
+                self._tail = window[-self._open_tail:]
+                return False
+            self._inside, self._tail = True, ''
+            chunk = window[match.end():]
+        window = self._tail + chunk
+        match = self._close.search(window)
+        if match is None:
+            self._parts.append(chunk)
+            self._length += len(chunk)
+            self._tail = window[-self._close_tail:]
+            return False
+        # The match may start inside the carried tail, i.e. within text already in _parts.
+        content = ''.join(self._parts) + chunk
+        self.content = content[:self._length + match.start() - len(self._tail)].strip()
+        self._parts, self._tail = [], ''
+        return True
+
+
+class SectionExtractor:
+    """Chunk-at-a-time finder of html/css sections in model output."""
+
+    def __init__(self):
+        self._scanners = {key: _SectionScanner(*markers) for key, markers in _MARKERS.items()}
+        self._found: Dict[Tuple[str, str], str] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """Consumes the next chunk; returns the (name, content) sections it completed."""
+        completed = []
+        for key, scanner in list(self._scanners.items()):
+            if not scanner.feed(chunk):
+                continue
+            del self._scanners[key]
+            name = key[0]
+            before = self.get(name)
+            self._found[key] = scanner.content
+            if self.get(name) != before:
+                completed.append((name, scanner.content))
+        return completed
+
+    def get(self, name: str) -> str:
+        """The section's content (tagged preferred over fenced), or '' if none has closed."""
+        return self._found.get((name, 'tag')) or self._found.get((name, 'fence')) or ''
+
+
+def extract_sections(text: str) -> SectionExtractor:
+    """Runs a SectionExtractor over a complete response."""
+    extractor = SectionExtractor()
+    extractor.feed(text)
+    return extractor
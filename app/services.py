@@ -1,22 +1,25 @@
 import io
 import csv
-from datetime import datetime
-from typing import List, Dict, Any, Tuple, Optional
+import codecs
+import sys
+from dataclasses import dataclass
+from functools import partial
+from datetime import date, datetime
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Callable, BinaryIO
 from flask import current_app, session # Added session for Facebook token access
 import random # For mock data for Facebook
-import google.generativeai as genai
-import base64
 import io
-import httpx
-import asyncio
 import time
-import re
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-from PIL import Image
 
 # App-specific models
-from .models import AffiliatePerformanceData, AdCampaignPerformanceData, CloudServiceData, MailchimpData
+from .models import AffiliatePerformanceRecord, AdCampaignPerformanceRecord, CloudServiceRecord, MailchimpRecord
+from .columnar import AffiliateColumnStore, AdCampaignColumnStore
+from .ai_cache import cache_key
+from .ai_models import DEFAULT_MODEL_ALIAS
+from .ai_scheduler import BACKGROUND, call_priority, current_call
+from .link_scheduler import HostScheduler
+from .site_audit import LinkChecker, SiteCrawl, normalize_url, stream_links
+from .sections import SectionExtractor, extract_sections
 
 # Facebook Business SDK imports
 from facebook_business.api import FacebookAdsApi
@@ -34,96 +37,425 @@ from mailchimp_marketing.api_client import ApiClientError
 
 # --- CSV Parsing Functions ---
 
-def parse_affiliate_csv(file_stream: io.StringIO) -> Tuple[List[AffiliatePerformanceData], List[str]]:
-    # ... (content as before) ...
-    data_records: List[AffiliatePerformanceData] = []
-    errors: List[str] = []
-    reader = csv.DictReader(file_stream)
-    required_headers = ['report_date', 'affiliate_name']
-    optional_headers = ['impressions', 'clicks', 'conversions', 'commission_amount']
-    all_expected_headers = required_headers + optional_headers
-    if not reader.fieldnames:
+AFFILIATE_CSV_REQUIRED_HEADERS = ['report_date', 'affiliate_name']
+AFFILIATE_CSV_OPTIONAL_HEADERS = ['impressions', 'clicks', 'conversions', 'commission_amount']
+AD_CAMPAIGN_CSV_REQUIRED_HEADERS = ['report_date', 'campaign_name']
+AD_CAMPAIGN_CSV_OPTIONAL_HEADERS = ['platform', 'impressions', 'clicks', 'cost', 'conversions']
+
+def _check_csv_headers(fieldnames: Optional[List[str]], required_headers: List[str], optional_headers: List[str], errors: List[str]) -> bool:
+    """Validates CSV headers, appending fatal problems to errors. Returns False if the file can't be processed."""
+    if not fieldnames:
         errors.append("CSV file is empty or has no headers.")
-        return data_records, errors
-    missing_required_headers = [h for h in required_headers if h not in reader.fieldnames]
+        return False
+    missing_required_headers = [h for h in required_headers if h not in fieldnames]
     if missing_required_headers:
         errors.append(f"Missing required CSV headers: {', '.join(missing_required_headers)}")
-        return data_records, errors
-    unexpected_headers = [h for h in reader.fieldnames if h not in all_expected_headers]
+        return False
+    all_expected_headers = required_headers + optional_headers
+    unexpected_headers = [h for h in fieldnames if h not in all_expected_headers]
     if unexpected_headers:
         current_app.logger.warning(f"CSV contains unexpected headers (will be ignored): {', '.join(unexpected_headers)}")
-    for row_num, row in enumerate(reader, start=2):
+    return True
+
+# Exports repeat the same dates and names on many rows: both the row and the batch parsers
+# parse each distinct date string once, and the row parsers share one date object per
+# string and intern names, so records don't each hold copies.
+_DATE_CACHE_MAX_ENTRIES = 100_000
+# date string -> (date, day ordinal, None), or (None, None, strptime's error) if invalid
+_report_dates: Dict[str, Tuple[Optional[date], Optional[int], Optional[str]]] = {}
+
+def _parse_report_date(value: str) -> Tuple[Optional[date], Optional[int], Optional[str]]:
+    """Returns (date, day ordinal, None) for a valid YYYY-MM-DD string, else (None, None, strptime's error)."""
+    cached = _report_dates.get(value)
+    if cached is None:
         try:
-            report_date_str = row.get('report_date')
-            if not report_date_str:
-                errors.append(f"Row {row_num}: Missing 'report_date'. Skipping row.")
-                continue
-            report_date = datetime.strptime(report_date_str, '%Y-%m-%d').date()
-            affiliate_name = row.get('affiliate_name')
-            if not affiliate_name:
-                errors.append(f"Row {row_num}: Missing 'affiliate_name'. Skipping row.")
-                continue
-            def safe_to_int(value_str: str, field_name: str) -> Optional[int]:
-                if value_str is None or value_str.strip() == '': return None
-                try: return int(value_str)
-                except ValueError: errors.append(f"Row {row_num}: Invalid integer value '{value_str}' for '{field_name}'."); return None
-            def safe_to_float(value_str: str, field_name: str) -> Optional[float]:
-                if value_str is None or value_str.strip() == '': return None
-                try: return float(value_str)
-                except ValueError: errors.append(f"Row {row_num}: Invalid float value '{value_str}' for '{field_name}'."); return None
-            data = AffiliatePerformanceData(
-                report_date=report_date, affiliate_name=affiliate_name.strip(),
-                impressions=safe_to_int(row.get('impressions'), 'impressions'),
-                clicks=safe_to_int(row.get('clicks'), 'clicks'),
-                conversions=safe_to_int(row.get('conversions'), 'conversions'),
-                commission_amount=safe_to_float(row.get('commission_amount'), 'commission_amount')
-            )
+            parsed = datetime.strptime(value, '%Y-%m-%d').date()
+            cached = (parsed, parsed.toordinal(), None)
+        except ValueError as e:
+            cached = (None, None, str(e))
+        if len(_report_dates) >= _DATE_CACHE_MAX_ENTRIES:
+            _report_dates.clear()
+        _report_dates[value] = cached
+    return cached
+
+def _report_date(value: str) -> date:
+    """datetime.strptime(value, '%Y-%m-%d').date(), reusing one object per distinct string."""
+    parsed, _, error = _parse_report_date(value)
+    if error is not None:
+        raise ValueError(error)
+    return parsed
+
+# Integer fields are stored in int64 columns; larger values are reported as invalid.
+_INT64_BOUNDS = (-2 ** 63, 2 ** 63 - 1)
+
+def _safe_to_int(value_str: str, field_name: str, row_num: int, errors: List[str]) -> Optional[int]:
+    if value_str is None or value_str.strip() == '': return None
+    try:
+        value = int(value_str)
+        if not _INT64_BOUNDS[0] <= value <= _INT64_BOUNDS[1]: raise ValueError(value_str)
+        return value
+    except ValueError: errors.append(f"Row {row_num}: Invalid integer value '{value_str}' for '{field_name}'."); return None
+
+def _safe_to_float(value_str: str, field_name: str, row_num: int, errors: List[str]) -> Optional[float]:
+    if value_str is None or value_str.strip() == '': return None
+    try: return float(value_str)
+    except ValueError: errors.append(f"Row {row_num}: Invalid float value '{value_str}' for '{field_name}'."); return None
+
+def _parse_affiliate_row(row: Dict[str, str], row_num: int, errors: List[str]) -> Optional[AffiliatePerformanceRecord]:
+    """Converts one affiliate CSV row into a record, or returns None (with errors appended) if it must be skipped."""
+    report_date_str = None
+    try:
+        report_date_str = row.get('report_date')
+        if not report_date_str:
+            errors.append(f"Row {row_num}: Missing 'report_date'. Skipping row.")
+            return None
+        report_date = _report_date(report_date_str)
+        affiliate_name = row.get('affiliate_name')
+        if not affiliate_name:
+            errors.append(f"Row {row_num}: Missing 'affiliate_name'. Skipping row.")
+            return None
+        return AffiliatePerformanceRecord(
+            report_date=report_date, affiliate_name=sys.intern(affiliate_name.strip()),
+            impressions=_safe_to_int(row.get('impressions'), 'impressions', row_num, errors),
+            clicks=_safe_to_int(row.get('clicks'), 'clicks', row_num, errors),
+            conversions=_safe_to_int(row.get('conversions'), 'conversions', row_num, errors),
+            commission_amount=_safe_to_float(row.get('commission_amount'), 'commission_amount', row_num, errors)
+        )
+    except ValueError as e: errors.append(f"Row {row_num}: Error parsing data. Invalid date format for '{report_date_str}'? Expected YYYY-MM-DD. Details: {e}. Skipping row.")
+    except Exception as e: errors.append(f"Row {row_num}: An unexpected error occurred processing this row: {e}. Skipping row.")
+    return None
+
+def _parse_ad_campaign_row(row: Dict[str, str], row_num: int, errors: List[str]) -> Optional[AdCampaignPerformanceRecord]:
+    """Converts one ad campaign CSV row into a record, or returns None (with errors appended) if it must be skipped."""
+    report_date_str = None
+    try:
+        report_date_str = row.get('report_date')
+        if not report_date_str: errors.append(f"Row {row_num}: Missing 'report_date'. Skipping row."); return None
+        report_date = _report_date(report_date_str)
+        campaign_name = row.get('campaign_name')
+        if not campaign_name: errors.append(f"Row {row_num}: Missing 'campaign_name'. Skipping row."); return None
+        platform = row.get('platform', None); platform = sys.intern(platform.strip()) if platform is not None else None
+        return AdCampaignPerformanceRecord(
+            report_date=report_date, campaign_name=sys.intern(campaign_name.strip()), platform=platform,
+            impressions=_safe_to_int(row.get('impressions'), 'impressions', row_num, errors),
+            clicks=_safe_to_int(row.get('clicks'), 'clicks', row_num, errors),
+            cost=_safe_to_float(row.get('cost'), 'cost', row_num, errors),
+            conversions=_safe_to_int(row.get('conversions'), 'conversions', row_num, errors)
+        )
+    except ValueError as e: errors.append(f"Row {row_num}: Error parsing data. Invalid date format for '{report_date_str}'? Expected YYYY-MM-DD. Details: {e}. Skipping row.")
+    except Exception as e: errors.append(f"Row {row_num}: An unexpected error occurred: {e}. Skipping row.")
+    return None
+
+def parse_affiliate_csv(file_stream: io.StringIO) -> Tuple[List[AffiliatePerformanceRecord], List[str]]:
+    data_records: List[AffiliatePerformanceRecord] = []
+    errors: List[str] = []
+    reader = csv.DictReader(file_stream)
+    if not _check_csv_headers(reader.fieldnames, AFFILIATE_CSV_REQUIRED_HEADERS, AFFILIATE_CSV_OPTIONAL_HEADERS, errors):
+        return data_records, errors
+    for row_num, row in enumerate(reader, start=2):
+        data = _parse_affiliate_row(row, row_num, errors)
+        if data is not None:
             data_records.append(data)
-        except ValueError as e: errors.append(f"Row {row_num}: Error parsing data. Invalid date format for '{report_date_str}'? Expected YYYY-MM-DD. Details: {e}. Skipping row.")
-        except Exception as e: errors.append(f"Row {row_num}: An unexpected error occurred processing this row: {e}. Skipping row.")
     return data_records, errors
 
-def parse_ad_campaign_csv(file_stream: io.StringIO) -> Tuple[List[AdCampaignPerformanceData], List[str]]:
-    # ... (content as before) ...
-    data_records: List[AdCampaignPerformanceData] = []
+def parse_ad_campaign_csv(file_stream: io.StringIO) -> Tuple[List[AdCampaignPerformanceRecord], List[str]]:
+    data_records: List[AdCampaignPerformanceRecord] = []
     errors: List[str] = []
     reader = csv.DictReader(file_stream)
-    required_headers = ['report_date', 'campaign_name']
-    optional_headers = ['platform', 'impressions', 'clicks', 'cost', 'conversions']
-    all_expected_headers = required_headers + optional_headers
-    if not reader.fieldnames: errors.append("CSV file is empty or has no headers."); return data_records, errors
-    missing_required_headers = [h for h in required_headers if h not in reader.fieldnames]
-    if missing_required_headers: errors.append(f"Missing required CSV headers: {', '.join(missing_required_headers)}"); return data_records, errors
-    unexpected_headers = [h for h in reader.fieldnames if h not in all_expected_headers]
-    if unexpected_headers: current_app.logger.warning(f"CSV contains unexpected headers (will be ignored): {', '.join(unexpected_headers)}")
+    if not _check_csv_headers(reader.fieldnames, AD_CAMPAIGN_CSV_REQUIRED_HEADERS, AD_CAMPAIGN_CSV_OPTIONAL_HEADERS, errors):
+        return data_records, errors
     for row_num, row in enumerate(reader, start=2):
-        try:
-            report_date_str = row.get('report_date')
-            if not report_date_str: errors.append(f"Row {row_num}: Missing 'report_date'. Skipping row."); continue
-            report_date = datetime.strptime(report_date_str, '%Y-%m-%d').date()
-            campaign_name = row.get('campaign_name')
-            if not campaign_name: errors.append(f"Row {row_num}: Missing 'campaign_name'. Skipping row."); continue
-            platform = row.get('platform', None); platform = platform.strip() if platform is not None else None
-            def safe_to_int(value_str: str, field_name: str) -> Optional[int]:
-                if value_str is None or value_str.strip() == '': return None
-                try: return int(value_str)
-                except ValueError: errors.append(f"Row {row_num}: Invalid integer value '{value_str}' for '{field_name}'."); return None
-            def safe_to_float(value_str: str, field_name: str) -> Optional[float]:
-                if value_str is None or value_str.strip() == '': return None
-                try: return float(value_str)
-                except ValueError: errors.append(f"Row {row_num}: Invalid float value '{value_str}' for '{field_name}'."); return None
-            data = AdCampaignPerformanceData(
-                report_date=report_date, campaign_name=campaign_name.strip(), platform=platform,
-                impressions=safe_to_int(row.get('impressions'), 'impressions'),
-                clicks=safe_to_int(row.get('clicks'), 'clicks'),
-                cost=safe_to_float(row.get('cost'), 'cost'),
-                conversions=safe_to_int(row.get('conversions'), 'conversions')
-            )
+        data = _parse_ad_campaign_row(row, row_num, errors)
+        if data is not None:
             data_records.append(data)
-        except ValueError as e: errors.append(f"Row {row_num}: Error parsing data. Invalid date format for '{report_date_str}'? Expected YYYY-MM-DD. Details: {e}. Skipping row.")
-        except Exception as e: errors.append(f"Row {row_num}: An unexpected error occurred: {e}. Skipping row.")
     return data_records, errors
 
+# --- Batch (column-at-a-time) CSV Parsing ---
+# parse_*_csv above build one dataclass per row and call strptime on every row. The batch
+# parsers below take a block of csv.reader rows, pull each field out as a column and
+# convert whole columns at once: report_date strings go through the shared date cache
+# above (exports repeat the same few hundred dates), numeric columns are converted with a single
+# map() when clean and fall back to per-value conversion with an invalid mask otherwise,
+# and the result lands directly in a column store. Error messages are identical to the
+# row-by-row parsers, in the same order.
+
+def _convert_column(values: List[Optional[str]], conv: Callable[[str], Any],
+                    bounds: Optional[Tuple[Any, Any]] = None) -> Tuple[List[Any], Dict[int, str]]:
+    """Converts a column with conv; blanks become None. Values outside bounds (low, high), if
+    given, are invalid. Returns the values and {index: raw value} for invalid entries."""
+    try:
+        converted = list(map(conv, values))
+        if bounds is None or not converted or bounds[0] <= min(converted) and max(converted) <= bounds[1]:
+            return converted, {}
+    except (ValueError, TypeError):
+        pass
+    converted = []
+    invalid: Dict[int, str] = {}
+    for i, value in enumerate(values):
+        if value is None or value.strip() == '':
+            converted.append(None)
+            continue
+        try:
+            number = conv(value)
+        except ValueError:
+            number = None
+        if number is None or bounds is not None and not bounds[0] <= number <= bounds[1]:
+            converted.append(None)
+            invalid[i] = value
+        else:
+            converted.append(number)
+    return converted, invalid
+
+def _extract_column(rows: List[List[str]], index: Optional[int]) -> List[Optional[str]]:
+    """Pulls one field out of csv.reader rows; short rows and absent headers give None, like csv.DictReader."""
+    if index is None:
+        return [None] * len(rows)
+    try:
+        return [row[index] for row in rows]
+    except IndexError:
+        return [row[index] if index < len(row) else None for row in rows]
+
+# (field, converter, type name used in error messages), in the order the row parsers check them.
+_AFFILIATE_NUMERIC_FIELDS = [('impressions', int, 'integer'), ('clicks', int, 'integer'),
+                             ('conversions', int, 'integer'), ('commission_amount', float, 'float')]
+_AD_CAMPAIGN_NUMERIC_FIELDS = [('impressions', int, 'integer'), ('clicks', int, 'integer'),
+                               ('cost', float, 'float'), ('conversions', int, 'integer')]
+
+def _parse_rows_to_columns(rows: List[List[str]], header_index: Dict[str, int], first_row_num: int, store,
+                           name_field: str, numeric_fields: List[Tuple[str, Callable, str]],
+                           platform_field: bool = False) -> List[str]:
+    """Converts a block of csv.reader rows into columns appended to store. Returns the block's errors."""
+    row_errors: Dict[int, str] = {}
+    keep: List[int] = []
+    ordinals: List[int] = []
+    names: List[str] = []
+    raw_dates = _extract_column(rows, header_index.get('report_date'))
+    raw_names = _extract_column(rows, header_index.get(name_field))
+    for i, (date_str, name) in enumerate(zip(raw_dates, raw_names)):
+        if not date_str:
+            row_errors[i] = f"Row {first_row_num + i}: Missing 'report_date'. Skipping row."
+            continue
+        _, ordinal, date_error = _parse_report_date(date_str)
+        if date_error is not None:
+            row_errors[i] = (f"Row {first_row_num + i}: Error parsing data. Invalid date format for '{date_str}'? "
+                             f"Expected YYYY-MM-DD. Details: {date_error}. Skipping row.")
+            continue
+        if not name:
+            row_errors[i] = f"Row {first_row_num + i}: Missing '{name_field}'. Skipping row."
+            continue
+        keep.append(i)
+        ordinals.append(ordinal)
+        names.append(name.strip())
+
+    if len(keep) < len(rows):
+        rows = [rows[i] for i in keep]
+    columns: Dict[str, List[Any]] = {'report_date': ordinals, name_field: names}
+    if platform_field:
+        columns['platform'] = [p.strip() if p is not None else None for p in _extract_column(rows, header_index.get('platform'))]
+    invalid_by_field = []
+    for field_name, conv, type_name in numeric_fields:
+        columns[field_name], invalid = _convert_column(_extract_column(rows, header_index.get(field_name)), conv,
+                                                       _INT64_BOUNDS if conv is int else None)
+        if invalid:
+            invalid_by_field.append((field_name, type_name, invalid))
+    store.extend_columns(len(keep), **columns)
+
+    # Merge errors back into row order; only rows that actually had a problem are visited.
+    bad_rows = set(row_errors)
+    for _, _, invalid in invalid_by_field:
+        bad_rows.update(keep[j] for j in invalid)
+    if not bad_rows:
+        return []
+    kept_position = {i: j for j, i in enumerate(keep)} if invalid_by_field else {}
+    errors: List[str] = []
+    for i in sorted(bad_rows):
+        if i in row_errors:
+            errors.append(row_errors[i])
+            continue
+        j = kept_position[i]
+        for field_name, type_name, invalid in invalid_by_field:
+            if j in invalid:
+                errors.append(f"Row {first_row_num + i}: Invalid {type_name} value '{invalid[j]}' for '{field_name}'.")
+    return errors
+
+def parse_affiliate_rows(rows: List[List[str]], header_index: Dict[str, int], first_row_num: int):
+    """Batch-parses affiliate csv.reader rows into an AffiliateColumnStore. Returns (batch, errors)."""
+    batch = AffiliateColumnStore()
+    errors = _parse_rows_to_columns(rows, header_index, first_row_num, batch, 'affiliate_name', _AFFILIATE_NUMERIC_FIELDS)
+    return batch, errors
+
+def parse_ad_campaign_rows(rows: List[List[str]], header_index: Dict[str, int], first_row_num: int):
+    """Batch-parses ad campaign csv.reader rows into an AdCampaignColumnStore. Returns (batch, errors)."""
+    batch = AdCampaignColumnStore()
+    errors = _parse_rows_to_columns(rows, header_index, first_row_num, batch, 'campaign_name',
+                                    _AD_CAMPAIGN_NUMERIC_FIELDS, platform_field=True)
+    return batch, errors
+
+def _iter_row_blocks(reader, block_size: int) -> Iterator[List[List[str]]]:
+    """Groups csv.reader rows into blocks, dropping blank lines as csv.DictReader does."""
+    block: List[List[str]] = []
+    for row in reader:
+        if row:
+            block.append(row)
+            if len(block) >= block_size:
+                yield block
+                block = []
+    if block:
+        yield block
+
+def _parse_csv_columns(file_stream, required_headers, optional_headers, row_block_parser, store_cls):
+    errors: List[str] = []
+    reader = csv.reader(file_stream)
+    header = next(reader, None)
+    store = store_cls()
+    if not _check_csv_headers(header, required_headers, optional_headers, errors):
+        return store, errors
+    header_index = {name: i for i, name in enumerate(header)}
+    row_num = 2
+    for block in _iter_row_blocks(reader, 10_000):
+        batch, batch_errors = row_block_parser(block, header_index, row_num)
+        store.extend(batch)
+        errors.extend(batch_errors)
+        row_num += len(block)
+    return store, errors
+
+def parse_affiliate_csv_columns(file_stream: io.StringIO):
+    """Column-at-a-time equivalent of parse_affiliate_csv. Returns (AffiliateColumnStore, errors)."""
+    return _parse_csv_columns(file_stream, AFFILIATE_CSV_REQUIRED_HEADERS, AFFILIATE_CSV_OPTIONAL_HEADERS,
+                              parse_affiliate_rows, AffiliateColumnStore)
+
+def parse_ad_campaign_csv_columns(file_stream: io.StringIO):
+    """Column-at-a-time equivalent of parse_ad_campaign_csv. Returns (AdCampaignColumnStore, errors)."""
+    return _parse_csv_columns(file_stream, AD_CAMPAIGN_CSV_REQUIRED_HEADERS, AD_CAMPAIGN_CSV_OPTIONAL_HEADERS,
+                              parse_ad_campaign_rows, AdCampaignColumnStore)
+
+# --- Streaming CSV Ingestion ---
+# The upload routes feed the raw (binary) upload stream through here instead of reading
+# the whole file into memory. Bytes are decoded incrementally, rows are parsed in blocks
+# with the batch parsers as lines arrive and each block reaches the store as one batch,
+# so peak memory depends on the chunk and batch sizes rather than on the export size.
+
+@dataclass
+class CsvIngestProgress:
+    """Running totals for a streaming CSV ingestion, passed to progress callbacks.
+    records_updated counts rows that overwrote a stored row with the same key;
+    records_skipped counts rows identical to the stored one."""
+    bytes_read: int = 0
+    rows_processed: int = 0
+    records_added: int = 0
+    records_updated: int = 0
+    records_skipped: int = 0
+    error_count: int = 0
+    batches: int = 0
+
+class CsvIngestError(ValueError):
+    """A streaming CSV ingestion stopped part-way. progress says what was already saved."""
+
+    def __init__(self, message: str, progress: CsvIngestProgress):
+        super().__init__(message)
+        self.progress = progress
+
+def iter_decoded_lines(byte_stream: BinaryIO, chunk_size: int, progress: Optional[CsvIngestProgress] = None, encoding: str = 'utf-8') -> Iterator[str]:
+    """Reads byte_stream in chunks and yields decoded lines (newlines kept, as the csv module expects)."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    while True:
+        chunk = byte_stream.read(chunk_size)
+        if not chunk:
+            break
+        if progress is not None:
+            progress.bytes_read += len(chunk)
+        pending += decoder.decode(chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+RowBlockParser = Callable[[List[List[str]], Dict[str, int], int], Tuple[Any, List[str]]]
+# A block mapper applies parse_row_block to a stream of argument tuples and yields the results in
+# order. The default parses inline; background jobs (app/jobs.py) fan blocks out to processes.
+BlockMapper = Callable[[Callable, Iterator[Tuple]], Iterator[Tuple[int, Any, List[str]]]]
+
+def parse_row_block(row_block_parser: RowBlockParser, block: List[List[str]], header_index: Dict[str, int],
+                    first_row_num: int) -> Tuple[int, Any, List[str]]:
+    """Runs a batch parser on one block of rows. Returns (rows in block, batch, errors).
+    Picklable and free of app state, so it can run in a worker process."""
+    batch, errors = row_block_parser(block, header_index, first_row_num)
+    return len(block), batch, errors
+
+def _map_blocks_inline(func: Callable, tasks: Iterator[Tuple]) -> Iterator[Tuple[int, Any, List[str]]]:
+    return (func(*task) for task in tasks)
+
+def _ingest_csv_stream(byte_stream: BinaryIO, store, required_headers: List[str], optional_headers: List[str],
+                       row_block_parser: RowBlockParser,
+                       batch_size: Optional[int] = None, chunk_size: Optional[int] = None,
+                       on_progress: Optional[Callable[[CsvIngestProgress], None]] = None,
+                       map_blocks: Optional[BlockMapper] = None,
+                       errors: Optional[List[str]] = None) -> Tuple[CsvIngestProgress, List[str]]:
+    config = current_app.config
+    batch_size = batch_size or config.get('CSV_INGEST_BATCH_SIZE', 5000)
+    chunk_size = chunk_size or config.get('CSV_INGEST_CHUNK_SIZE', 1024 * 1024)
+    max_errors = config.get('CSV_INGEST_MAX_ERRORS', 100)
+
+    progress = CsvIngestProgress()
+    errors = [] if errors is None else errors
+    reader = csv.reader(iter_decoded_lines(byte_stream, chunk_size, progress))
+    header = next(reader, None)
+    if not _check_csv_headers(header, required_headers, optional_headers, errors):
+        progress.error_count = len(errors)
+        return progress, errors
+    header_index = {name: i for i, name in enumerate(header)}
+
+    def tasks():
+        first_row_num = 2
+        for block in _iter_row_blocks(reader, batch_size):
+            yield row_block_parser, block, header_index, first_row_num
+            first_row_num += len(block)
+
+    try:
+        for block_rows, batch, block_errors in (map_blocks or _map_blocks_inline)(parse_row_block, tasks()):
+            counts = store.upsert(batch)
+            progress.rows_processed += block_rows
+            progress.records_added += counts.inserted
+            progress.records_updated += counts.updated
+            progress.records_skipped += counts.skipped
+            progress.batches += 1
+            # Only the first max_errors messages are kept; the rest are just counted.
+            progress.error_count += len(block_errors)
+            errors.extend(block_errors[:max(0, max_errors - len(errors))])
+            if on_progress is not None:
+                on_progress(progress)
+    except UnicodeDecodeError as e:
+        # Blocks are saved as they are read, so the rows before the bad bytes are already stored.
+        raise CsvIngestError(
+            f"File is not valid UTF-8 ({e.reason}); stopped after {progress.rows_processed} rows. "
+            f"Those rows were saved: {progress.records_added} new, {progress.records_updated} updated.",
+            progress) from e
+    return progress, errors
+
+def ingest_affiliate_csv_stream(byte_stream: BinaryIO, store, batch_size: Optional[int] = None, chunk_size: Optional[int] = None,
+                                on_progress: Optional[Callable[[CsvIngestProgress], None]] = None,
+                                map_blocks: Optional[BlockMapper] = None,
+                                errors: Optional[List[str]] = None) -> Tuple[CsvIngestProgress, List[str]]:
+    """Streams an affiliate CSV upload into store in batches, upserting on (report_date, affiliate_name).
+    Returns the final progress and the retained errors, which are appended to errors (if
+    given) as each batch is merged."""
+    return _ingest_csv_stream(byte_stream, store, AFFILIATE_CSV_REQUIRED_HEADERS, AFFILIATE_CSV_OPTIONAL_HEADERS,
+                              parse_affiliate_rows, batch_size, chunk_size, on_progress, map_blocks, errors)
+
+def ingest_ad_campaign_csv_stream(byte_stream: BinaryIO, store, batch_size: Optional[int] = None, chunk_size: Optional[int] = None,
+                                  on_progress: Optional[Callable[[CsvIngestProgress], None]] = None,
+                                  map_blocks: Optional[BlockMapper] = None,
+                                  errors: Optional[List[str]] = None) -> Tuple[CsvIngestProgress, List[str]]:
+    """Streams an ad campaign CSV upload into store in batches, upserting on (report_date, campaign_name, platform).
+    Returns the final progress and the retained errors, which are appended to errors (if
+    given) as each batch is merged."""
+    return _ingest_csv_stream(byte_stream, store, AD_CAMPAIGN_CSV_REQUIRED_HEADERS, AD_CAMPAIGN_CSV_OPTIONAL_HEADERS,
+                              parse_ad_campaign_rows, batch_size, chunk_size, on_progress, map_blocks, errors)
+
 # --- Facebook Audience Network (FAN) Service Functions ---
 _fb_api_initialized_this_request = False # Simple flag for current request context
 
@@ -330,11 +662,11 @@ def get_mailchimp_client():
         current_app.logger.error(f"Failed to initialize Mailchimp client: {e}")
         return None
 
-def get_mailchimp_campaigns_mock() -> List[MailchimpData]:
+def get_mailchimp_campaigns_mock() -> List[MailchimpRecord]:
     """Returns mock Mailchimp campaign data."""
     current_date = datetime.now().date()
     return [
-        MailchimpData(
+        MailchimpRecord(
             campaign_id="mc_001",
             campaign_title="Fall 2023 Newsletter",
             subject_line="Check out our autumn deals!",
@@ -344,7 +676,7 @@ def get_mailchimp_campaigns_mock() -> List[MailchimpData]:
             click_rate=4.2,
             conversions=120
         ),
-        MailchimpData(
+        MailchimpRecord(
             campaign_id="mc_002",
             campaign_title="AI Nexus Product Update",
             subject_line="New Features are here: Business Chimp is live!",
@@ -373,51 +705,190 @@ def generate_business_chimp_content(topic: str, context: str = "") -> str:
     Focus on: Conversion, engagement, and clear value proposition.
     Structure: Include a catchy subject line (or headline) and a compelling body.
     """
-    return generate_content_with_gemini(prompt)
+    return generate_similar_content('business_chimp', f"{topic}\n{context}", prompt)
 
 # --- End of Mailchimp Service Functions ---
 
 # --- Gemini AI Service Functions ---
 
-def generate_content_with_gemini(prompt: str, image_data: str = None) -> str:
-    """Generates content using Google's Gemini 1.5 Flash model, supporting multimodal input."""
-    api_key = current_app.config.get('GOOGLE_API_KEY')
-    if not api_key or 'YOUR_GOOGLE_API_KEY' in api_key or api_key == 'MOCK_KEY':
-        current_app.logger.warning("Gemini API key not configured. Returning mock response.")
-        return f"Mock Gemini response for: {prompt[:50]}..."
+def _gemini_content(prompt: str, image_data: Optional[str]) -> Tuple[list, str, Optional[bytes]]:
+    """The content list sent to the model, the final prompt text and the prepared image bytes
+    (None without a usable image). Images are downscaled and re-encoded by app.ai_images."""
+    content = [prompt]
+    img_bytes = None
+    if image_data:
+        try:
+            image = current_app.ai_images.prepare(image_data)
+            img_bytes = image.data
+            content.append(image.as_part())
+            prompt += "\n\nAlso consider the provided image as context for the video script."
+            content[0] = prompt
+        except Exception as e:
+            current_app.logger.error(f"Error processing image data: {e}")
+    return content, prompt, img_bytes
 
-    try:
-        genai.configure(api_key=api_key)
-        # Using gemini-1.5-flash as default, it's very capable with images
-        model = genai.GenerativeModel('gemini-1.5-flash')
+def _response_cache():
+    return current_app.ai_cache if current_app.config.get('AI_CACHE_ENABLED') else None
 
-        content = [prompt]
-        if image_data:
-            try:
-                if "," in image_data:
-                    image_data = image_data.split(",")[1]
-                img_bytes = base64.b64decode(image_data)
-                img = Image.open(io.BytesIO(img_bytes))
-                content.append(img)
-                prompt += "\n\nAlso consider the provided image as context for the video script."
-                content[0] = prompt
-            except Exception as e:
-                current_app.logger.error(f"Error processing image data: {e}")
+def _wait_for_model_quota() -> None:
+    """Takes a token from the app's provider rate limiter (see app/ratelimit.py) before a model call."""
+    current_app.ai_rate_limiter.acquire(timeout=current_app.config['AI_RATE_LIMIT_MAX_WAIT'])
+
+# generate_content_with_gemini reports failures as text starting with this.
+GEMINI_ERROR_PREFIX = "Error: Could not generate content with Gemini."
+
+def _record_call(model: str, outcome: str, prompt: str, response: str, started: float,
+                 image_bytes: Optional[bytes] = None, stream: bool = False) -> None:
+    priority, origin = current_call()
+    current_app.ai_metrics.record_call(origin, priority, model, outcome, len(prompt), len(response),
+                                       time.perf_counter() - started, len(image_bytes or b''), stream)
 
-        response = model.generate_content(content)
-        return response.text
+def _model_slot(priority: str):
+    """Admission to the app's model call gate (see app/ai_scheduler.py) for one call."""
+    return current_app.ai_gate.slot(priority, timeout=current_app.config['AI_GATE_MAX_WAIT'])
+
+def generate_content_with_gemini(prompt: str, image_data: str = None, model: str = DEFAULT_MODEL_ALIAS) -> str:
+    """Generates content with the Gemini model registered as `model` (gemini-1.5-flash by
+    default, it's very capable with images), supporting multimodal input.
+
+    Responses are cached by model, prompt and image, and concurrent identical calls are
+    coalesced into one (see app/ai_cache.py). Model calls are admitted by priority (see
+    app/ai_scheduler.py), and every call is recorded in app.ai_metrics.
+    """
+    started = time.perf_counter()
+    registry = current_app.gemini_models
+    if not registry.configured:
+        current_app.logger.warning("Gemini API key not configured. Returning mock response.")
+        text = f"Mock Gemini response for: {prompt[:50]}..."
+        _record_call(model, 'mock', prompt, text, started)
+        return text
+
+    outcome, text, img_bytes = 'error', '', None
+    try:
+        content, prompt, img_bytes = _gemini_content(prompt, image_data)
+        key = cache_key(registry.spec(model).cache_name, prompt, img_bytes)
+        cache = _response_cache()
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                outcome, text = 'cache_hit', cached
+                return text
+
+        priority, _ = current_call()
+        called = False
+
+        def call_model() -> str:
+            nonlocal called
+            called = True
+            # Wait for quota before taking a gate slot, so the wait does not hold a slot.
+            _wait_for_model_quota()
+            with _model_slot(priority):
+                text = registry.get(model).generate_content(content).text
+            if cache is not None:
+                cache.put(key, text)
+            return text
+
+        # Identical concurrent requests share one model call.
+        text = current_app.ai_inflight.do(key, call_model)
+        outcome = 'ok' if called else 'coalesced'
+        return text
 
     except Exception as e:
         current_app.logger.error(f"Error calling Gemini API: {e}")
-        return f"Error: Could not generate content with Gemini. {str(e)}"
+        text = f"{GEMINI_ERROR_PREFIX} {str(e)}"
+        return text
+    finally:
+        _record_call(model, outcome, prompt, text, started, img_bytes)
+
+def stream_content_with_gemini(prompt: str, image_data: str = None, model: str = DEFAULT_MODEL_ALIAS) -> Iterator[str]:
+    """Like generate_content_with_gemini, but yields the response text in chunks as the model
+    streams it. Errors are raised rather than returned as text.
+
+    Closing the generator early (the client went away) stops reading the model's stream.
+    Records time to first token ('gemini.stream.ttft') and stream outcomes in app.ai_metrics.
+    The call takes a quota token, then holds a model call slot for the whole stream.
+    """
+    started = time.perf_counter()
+    registry = current_app.gemini_models
+    if not registry.configured:
+        current_app.logger.warning("Gemini API key not configured. Returning mock response.")
+        text = f"Mock Gemini response for: {prompt[:50]}..."
+        _record_call(model, 'mock', prompt, text, started, stream=True)
+        yield text
+        return
+
+    content, prompt, img_bytes = _gemini_content(prompt, image_data)
+    cache = _response_cache()
+    if cache is not None:
+        key = cache_key(registry.spec(model).cache_name, prompt, img_bytes)
+        cached = cache.get(key)
+        if cached is not None:
+            _record_call(model, 'cache_hit', prompt, cached, started, img_bytes, stream=True)
+            yield cached
+            return
+
+    priority, _ = current_call()
+    metrics = current_app.ai_metrics
+    parts = []
+    outcome = 'failed'
+    stream = None
+    try:
+        # Wait for quota before taking a gate slot, so the wait does not hold a slot.
+        _wait_for_model_quota()
+    except Exception:
+        _record_call(model, outcome, prompt, '', started, img_bytes, stream=True)
+        raise
+    with _model_slot(priority):
+        try:
+            metrics.incr('gemini.stream.started')
+            stream_started = time.perf_counter()
+            stream = iter(registry.get(model).generate_content(content, stream=True))
+            for chunk in stream:
+                text = chunk.text
+                if not text:
+                    continue
+                if not parts:
+                    metrics.observe('gemini.stream.ttft', time.perf_counter() - stream_started)
+                parts.append(text)
+                yield text
+            outcome = 'completed'
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        finally:
+            if stream is not None:
+                metrics.incr(f'gemini.stream.{outcome}')
+                metrics.observe('gemini.stream.total', time.perf_counter() - stream_started)
+                close = getattr(stream, 'close', None)
+                if outcome != 'completed' and close is not None:
+                    close()
+            _record_call(model, outcome, prompt, ''.join(parts), started, img_bytes, stream=True)
+    if cache is not None:
+        cache.put(key, ''.join(parts))
+
+def generate_similar_content(scope: str, user_text: str, prompt: str) -> str:
+    """generate_content_with_gemini(prompt), unless a response for a near-identical user_text
+    in the same scope is cached (see app/ai_similar.py). Only real model responses are kept."""
+    index = current_app.ai_similar
+    if not current_app.config.get('AI_SIMILAR_CACHE_ENABLED') or not current_app.gemini_models.configured:
+        return generate_content_with_gemini(prompt)
+    started = time.perf_counter()
+    cached, signature = index.lookup(scope, user_text)
+    if cached is not None:
+        _record_call(DEFAULT_MODEL_ALIAS, 'similar_hit', prompt, cached, started)
+        return cached
+    text = generate_content_with_gemini(prompt)
+    if not text.startswith(GEMINI_ERROR_PREFIX):
+        index.store(scope, signature, text)
+    return text
 
 # --- Cloud Optimization Service Functions ---
 
-def get_mock_cloud_service_data() -> List[CloudServiceData]:
+def get_mock_cloud_service_data() -> List[CloudServiceRecord]:
     """Generates mock data for Cloud Services (IaaS, PaaS, SaaS, ITaaS)."""
     current_date = datetime.now().date()
     return [
-        CloudServiceData(
+        CloudServiceRecord(
             service_name="AWS EC2 Clusters",
             service_type="IaaS",
             provider="AWS",
@@ -428,7 +899,7 @@ def get_mock_cloud_service_data() -> List[CloudServiceData]:
             usage_value=65.5,
             ai_optimization_score=85.0
         ),
-        CloudServiceData(
+        CloudServiceRecord(
             service_name="Google App Engine",
             service_type="PaaS",
             provider="GCP",
@@ -439,7 +910,7 @@ def get_mock_cloud_service_data() -> List[CloudServiceData]:
             usage_value=1200.0,
             ai_optimization_score=92.5
         ),
-        CloudServiceData(
+        CloudServiceRecord(
             service_name="Salesforce CRM",
             service_type="SaaS",
             provider="Salesforce",
@@ -450,7 +921,7 @@ def get_mock_cloud_service_data() -> List[CloudServiceData]:
             usage_value=150.0,
             ai_optimization_score=78.0
         ),
-        CloudServiceData(
+        CloudServiceRecord(
             service_name="Managed IT Support",
             service_type="ITaaS",
             provider="Internal/Managed",
@@ -480,7 +951,7 @@ CLOUD_REC_CONFIG = [
 
 import json
 
-def get_ai_cloud_recommendations(service_data: List[CloudServiceData], use_gemini: bool = False) -> List[Dict[str, str]]:
+def get_ai_cloud_recommendations(service_data: List[CloudServiceRecord], use_gemini: bool = False) -> List[Dict[str, str]]:
     """Generates AI-driven recommendations based on cloud service data."""
     recommendations = []
 
@@ -491,7 +962,9 @@ def get_ai_cloud_recommendations(service_data: List[CloudServiceData], use_gemin
 
         try:
             current_app.logger.info("Requesting Gemini for cloud recommendations")
-            gemini_resp = generate_content_with_gemini(prompt)
+            # Analysis runs, not someone waiting on a reply: don't compete with interactive calls.
+            with call_priority(BACKGROUND, 'cloud_recommendations'):
+                gemini_resp = generate_content_with_gemini(prompt)
             # Basic attempt to parse JSON from AI response
             if '[' in gemini_resp and ']' in gemini_resp:
                 json_str = gemini_resp[gemini_resp.find('['):gemini_resp.rfind(']')+1]
@@ -520,9 +993,8 @@ def get_ai_cloud_recommendations(service_data: List[CloudServiceData], use_gemin
 
 # --- Ported AI Services (from gyfx35/AI-services) ---
 
-def generate_website_service(prompt: str) -> Dict[str, str]:
-    """Generates HTML and CSS for a website based on a prompt."""
-    ai_prompt = f"""
+def _website_prompt(prompt: str) -> str:
+    return f"""
     You are a skilled web developer. Generate the HTML and CSS for a single-page website based on this prompt: {prompt}
 
     Format your response EXACTLY like this:
@@ -533,64 +1005,71 @@ def generate_website_service(prompt: str) -> Dict[str, str]:
     ... (css code) ...
     [/CSS]
     """
-    response_text = generate_content_with_gemini(ai_prompt)
 
+def _game_prompt(prompt: str) -> str:
+    return f"Act as a game developer. Generate a complete, single-file HTML (including CSS and JS) for a simple browser game based on this prompt: {prompt}. Ensure it's playable immediately."
+
+def _app_prompt(prompt: str) -> str:
+    return f"Act as a software engineer. Generate the full code (HTML/CSS/JS) for a functional single-page web application based on this prompt: {prompt}."
+
+def _backend_prompt(prompt: str) -> str:
+    return f"Act as a backend developer. Generate Python Flask code for a backend service based on this prompt: {prompt}. Include routes and basic logic."
+
+# Software-engineer actions -> model prompt builders.
+SOFTWARE_ENGINEER_PROMPTS = {
+    'website': _website_prompt,
+    'game': _game_prompt,
+    'app': _app_prompt,
+    'backend': _backend_prompt,
+}
+
+def parse_website_response(response_text: str, sections: Optional[SectionExtractor] = None) -> Dict[str, str]:
+    """Splits a website generation response into its HTML and CSS. Pass the SectionExtractor
+    that was fed a streamed response to reuse its results instead of rescanning the text."""
     if "Mock Gemini response" in response_text:
         return {
             "html": f"<!-- {response_text} -->",
             "css": f"/* {response_text} */"
         }
 
-    html_match = re.search(r'\[HTML\](.*?)\[/HTML\]', response_text, re.DOTALL | re.IGNORECASE)
-    css_match = re.search(r'\[CSS\](.*?)\[/CSS\]', response_text, re.DOTALL | re.IGNORECASE)
-
-    html_code = ""
-    if html_match:
-        html_code = html_match.group(1).strip()
-    else:
-        # Fallback for markdown code blocks if tags are missing
-        html_block = re.search(r'```html\n(.*?)```', response_text, re.DOTALL | re.IGNORECASE)
-        if html_block:
-            html_code = html_block.group(1).strip()
-
-    css_code = ""
-    if css_match:
-        css_code = css_match.group(1).strip()
-    else:
-        # Fallback for markdown code blocks if tags are missing
-        css_block = re.search(r'```css\n(.*?)```', response_text, re.DOTALL | re.IGNORECASE)
-        if css_block:
-            css_code = css_block.group(1).strip()
-
+    if sections is None:
+        sections = extract_sections(response_text)
+    html_code = sections.get('html')
+    css_code = sections.get('css')
     return {
         "html": html_code if html_code else "<!-- Error: HTML not found -->",
         "css": css_code if css_code else "/* Error: CSS not found */"
     }
 
+def generate_website_service(prompt: str) -> Dict[str, str]:
+    """Generates HTML and CSS for a website based on a prompt."""
+    return parse_website_response(generate_content_with_gemini(_website_prompt(prompt), model='code'))
+
 def generate_game_service(prompt: str) -> str:
     """Generates a simple game (HTML/CSS/JS) based on a prompt."""
-    ai_prompt = f"Act as a game developer. Generate a complete, single-file HTML (including CSS and JS) for a simple browser game based on this prompt: {prompt}. Ensure it's playable immediately."
-    return generate_content_with_gemini(ai_prompt)
+    return generate_content_with_gemini(_game_prompt(prompt), model='code')
 
 def generate_app_service(prompt: str) -> str:
     """Generates a simple web app based on a prompt."""
-    ai_prompt = f"Act as a software engineer. Generate the full code (HTML/CSS/JS) for a functional single-page web application based on this prompt: {prompt}."
-    return generate_content_with_gemini(ai_prompt)
+    return generate_content_with_gemini(_app_prompt(prompt), model='code')
 
 def generate_backend_service(prompt: str) -> str:
     """Generates backend code based on a prompt."""
-    ai_prompt = f"Act as a backend developer. Generate Python Flask code for a backend service based on this prompt: {prompt}. Include routes and basic logic."
-    return generate_content_with_gemini(ai_prompt)
+    return generate_content_with_gemini(_backend_prompt(prompt), model='code')
+
+def stream_software_engineer_service(action: str, prompt: str) -> Iterator[str]:
+    """Streams the model output for a software-engineer action (see SOFTWARE_ENGINEER_PROMPTS)."""
+    return stream_content_with_gemini(SOFTWARE_ENGINEER_PROMPTS[action](prompt), model='code')
 
 def debug_code_service(code: str, language: str) -> str:
     """Analyzes code and provides debugging insights."""
     ai_prompt = f"Act as an expert debugger. Analyze the following {language} code and identify potential bugs, security issues, or performance bottlenecks. Provide clear explanations and suggested fixes.\n\nCode:\n{code}"
-    return generate_content_with_gemini(ai_prompt)
+    return generate_content_with_gemini(ai_prompt, model='code')
 
 def generate_social_media_post_service(description: str) -> str:
     """Generates a social media post based on a description."""
     ai_prompt = f"Act as a creative marketer. Write an engaging social media post based on this description: {description}. Include hashtags and emojis."
-    return generate_content_with_gemini(ai_prompt)
+    return generate_similar_content('social_post', description, ai_prompt)
 
 def optimize_ads_service(prompt: str) -> Dict[str, Any]:
     """Provides ad optimization recommendations."""
@@ -602,53 +1081,46 @@ def optimize_ads_service(prompt: str) -> Dict[str, Any]:
     3. Targeting Suggestions
     Format as a structured response.
     """
-    response_text = generate_content_with_gemini(ai_prompt)
+    response_text = generate_similar_content('optimize_ads', prompt, ai_prompt)
     return {"recommendations": response_text}
 
-async def _check_link(client: httpx.AsyncClient, link_data: Dict[str, str], results: Dict[str, List[Dict[str, Any]]]):
-    url = link_data['url']
+async def analyze_website_service(url: str, crawl: bool = False, max_depth: Optional[int] = None,
+                                  max_pages: Optional[int] = None) -> Dict[str, Any]:
+    """Analyzes a website for broken links and performance. By default the first 20 links of
+    the page at url are checked; crawl=True audits the whole site (see app/site_audit.py).
+    Link statuses are cached between runs (see app/link_cache.py)."""
+    pool = current_app.http_pool
+    config = current_app.config
+    cache = current_app.link_cache if config['LINK_CACHE_ENABLED'] else None
     try:
-        start_time = time.time()
-        response = await client.head(url, follow_redirects=True, timeout=5)
-        end_time = time.time()
-
-        res = {
-            'url': url,
-            'text': link_data['text'],
-            'status': response.status_code,
-            'time_ms': round((end_time - start_time) * 1000)
-        }
+        scheduler = HostScheduler.from_config(config)
+        if crawl:
+            depth_limit = config['ANALYZER_CRAWL_MAX_DEPTH']
+            page_limit = config['ANALYZER_CRAWL_MAX_PAGES']
+            site = SiteCrawl(pool, url,
+                             max_depth=min(depth_limit, depth_limit if max_depth is None else max_depth),
+                             max_pages=min(page_limit, page_limit if max_pages is None else max_pages),
+                             max_links=config['ANALYZER_CRAWL_MAX_LINKS'], scheduler=scheduler, cache=cache)
+            return await site.run()
 
-        if response.status_code >= 400:
-            results['broken'].append(res)
-        elif res['time_ms'] > 1000:
-            results['slow'].append(res)
-        else:
-            results['ok'].append(res)
-    except Exception as e:
-        results['broken'].append({'url': url, 'text': link_data['text'], 'status': 'Error', 'error': str(e)})
-
-async def analyze_website_service(url: str) -> Dict[str, Any]:
-    """Analyzes a website for broken links and performance."""
-    try:
         headers = {'User-Agent': 'AI-Nexus-Analyzer/1.0'}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        links = []
-        for a in soup.find_all('a', href=True):
-            full_url = urljoin(url, a['href'])
-            if urlparse(full_url).scheme in ('http', 'https'):
-                links.append({'url': full_url, 'text': a.get_text(strip=True)})
-
-        results = {'ok': [], 'broken': [], 'slow': []}
-        async with httpx.AsyncClient() as client:
-            tasks = [_check_link(client, link, results) for link in links[:20]] # Limit to 20 links for speed
-            await asyncio.gather(*tasks)
-
-        return results
+        checker = LinkChecker(pool, cache)
+        checks = 0
+        try:
+            async with pool.stream('GET', url, headers=headers, timeout=10) as response:
+                response.raise_for_status()
+                # Each link is checked as soon as it is parsed (once per URL, scheduled per
+                # host); the download stops after 20.
+                async for link in stream_links(response, url):
+                    if scheduler.submit(normalize_url(link['url']), partial(checker.check, link)):
+                        checks += 1
+                        if checks == 20: # Limit to 20 links for speed
+                            break
+            await scheduler.join()
+        finally:
+            scheduler.cancel()
+
+        return {**checker.summary(), 'hosts': scheduler.stats()}
     except Exception as e:
         return {'error': str(e)}
 
@@ -683,10 +1155,9 @@ async def trigger_n8n_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
         return {"status": "mock", "message": "Mock n8n webhook trigger success"}
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(webhook_url, json=payload, timeout=10)
-            response.raise_for_status()
-            return {"status": "success", "data": response.json() if response.content else "OK"}
+        response = await current_app.http_pool.post(webhook_url, json=payload, timeout=10)
+        response.raise_for_status()
+        return {"status": "success", "data": response.json() if response.content else "OK"}
     except Exception as e:
         current_app.logger.error(f"Error triggering n8n webhook: {e}")
         return {"status": "error", "message": str(e)}
@@ -712,10 +1183,9 @@ async def run_lamatic_flow(flow_id: str, payload: Dict[str, Any]) -> Dict[str, A
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(endpoint, json=payload, headers=headers, timeout=15)
-            response.raise_for_status()
-            return {"status": "success", "data": response.json()}
+        response = await current_app.http_pool.post(endpoint, json=payload, headers=headers, timeout=15)
+        response.raise_for_status()
+        return {"status": "success", "data": response.json()}
     except Exception as e:
         current_app.logger.error(f"Error running Lamatic flow: {e}")
         return {"status": "error", "message": str(e)}
@@ -0,0 +1,421 @@
+# Link auditing for the system analyzer (/ai-services/system-analyzer).
+#
+# By default the analyzer checks the first 20 links of the one page it is given. Crawl mode
+# audits a whole site:
+#   - Pages are visited breadth-first, starting from the given URL, up to max_depth
+#     links away and at most max_pages pages. Only pages on the start URL's origin
+#     (scheme, host and port) are crawled, after following the start URL's redirects.
+#   - URLs are normalized before they are compared: lowercase scheme and host, no
+#     default port, no fragment, and '/' for an empty path. Each URL is therefore
+#     requested once per crawl, however many pages link to it.
+#   - A crawled page's GET is also its link check, so it is not HEAD-checked as well.
+#     Other links, including off-site ones, get one HEAD each, up to max_links.
+#   - Page fetches and link checks are run by a HostScheduler (app/link_scheduler.py):
+#     a FIFO queue per host, which keeps the crawl breadth-first, an adaptive limit per
+#     host, and a bound on the requests in flight for the whole crawl
+#     (ANALYZER_CRAWL_CONCURRENCY).
+#   - Links are checked with HEAD; hosts that reject HEAD (405/501) get a one-byte ranged
+#     GET instead.
+#   - Pages are parsed with lxml's pull parser as they download (LinkExtractor), and their
+#     links are queued as they are found, so link checks start before a large page has
+#     finished arriving.
+#   - With the link status cache (app/link_cache.py), unchanged links and pages are
+#     answered from the cache or revalidated with conditional requests, so re-auditing a
+#     mostly unchanged site makes few full requests.
+
+import codecs
+import re
+import time
+from dataclasses import dataclass, replace
+from email.message import Message
+from functools import partial
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from lxml import etree
+
+from .http_pool import HttpPool, PooledStream
+from .link_cache import LinkStatus, LinkStatusCache, cacheable, link_status
+from .link_scheduler import HostScheduler, JobResult
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+_HEAD_UNSUPPORTED = (405, 501)
+# Bytes at the start of a page searched for its encoding, as in the HTML spec's prescan.
+_SNIFF_BYTES = 1024
+SLOW_LINK_MS = 1000
+
+
+def host_coped(status: int) -> bool:
+    """False for responses that mean the host is overloaded: 429 and 5xx."""
+    return status != 429 and status < 500
+
+
+def _content_type(value: str) -> Tuple[str, Dict[str, str]]:
+    """Splits a Content-Type like 'text/html; charset=utf-8' into the type and its parameters."""
+    message = Message()
+    message['content-type'] = value
+    return message.get_content_type(), dict(message.get_params()[1:])
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of an absolute http(s) URL, for deduplication."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host:
+        host = f'[{host}]'
+    port = parts.port
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f'{host}:{port}'
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(normalize_url(url))
+    return f'{parts.scheme}://{parts.netloc.rpartition("@")[2]}'
+
+
+class LinkExtractor:
+    """Incremental link finder: feed() it an HTML page's bytes as they arrive.
+
+    lxml's pull parser parses each chunk as it is fed and reports every <a> as soon as its
+    closing tag has been seen, so links are available long before the page finishes
+    downloading. Parsed anchors are cleared to keep the tree small.
+
+    Without an encoding (from the Content-Type), the first _SNIFF_BYTES are held back and
+    sniffed for a BOM or a <meta> charset, as browsers do; failing both, the page is read
+    as UTF-8 (libxml2 would otherwise assume Latin-1).
+    """
+
+    def __init__(self, base_url: str, encoding: Optional[str] = None):
+        self.base_url = base_url
+        # An encoding libxml2 does not know is sniffed instead.
+        self._parser = None if encoding is None else _html_parser(encoding)
+        self._head = b''
+
+    def feed(self, chunk: bytes) -> List[Dict[str, str]]:
+        """Parses the next chunk; returns the http(s) links it completed as {'url', 'text'}."""
+        if self._parser is None:
+            self._head += chunk
+            if len(self._head) < _SNIFF_BYTES:
+                return []
+            chunk = self._start()
+        self._parser.feed(chunk)
+        return self._links()
+
+    def close(self) -> List[Dict[str, str]]:
+        """Ends the document; returns any links still pending."""
+        if self._parser is None:
+            head = self._start()
+            if head:
+                self._parser.feed(head)
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError:
+            pass  # empty or non-HTML document
+        return self._links()
+
+    def _start(self) -> bytes:
+        """Creates the parser for the sniffed encoding; returns the held-back bytes."""
+        head, self._head = self._head, b''
+        self._parser = _html_parser(sniff_encoding(head)) or _html_parser('utf-8')
+        return head
+
+    def _links(self) -> List[Dict[str, str]]:
+        links = []
+        for _, element in self._parser.read_events():
+            href = element.get('href')
+            if href is not None:
+                full_url = urljoin(self.base_url, href.strip())
+                if urlsplit(full_url).scheme in ('http', 'https'):
+                    # Same text as BeautifulSoup's get_text(strip=True).
+                    text = ''.join(part.strip() for part in element.itertext())
+                    links.append({'url': full_url, 'text': text})
+            element.clear(keep_tail=True)
+        return links
+
+
+def _html_parser(encoding: str) -> Optional[etree.HTMLPullParser]:
+    """A pull parser for <a> elements in encoding, or None if libxml2 does not know it.
+    libxml2 takes iconv names, so Python's spelling (latin-1 -> iso8859-1) is tried too."""
+    try:
+        names = (encoding, codecs.lookup(encoding).name.replace('_', '-'))
+    except LookupError:
+        return None
+    for name in names:
+        try:
+            return etree.HTMLPullParser(events=('end',), tag='a', encoding=name)
+        except LookupError:
+            pass
+    return None
+
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'UTF-16LE'), (codecs.BOM_UTF16_BE, 'UTF-16BE'))
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+
+def sniff_encoding(head: bytes) -> str:
+    """The encoding of an HTML document from the start of its bytes: its BOM, else its
+    <meta charset> / http-equiv declaration, else UTF-8."""
+    for bom, encoding in _BOMS:
+        if head.startswith(bom):
+            return encoding
+    match = _META_CHARSET.search(head[:_SNIFF_BYTES])
+    if match:
+        encoding = match.group(1).decode('ascii')
+        try:
+            codecs.lookup(encoding)
+            return encoding
+        except LookupError:
+            pass
+    return 'utf-8'
+
+
+def extract_links(base_url: str, content: bytes) -> List[Dict[str, str]]:
+    """The http(s) links of a complete HTML page as {'url', 'text'}, resolved against base_url."""
+    extractor = LinkExtractor(base_url)
+    return extractor.feed(content) + extractor.close()
+
+
+def response_charset(headers) -> Optional[str]:
+    """The charset of a Content-Type header, if it names one lxml knows."""
+    _, params = _content_type(headers.get('content-type', ''))
+    charset = params.get('charset')
+    if charset:
+        try:
+            codecs.lookup(charset)
+        except LookupError:
+            return None
+    return charset or None
+
+
+async def stream_links(response: PooledStream, base_url: str) -> AsyncIterator[Dict[str, str]]:
+    """Yields a streamed HTML response's links as its body downloads."""
+    extractor = LinkExtractor(base_url, response_charset(response.headers))
+    async for chunk in response.aiter_bytes():
+        for link in extractor.feed(chunk):
+            yield link
+    for link in extractor.close():
+        yield link
+
+
+class LinkChecker:
+    """Checks links and files them under 'broken', 'slow' or 'ok'.
+
+    With a LinkStatusCache, fresh entries are used without a request and stale ones are
+    revalidated; each result then says whether it was a cache 'hit', 'revalidated' or a 'miss'.
+    """
+
+    def __init__(self, pool: HttpPool, cache: Optional[LinkStatusCache] = None):
+        self.pool = pool
+        self.cache = cache
+        self.results: Dict[str, List[Dict[str, Any]]] = {'ok': [], 'broken': [], 'slow': []}
+        self.cache_counts = {'hit': 0, 'revalidated': 0, 'miss': 0}
+        self._no_head: Set[str] = set()  # hosts that answered HEAD with 405/501
+
+    def lookup(self, url: str, page: bool = False) -> Tuple[Optional[LinkStatus], bool]:
+        if self.cache is None:
+            return None, False
+        return self.cache.lookup(url, page)
+
+    def store(self, url: str, status: Any, elapsed: float, headers, links: Optional[List[Dict[str, str]]] = None,
+              final_url: Optional[str] = None) -> None:
+        if self.cache is not None and cacheable(status):
+            self.cache.put(url, link_status(status, elapsed, headers, links, final_url))
+
+    def revalidated(self, url: str, entry: LinkStatus, elapsed: float) -> LinkStatus:
+        """Records a 304 for entry; returns it with the new check's time."""
+        entry = replace(entry, time_ms=round(elapsed * 1000))
+        self.cache.confirm(url, entry)
+        return entry
+
+    def record(self, link_data: Dict[str, str], status: Any, time_ms: int, error: Optional[str] = None,
+               cache: Optional[str] = None) -> None:
+        res = {'url': link_data['url'], 'text': link_data['text'], 'status': status}
+        if self.cache is not None and cache is not None:
+            res['cache'] = cache
+            self.cache_counts[cache] += 1
+        if error is not None:
+            res['error'] = error
+            self.results['broken'].append(res)
+            return
+        res['time_ms'] = time_ms
+        if status >= 400:
+            self.results['broken'].append(res)
+        elif time_ms > SLOW_LINK_MS:
+            self.results['slow'].append(res)
+        else:
+            self.results['ok'].append(res)
+
+    async def _probe(self, url: str, headers: Dict[str, str]) -> Tuple[int, Any]:
+        """(status, headers) of url from a HEAD, or from a one-byte ranged GET for hosts that
+        do not support HEAD."""
+        host = urlsplit(url).netloc
+        if host not in self._no_head:
+            response = await self.pool.head(url, headers=headers, follow_redirects=True, timeout=5)
+            if response.status_code not in _HEAD_UNSUPPORTED:
+                return response.status_code, response.headers
+            self._no_head.add(host)
+        async with self.pool.stream('GET', url, headers={**headers, 'Range': 'bytes=0-0'},
+                                    follow_redirects=True, timeout=5) as response:
+            if response.status_code in (206, 304):
+                async for _ in response.aiter_bytes():
+                    pass  # at most a byte; lets the connection be reused
+            # 206 is an artifact of the range, not something to report.
+            return (200 if response.status_code == 206 else response.status_code), response.headers
+
+    async def check(self, link_data: Dict[str, str]) -> JobResult:
+        """Checks one link, conditionally if the cache has validators for it. Returns what
+        HostScheduler needs to adapt the host's concurrency (None if no request was made)."""
+        key = normalize_url(link_data['url'])
+        entry, fresh = self.lookup(key)
+        if fresh:
+            self.record(link_data, entry.status, entry.time_ms, cache='hit')
+            return None
+        started = time.time()
+        try:
+            status, headers = await self._probe(link_data['url'], entry.validators() if entry else {})
+        except Exception as e:
+            self.record(link_data, 'Error', 0, str(e), cache='miss')
+            return time.time() - started, False
+        elapsed = time.time() - started
+        if status == 304 and entry is not None:
+            entry = self.revalidated(key, entry, elapsed)
+            self.record(link_data, entry.status, entry.time_ms, cache='revalidated')
+        else:
+            self.store(key, status, elapsed, headers)
+            self.record(link_data, status, round(elapsed * 1000), cache='miss')
+        return elapsed, host_coped(status)
+
+    def summary(self) -> Dict[str, Any]:
+        """The results, plus cache hit counts when a cache is in use."""
+        if self.cache is None:
+            return dict(self.results)
+        return {**self.results, 'cache': dict(self.cache_counts)}
+
+
+@dataclass
+class _Page:
+    url: str
+    text: str
+    depth: int
+
+
+class SiteCrawl:
+    """One breadth-first crawl of a site; run() returns the audit."""
+
+    def __init__(self, pool: HttpPool, start_url: str, max_depth: int, max_pages: int, max_links: int,
+                 scheduler: HostScheduler, cache: Optional[LinkStatusCache] = None):
+        self.pool = pool
+        self.start_url = start_url
+        self.origin = _origin(start_url)
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.max_links = max_links
+        self.scheduler = scheduler
+        self.checker = LinkChecker(pool, cache)
+        self.pages: List[Dict[str, Any]] = []
+        self._seen = {normalize_url(start_url)}
+        self._pages_queued = 1
+        self._links_queued = 0
+        self._skipped = 0
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        self._submit_page(_Page(self.start_url, '', 0))
+        try:
+            await self.scheduler.join()
+        finally:
+            self.scheduler.cancel()
+        return {
+            **self.checker.summary(),
+            'pages': self.pages,
+            'hosts': self.scheduler.stats(),
+            'crawl': {
+                'origin': self.origin,
+                'pages_crawled': len(self.pages),
+                'links_checked': self._links_queued,
+                'unique_urls': len(self._seen),
+                'links_skipped': self._skipped,
+                'max_depth': self.max_depth,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000),
+            },
+        }
+
+    def _submit_page(self, page: _Page) -> None:
+        self.scheduler.submit(normalize_url(page.url), partial(self._crawl_page, page))
+
+    async def _crawl_page(self, page: _Page) -> JobResult:
+        link_data = {'url': page.url, 'text': page.text}
+        key = normalize_url(page.url)
+        entry, fresh = self.checker.lookup(key, page=True)
+        if fresh:
+            self._cached_page(page, entry, 'hit')
+            return None
+        started = time.time()
+        status, links = None, []
+        try:
+            async with self.pool.stream('GET', page.url, headers=entry.validators() if entry else None,
+                                        follow_redirects=True, timeout=10) as response:
+                status = response.status_code
+                elapsed = time.time() - started
+                if status == 304 and entry is not None:
+                    self._cached_page(page, self.checker.revalidated(key, entry, elapsed), 'revalidated')
+                    return elapsed, True
+                if page.depth:
+                    self.checker.record(link_data, status, round(elapsed * 1000), cache='miss')
+                final_url = str(response.url)
+                if not page.depth:
+                    self._rebase(final_url)
+                content_type, _ = _content_type(response.headers.get('content-type', 'text/html'))
+                if status < 400 and 'html' in content_type and _origin(final_url) == self.origin:
+                    # Links are queued as they are parsed, while the rest of the page downloads.
+                    async for link in stream_links(response, final_url):
+                        links.append(link)
+                        self._discovered(page, link)
+        except Exception as e:
+            self.pages.append({'url': page.url, 'depth': page.depth, 'status': 'Error', 'links': len(links)})
+            if page.depth and status is None:
+                self.checker.record(link_data, 'Error', 0, str(e), cache='miss')
+            return time.time() - started, False
+        self.checker.store(key, status, elapsed, response.headers, links, final_url)
+        self._page_done(page, status, len(links), 'miss')
+        return elapsed, host_coped(status)
+
+    def _cached_page(self, page: _Page, entry: LinkStatus, cache: str) -> None:
+        # The page is unchanged since it was last crawled: its links are the cached ones.
+        if page.depth:
+            self.checker.record({'url': page.url, 'text': page.text}, entry.status, entry.time_ms, cache=cache)
+        elif entry.final_url:
+            self._rebase(entry.final_url)
+        for link in entry.links:
+            self._discovered(page, link)
+        self._page_done(page, entry.status, len(entry.links), cache)
+
+    def _rebase(self, final_url: str) -> None:
+        # The start URL may redirect (http -> https, example.com -> www.example.com): the
+        # site being audited is wherever it ended up.
+        self.origin = _origin(final_url)
+        self._seen.add(normalize_url(final_url))
+
+    def _page_done(self, page: _Page, status: Any, links: int, cache: str) -> None:
+        result = {'url': page.url, 'depth': page.depth, 'status': status, 'links': links}
+        if self.checker.cache is not None:
+            result['cache'] = cache
+        self.pages.append(result)
+
+    def _discovered(self, page: _Page, link: Dict[str, str]) -> None:
+        key = normalize_url(link['url'])
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        link = {'url': key, 'text': link['text']}
+        if page.depth < self.max_depth and self._pages_queued < self.max_pages and _origin(key) == self.origin:
+            self._pages_queued += 1
+            self._submit_page(_Page(key, link['text'], page.depth + 1))
+        elif self._links_queued < self.max_links:
+            self._links_queued += 1
+            self.scheduler.submit(key, partial(self.checker.check, link))
+        else:
+            self._skipped += 1
@@ -0,0 +1,315 @@
+# Pluggable storage for the four data stores attached to the app in create_app.
+#
+# STORAGE_BACKEND = 'memory' (default) keeps the per-process stores: column stores for the
+# CSV-uploaded performance data and plain lists for cloud/Mailchimp data. Nothing survives
+# a restart and every gunicorn worker has its own copy, hence the single-worker Dockerfile.
+#
+# STORAGE_BACKEND = 'sqlite' persists every store in one SQLite database in WAL mode
+# (readers don't block the writer, and vice versa), with indexes on report_date and the
+# name columns. Each worker keeps its in-memory store as a read mirror of the table, so
+# rollups, pagination and the other in-memory paths work unchanged. Writes go to SQLite
+# first (bulk executemany in one transaction). Once per request (or before every read
+# outside one), the mirror pulls in the rows committed since its last sync, including rows
+# written by other workers; a worker's own writes sync straight away. Every row carries a
+# change sequence number (seq) to make that tail query a single index range scan.
+#
+# Upserts (CSV uploads) are planned against the mirror while holding SQLite's write lock,
+# so no other worker can insert the same key in between: new keys are inserted and
+# changed rows are updated in place with a fresh seq. On sync, rows whose id the mirror
+# has already seen are applied as upserts by key, and the rest are appended. A UNIQUE
+# index on the key columns backs this up. Tables written before upserts existed may hold
+# duplicate keys: the first worker to open such a table moves all but the latest row of
+# each key to <table>_duplicates before creating the index, and logs how many it moved.
+
+import logging
+import os
+import sqlite3
+import threading
+from dataclasses import fields as dataclass_fields
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Tuple, get_type_hints
+
+from flask import g, has_app_context
+
+from .columnar import ColumnStore, AffiliateColumnStore, AdCampaignColumnStore, UpsertCounts
+from .models import AffiliatePerformanceRecord, AdCampaignPerformanceRecord, CloudServiceRecord, MailchimpRecord
+
+_SQL_TYPES = {date: 'TEXT', int: 'INTEGER', float: 'REAL', str: 'TEXT'}
+_SYNC_FETCH_SIZE = 10_000
+
+logger = logging.getLogger(__name__)
+
+
+def _field_types(record_type) -> List[Tuple[str, type]]:
+    """(name, base type) for each dataclass field, with Optional[X] unwrapped to X."""
+    hints = get_type_hints(record_type)
+    result = []
+    for f in dataclass_fields(record_type):
+        hint = hints[f.name]
+        args = [a for a in getattr(hint, '__args__', ()) if a is not type(None)]
+        result.append((f.name, args[0] if args else hint))
+    return result
+
+
+class SQLiteDatabase:
+    """One SQLite file shared by all stores, with a connection per thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: transactions are managed explicitly with BEGIN IMMEDIATE.
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+
+class SQLiteRecordStore:
+    """A table of record_type rows, mirrored into a local in-memory store for reads.
+
+    Supports the list-like interface the routes use (len, iteration, indexing, append,
+    extend). Other attribute access (rollups, columns, metrics, ...) is delegated to the
+    synced mirror.
+    """
+
+    def __init__(self, db: SQLiteDatabase, table: str, record_type, local_factory: Callable[[], Any],
+                 indexed_fields: Iterable[str]):
+        self._db = db
+        self._table = table
+        self._record_type = record_type
+        self._fields = _field_types(record_type)
+        self._names = [name for name, _ in self._fields]
+        self._date_fields = {i for i, (_, kind) in enumerate(self._fields) if kind is date}
+        self._local = local_factory()
+        self._last_seq = 0
+        self._max_id = 0
+        self._lock = threading.RLock()
+        self._create_schema(indexed_fields)
+        self._sync()
+
+    def _create_schema(self, indexed_fields: Iterable[str]) -> None:
+        conn = self._db.connection()
+        columns = ', '.join(f'{name} {_SQL_TYPES[kind]}' for name, kind in self._fields)
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {self._table} (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL, {columns})')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{self._table}_seq ON {self._table} (seq)')
+        for name in indexed_fields:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS ix_{self._table}_{name} ON {self._table} ({name})')
+        key_fields = getattr(self._local, 'key_fields', ())
+        if key_fields:
+            self._create_key_index(conn, key_fields)
+
+    def _create_key_index(self, conn: sqlite3.Connection, key_fields: Tuple[str, ...]) -> None:
+        """Creates the UNIQUE index on key_fields, first moving duplicate-key rows (all but
+        the latest of each key) to <table>_duplicates. Runs under the write lock, so only
+        one worker migrates a table."""
+        table, index_name = self._table, f'ux_{self._table}_key'
+        moved = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                                (index_name,)).fetchone():
+                duplicates = f'id NOT IN (SELECT MAX(id) FROM {table} GROUP BY {", ".join(key_fields)})'
+                moved = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {duplicates}').fetchone()[0]
+                if moved:
+                    conn.execute(f'CREATE TABLE IF NOT EXISTS {table}_duplicates AS SELECT * FROM {table} WHERE 0')
+                    conn.execute(f'INSERT INTO {table}_duplicates SELECT * FROM {table} WHERE {duplicates}')
+                    conn.execute(f'DELETE FROM {table} WHERE {duplicates}')
+                # Non-unique index from before the migration logged its changes.
+                conn.execute(f'DROP INDEX IF EXISTS ix_{table}_key')
+                conn.execute(f'CREATE UNIQUE INDEX {index_name} ON {table} ({", ".join(key_fields)})')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if moved:
+            logger.warning('Storage migration: moved %d rows with duplicate keys (%s) from %s to %s_duplicates',
+                           moved, ', '.join(key_fields), table, table)
+
+    # --- Writes ---
+
+    def _to_row(self, record: Any) -> Tuple:
+        values = [getattr(record, name) for name in self._names]
+        for i in self._date_fields:
+            values[i] = values[i].isoformat()
+        return tuple(values)
+
+    def extend(self, records: Iterable[Any], only_if_empty: bool = False) -> None:
+        """Bulk-inserts records in one transaction, then syncs the local mirror. With
+        only_if_empty, nothing is inserted if the table already has rows."""
+        rows = [self._to_row(record) for record in records]
+        if not rows:
+            return
+        conn = self._db.connection()
+        placeholders = ', '.join('?' * (len(self._names) + 1))
+        sql = f'INSERT INTO {self._table} (seq, {", ".join(self._names)}) VALUES ({placeholders})'
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not (only_if_empty and conn.execute(f'SELECT 1 FROM {self._table} LIMIT 1').fetchone()):
+                next_seq = conn.execute(f'SELECT COALESCE(MAX(seq), 0) FROM {self._table}').fetchone()[0] + 1
+                conn.executemany(sql, ((next_seq + i,) + row for i, row in enumerate(rows)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._sync()
+
+    def append(self, record: Any) -> None:
+        self.extend([record])
+
+    def upsert(self, records: Iterable[Any]) -> UpsertCounts:
+        """Inserts records with new keys and updates changed ones, in one transaction."""
+        local = self._local
+        batch = records if isinstance(records, type(local)) else type(local)(records)
+        key_fields = local.key_fields
+        value_fields = [name for name in self._names if name not in key_fields]
+        conn = self._db.connection()
+        with self._lock:
+            return self._upsert(conn, batch, key_fields, value_fields)
+
+    def _upsert(self, conn, batch, key_fields, value_fields) -> UpsertCounts:
+        local = self._local
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # With the write lock held, the synced mirror is the table's current state.
+            self._sync()
+            plan = local.plan_upsert(batch)
+            seq = conn.execute(f'SELECT COALESCE(MAX(seq), 0) FROM {self._table}').fetchone()[0]
+            if plan.inserts:
+                placeholders = ', '.join('?' * (len(self._names) + 1))
+                conn.executemany(
+                    f'INSERT INTO {self._table} (seq, {", ".join(self._names)}) VALUES ({placeholders})',
+                    ((seq + n + 1,) + self._to_row(batch.row(i)) for n, i in enumerate(plan.inserts)))
+                seq += len(plan.inserts)
+            if plan.updates:
+                assignments = ', '.join(f'{name} = ?' for name in ['seq'] + value_fields)
+                match = ' AND '.join(f'{name} IS ?' for name in key_fields)
+                position = {name: i for i, name in enumerate(self._names)}
+                rows = []
+                for n, (_, i) in enumerate(plan.updates):
+                    row = self._to_row(batch.row(i))
+                    rows.append((seq + n + 1,) + tuple(row[position[name]] for name in value_fields)
+                                + tuple(row[position[name]] for name in key_fields))
+                conn.executemany(f'UPDATE {self._table} SET {assignments} WHERE {match}', rows)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        self._sync()
+        return UpsertCounts(inserted=len(plan.inserts), updated=len(plan.updates), skipped=plan.skipped)
+
+    # --- Mirror ---
+
+    def _sync(self) -> None:
+        """Pulls rows committed since the last sync into the local mirror."""
+        conn = self._db.connection()
+        with self._lock:
+            latest = conn.execute(f'SELECT MAX(seq) FROM {self._table}').fetchone()[0]
+            if latest is None or latest <= self._last_seq:
+                return
+            cursor = conn.execute(
+                f'SELECT seq, id, {", ".join(self._names)} FROM {self._table} WHERE seq > ? ORDER BY seq',
+                (self._last_seq,))
+            while True:
+                rows = cursor.fetchmany(_SYNC_FETCH_SIZE)
+                if not rows:
+                    break
+                self._apply(rows)
+                self._last_seq = rows[-1][0]
+
+    def _apply(self, rows: List[Tuple]) -> None:
+        # Rows with an id the mirror has seen were updated since; the others are new.
+        updated = [row for row in rows if row[1] <= self._max_id]
+        if updated:
+            rows = [row for row in rows if row[1] > self._max_id]
+        self._max_id = max([self._max_id] + [row[1] for row in rows])
+        if isinstance(self._local, ColumnStore):
+            if rows:
+                self._local.extend_columns(len(rows), **self._column_lists(rows))
+            if updated:
+                batch = type(self._local)()
+                batch.extend_columns(len(updated), **self._column_lists(updated))
+                self._local.upsert(batch)
+        elif rows:
+            columns = list(zip(*rows))[2:]
+            for i in self._date_fields:
+                columns[i] = [date.fromisoformat(v) for v in columns[i]]
+            self._local.extend(self._record_type(*values) for values in zip(*columns))
+
+    def _column_lists(self, rows: List[Tuple]) -> Dict[str, list]:
+        columns = list(zip(*rows))[2:]
+        by_name = {}
+        for i, name in enumerate(self._names):
+            values = columns[i]
+            if i in self._date_fields:
+                values = [date.fromisoformat(v).toordinal() for v in values]
+            by_name[name] = list(values)
+        return by_name
+
+    def mirror(self):
+        """The synced local store. Within an app context (a request) it is synced once, so
+        the many reads a page makes cost one query rather than one each."""
+        if not has_app_context():
+            self._sync()
+        else:
+            synced = g.setdefault('storage_synced', set())
+            if self not in synced:
+                self._sync()
+                synced.add(self)
+        return self._local
+
+    def __len__(self) -> int:
+        return len(self.mirror())
+
+    def __iter__(self):
+        return iter(self.mirror())
+
+    def __getitem__(self, index):
+        return self.mirror()[index]
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.mirror(), name)
+
+    def __repr__(self) -> str:
+        return f"<SQLiteRecordStore {self._table} rows={len(self._local)}>"
+
+
+def init_storage(app) -> None:
+    """Attaches affiliate_data_store, ad_campaign_data_store, cloud_service_data_store and
+    mailchimp_data_store to app, using the configured STORAGE_BACKEND."""
+    top_k = app.config['AFFILIATE_TOP_K']
+    backend = app.config['STORAGE_BACKEND']
+    # The cloud and Mailchimp pages show mock data until real data is loaded.
+    from .services import get_mailchimp_campaigns_mock, get_mock_cloud_service_data
+    if backend == 'memory':
+        app.affiliate_data_store = AffiliateColumnStore(top_k=top_k)
+        app.ad_campaign_data_store = AdCampaignColumnStore()
+        app.cloud_service_data_store = get_mock_cloud_service_data()
+        app.mailchimp_data_store = get_mailchimp_campaigns_mock()
+        return
+    if backend != 'sqlite':
+        raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'memory' or 'sqlite')")
+
+    path = app.config.get('STORAGE_SQLITE_PATH') or os.path.join(app.instance_path, 'ainexus.sqlite3')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = SQLiteDatabase(path)
+    app.storage_db = db
+    app.affiliate_data_store = SQLiteRecordStore(
+        db, 'affiliate_performance', AffiliatePerformanceRecord, lambda: AffiliateColumnStore(top_k=top_k),
+        ['report_date', 'affiliate_name'])
+    app.ad_campaign_data_store = SQLiteRecordStore(
+        db, 'ad_campaign_performance', AdCampaignPerformanceRecord, AdCampaignColumnStore,
+        ['report_date', 'campaign_name', 'platform'])
+    app.cloud_service_data_store = SQLiteRecordStore(
+        db, 'cloud_service', CloudServiceRecord, list, ['report_date', 'service_name', 'provider'])
+    app.mailchimp_data_store = SQLiteRecordStore(
+        db, 'mailchimp_campaign', MailchimpRecord, list, ['report_date', 'campaign_id'])
+    # Checked and inserted in one write transaction, so only the first worker seeds.
+    app.cloud_service_data_store.extend(get_mock_cloud_service_data(), only_if_empty=True)
+    app.mailchimp_data_store.extend(get_mailchimp_campaigns_mock(), only_if_empty=True)
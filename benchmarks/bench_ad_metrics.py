@@ -0,0 +1,79 @@
+"""Latency benchmark for /api/ads/metrics: 90-day window queries over a large ad campaign store.
+
+Fills an AdCampaignColumnStore with one row per campaign per day, then times the first
+query for each grouping (which builds its index) and repeated queries on random windows.
+It also checks one window's totals against a plain loop over the rows.
+
+    python benchmarks/bench_ad_metrics.py --rows 3000000 --campaigns 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.columnar import AdCampaignColumnStore  # noqa: E402
+from app.queries import MetricsQuery, ad_campaign_metrics  # noqa: E402
+
+PLATFORMS = ['Google Ads', 'Facebook Ads', 'TikTok Ads', None]
+
+
+def make_store(rows, campaigns, rng):
+    start = date(2020, 1, 1).toordinal()
+    store = AdCampaignColumnStore()
+    store.extend_columns(
+        rows,
+        report_date=[start + i // campaigns for i in range(rows)],
+        campaign_name=[f"campaign_{i % campaigns}" for i in range(rows)],
+        platform=[PLATFORMS[i % campaigns % len(PLATFORMS)] for i in range(rows)],
+        impressions=[rng.randint(0, 100000) for _ in range(rows)],
+        clicks=[rng.randint(0, 5000) for _ in range(rows)],
+        cost=[round(rng.uniform(0, 500), 2) for _ in range(rows)],
+        conversions=[rng.randint(0, 200) for _ in range(rows)],
+    )
+    return store, date.fromordinal(start), (rows - 1) // campaigns + 1
+
+
+def check(store, query):
+    result = ad_campaign_metrics(store, query)['totals']
+    start, end = query.start.toordinal(), query.end.toordinal()
+    dates, clicks = store.column('report_date').values, store.column('clicks').values
+    expected = sum(c for d, c in zip(dates, clicks) if start <= d <= end)
+    assert result['clicks'] == expected, "indexed totals differ from a full scan"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--campaigns', type=int, default=2000)
+    parser.add_argument('--window', type=int, default=90, help='days per query')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    store, first_day, days = make_store(args.rows, args.campaigns, rng)
+    print(f"{args.rows:,} rows, {args.campaigns:,} campaigns, {days:,} days, {args.window}-day windows")
+    for group_by in [(), ('platform',), ('platform', 'campaign_name')]:
+        started = time.perf_counter()
+        ad_campaign_metrics(store, MetricsQuery(group_by=group_by))
+        build_secs = time.perf_counter() - started
+        timings = []
+        for _ in range(args.queries):
+            start = first_day + timedelta(days=rng.randrange(max(1, days - args.window)))
+            query = MetricsQuery(start, start + timedelta(days=args.window - 1), group_by)
+            started = time.perf_counter()
+            ad_campaign_metrics(store, query)
+            timings.append(time.perf_counter() - started)
+        label = ','.join(group_by) or '(totals only)'
+        print(f"  {label:24} index build {build_secs:6.2f}s   query median {statistics.median(timings) * 1000:7.2f}ms"
+              f"   max {max(timings) * 1000:7.2f}ms")
+    check(store, query)
+
+
+if __name__ == '__main__':
+    main()
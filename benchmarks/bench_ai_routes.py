@@ -0,0 +1,149 @@
+"""Latency and throughput of the AI routes, driven over HTTP against the local stand-in model.
+
+By default the app is served in-process (werkzeug, threaded) with GEMINI_BACKEND='local', so
+no API key or network is needed. --url targets a server that is already running instead,
+e.g. gunicorn started with GEMINI_BACKEND=local and AI_LOCAL_MODEL='{"first_token_ms": 300}'.
+
+Each scenario sends --requests requests from --concurrency client threads and reports
+requests/sec, errors and p50/p95/p99 latency (time to first byte as well for streaming
+routes). --repeat is the fraction of requests that reuse an earlier prompt, which is
+what the response cache and request coalescing act on.
+
+    python benchmarks/bench_ai_routes.py --requests 200 --concurrency 16 --first-token-ms 300
+    python benchmarks/bench_ai_routes.py --url http://localhost:8080 --scenarios script marketer-post
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# name -> (path, request body for a prompt, streams)
+SCENARIOS = {
+    'script': ('/api/generate-script', lambda p: {'prompt': p}, False),
+    'script-stream': ('/api/generate-script', lambda p: {'prompt': p, 'stream': True}, True),
+    'website': ('/ai-services/software-engineer', lambda p: {'action': 'website', 'prompt': p}, False),
+    'game-stream': ('/ai-services/software-engineer', lambda p: {'action': 'game', 'prompt': p, 'stream': True}, True),
+    'debugger': ('/ai-services/debugger', lambda p: {'code': f'def f():\n    return "{p}"', 'language': 'python'}, False),
+    'marketer-post': ('/ai-services/marketer', lambda p: {'action': 'post', 'prompt': p}, False),
+    'marketer-ads': ('/ai-services/marketer', lambda p: {'action': 'ads', 'prompt': p}, False),
+    'batch': ('/ai-services/batch', lambda p: {'tasks': [{'type': 'social_post', 'description': f'{p} #{i}'}
+                                                         for i in range(10)]}, False),
+}
+
+
+def serve_locally(args):
+    """Starts the app with the local backend on a free port; returns (base URL, server)."""
+    from werkzeug.serving import make_server
+    from app import create_app
+    app = create_app({
+        'GEMINI_BACKEND': 'local',
+        'AI_LOCAL_MODEL': {'distribution': args.distribution, 'first_token_ms': args.first_token_ms,
+                           'spread': args.spread, 'chunk_ms': args.chunk_ms, 'chunks': args.chunks,
+                           'error_rate': args.error_rate, 'seed': args.seed},
+        'AI_RATE_LIMIT_RPM': args.rpm,
+        'AI_CACHE_ENABLED': not args.no_cache,
+    })
+    app.logger.disabled = True
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def prompts(count, repeat, rng, label):
+    """count prompts of which about `repeat` reuse an earlier one."""
+    issued = []
+    for n in range(count):
+        if issued and rng.random() < repeat:
+            issued.append(rng.choice(issued))
+        else:
+            issued.append(f'{label} prompt {n} {rng.getrandbits(32)}')
+    return issued
+
+
+def send(client, path, body, streams):
+    """(latency seconds, time to first byte seconds, ok) for one request."""
+    started = time.perf_counter()
+    if not streams:
+        response = client.post(path, json=body)
+        elapsed = time.perf_counter() - started
+        # The services report model failures as "Error: ..." text in a 200 response.
+        ok = response.status_code == 200 and 'error' not in response.json() and 'Error: Could not generate' not in response.text
+        return elapsed, elapsed, ok
+    first_byte, ok = None, True
+    with client.stream('POST', path, json=body) as response:
+        for line in response.iter_lines():
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            if line.startswith('event: error'):
+                ok = False
+        ok = ok and response.status_code == 200
+    return time.perf_counter() - started, first_byte, ok
+
+
+def percentiles(samples):
+    if len(samples) < 2:
+        return [samples[0] * 1000] * 3 if samples else [float('nan')] * 3
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return [cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000]
+
+
+def run_scenario(base_url, name, args, rng):
+    path, body, streams = SCENARIOS[name]
+    batch = prompts(args.requests, args.repeat, rng, name)
+    with httpx.Client(base_url=base_url, timeout=args.timeout,
+                      limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda p: send(client, path, body(p), streams), batch))
+        wall = time.perf_counter() - started
+    latencies = [r[0] for r in results]
+    p50, p95, p99 = percentiles(latencies)
+    ttfb = f"{percentiles([r[1] for r in results])[0]:9.1f}" if streams else f"{'':>9}"
+    errors = sum(1 for r in results if not r[2])
+    print(f"  {name:14} {len(results) / wall:8.1f} {errors:6d}  {p50:9.1f} {p95:9.1f} {p99:9.1f}  {ttfb}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='base URL of a running server (default: serve the app in-process)')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--repeat', type=float, default=0.0, help='fraction of requests reusing a prompt')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--seed', type=int, default=42)
+    local = parser.add_argument_group('in-process server (ignored with --url)')
+    local.add_argument('--distribution', choices=('fixed', 'uniform', 'lognormal'), default='lognormal')
+    local.add_argument('--first-token-ms', type=float, default=300)
+    local.add_argument('--spread', type=float, default=0.5)
+    local.add_argument('--chunk-ms', type=float, default=10)
+    local.add_argument('--chunks', type=int, default=20)
+    local.add_argument('--error-rate', type=float, default=0.0)
+    local.add_argument('--rpm', type=int, default=0, help='provider rate limit (0: unlimited)')
+    local.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    base_url, server = (args.url, None) if args.url else serve_locally(args)
+    print(f"{base_url}: {args.requests} requests per scenario, concurrency {args.concurrency}, repeat {args.repeat:.0%}")
+    print(f"  {'scenario':14} {'req/s':>8} {'errors':>6}  {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  {'ttfb p50':>9}")
+    try:
+        for name in args.scenarios:
+            run_scenario(base_url, name, args, rng)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
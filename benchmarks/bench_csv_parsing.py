@@ -0,0 +1,83 @@
+"""Rows/sec benchmark: row-by-row CSV parsers vs. the column-at-a-time batch parsers.
+
+Generates a synthetic export in memory, parses it with parse_*_csv (one dataclass per
+row) and parse_*_csv_columns (columnar batches), checks that both produce the same
+records and error messages, and prints throughput for each.
+
+    python benchmarks/bench_csv_parsing.py --rows 500000 --invalid 0.01
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.services import (  # noqa: E402
+    parse_affiliate_csv, parse_affiliate_csv_columns,
+    parse_ad_campaign_csv, parse_ad_campaign_csv_columns,
+)
+
+
+def make_affiliate_csv(rows, invalid_rate, rng):
+    start = date(2024, 1, 1)
+    out = io.StringIO()
+    out.write('report_date,affiliate_name,impressions,clicks,conversions,commission_amount\n')
+    for i in range(rows):
+        clicks = 'n/a' if rng.random() < invalid_rate else str(rng.randint(0, 5000))
+        out.write(f"{start + timedelta(days=i % 365)},affiliate_{rng.randint(1, 500)},"
+                  f"{rng.randint(0, 100000)},{clicks},{rng.randint(0, 200)},{rng.uniform(0, 1000):.2f}\n")
+    return out.getvalue()
+
+
+def make_ad_campaign_csv(rows, invalid_rate, rng):
+    start = date(2024, 1, 1)
+    platforms = ['Google Ads', 'Facebook Ads', 'TikTok Ads', '']
+    out = io.StringIO()
+    out.write('report_date,campaign_name,platform,impressions,clicks,cost,conversions\n')
+    for i in range(rows):
+        cost = 'free' if rng.random() < invalid_rate else f"{rng.uniform(0, 500):.2f}"
+        out.write(f"{start + timedelta(days=i % 365)},campaign_{rng.randint(1, 2000)},{rng.choice(platforms)},"
+                  f"{rng.randint(0, 100000)},{rng.randint(0, 5000)},{cost},{rng.randint(0, 200)}\n")
+    return out.getvalue()
+
+
+def timed(func, text):
+    started = time.perf_counter()
+    result = func(io.StringIO(text))
+    return result, time.perf_counter() - started
+
+
+def run(label, text, rows, row_parser, column_parser):
+    (records, errors), row_secs = timed(row_parser, text)
+    (store, column_errors), column_secs = timed(column_parser, text)
+    assert errors == column_errors, "batch parser error messages differ from the row parser"
+    assert repr(records) == repr(list(store)), "batch parser records differ from the row parser"
+    print(f"{label}: {rows:,} rows, {len(errors):,} errors")
+    print(f"  row-by-row parser : {rows / row_secs:12,.0f} rows/sec ({row_secs:.2f}s)")
+    print(f"  batch parser      : {rows / column_secs:12,.0f} rows/sec ({column_secs:.2f}s)")
+    print(f"  speedup           : {row_secs / column_secs:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--invalid', type=float, default=0.01, help='fraction of rows with an invalid numeric value')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    app = create_app({'TESTING': True})
+    with app.app_context():
+        run('affiliate', make_affiliate_csv(args.rows, args.invalid, rng), args.rows,
+            parse_affiliate_csv, parse_affiliate_csv_columns)
+        run('ad campaign', make_ad_campaign_csv(args.rows, args.invalid, rng), args.rows,
+            parse_ad_campaign_csv, parse_ad_campaign_csv_columns)
+
+
+if __name__ == '__main__':
+    main()
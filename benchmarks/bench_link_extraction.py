@@ -0,0 +1,147 @@
+"""Link extraction benchmark for the system analyzer: BeautifulSoup vs lxml's pull parser.
+
+Builds a large HTML page and times, for each extractor, the full parse and the time until
+the first link is available. "bs4 html.parser" is the analyzer's old whole-document path;
+"lxml stream" feeds the page in network-sized chunks to app.site_audit.LinkExtractor.
+Both must find the same links.
+
+Then it serves the page from a local server that sends it at --kbps and compares, through
+the shared HTTP pool, download-then-parse against parsing while the page streams in.
+
+    python benchmarks/bench_link_extraction.py --links 20000 --filler 200 --kbps 20000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+from app.http_pool import HttpPool  # noqa: E402
+from app.site_audit import LinkExtractor, stream_links  # noqa: E402
+
+BASE_URL = 'https://example.com/blog/'
+CHUNK = 16 * 1024
+
+
+def make_page(links, filler):
+    words = ' '.join(['lorem ipsum dolor sit amet'] * (filler // 26 + 1))[:filler]
+    rows = []
+    for i in range(links):
+        href = [f'/post/{i}', f'https://cdn{i % 7}.example.net/a/{i}?x=1', f'../tag/{i % 50}#top',
+                f'mailto:team{i}@example.com'][i % 4]
+        rows.append(f'<div class="card"><p>{words}</p><a href="{href}" class="l"><span>Post</span> {i}</a></div>')
+    return ('<!DOCTYPE html><html><head><title>Big page</title></head><body>'
+            + '\n'.join(rows) + '</body></html>').encode()
+
+
+def bs4_links(content, base_url, parser='html.parser'):
+    links = []
+    for a in BeautifulSoup(content, parser).find_all('a', href=True):
+        full_url = urljoin(base_url, a['href'])
+        if urlparse(full_url).scheme in ('http', 'https'):
+            links.append({'url': full_url, 'text': a.get_text(strip=True)})
+    return links
+
+
+def lxml_stream_links(content, base_url, on_first):
+    extractor = LinkExtractor(base_url)
+    links = []
+    for start in range(0, len(content), CHUNK):
+        found = extractor.feed(content[start:start + CHUNK])
+        if found and not links:
+            on_first()
+        links.extend(found)
+    return links + extractor.close()
+
+
+def time_parsers(content):
+    results = {}
+    for name, parser in [('bs4 html.parser', 'html.parser'), ('bs4 lxml', 'lxml')]:
+        started = time.perf_counter()
+        links = bs4_links(content, BASE_URL, parser)
+        elapsed = time.perf_counter() - started
+        # A whole-document parse has no link until it is done.
+        results[name] = (links, elapsed, elapsed)
+    first = []
+    started = time.perf_counter()
+    links = lxml_stream_links(content, BASE_URL, lambda: first.append(time.perf_counter()))
+    results['lxml stream'] = (links, time.perf_counter() - started, first[0] - started)
+    return results
+
+
+def serve(content, kbps):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            delay = CHUNK / (kbps * 1024)
+            for start in range(0, len(content), CHUNK):
+                self.wfile.write(content[start:start + CHUNK])
+                time.sleep(delay)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/'
+
+
+async def over_network(pool, url):
+    started = time.perf_counter()
+    response = await pool.get(url)
+    links = bs4_links(response.content, url)
+    buffered = time.perf_counter() - started
+
+    started, first, count = time.perf_counter(), None, 0
+    async with pool.stream('GET', url) as response:
+        async for _ in stream_links(response, url):
+            if first is None:
+                first = time.perf_counter() - started
+            count += 1
+    streamed = time.perf_counter() - started
+    assert count == len(links), f"streamed {count} links, buffered {len(links)}"
+    return len(links), buffered, first, streamed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--links', type=int, default=20000)
+    parser.add_argument('--filler', type=int, default=200, help='characters of text per link')
+    parser.add_argument('--kbps', type=float, default=20000, help='download speed of the local server, KiB/s')
+    args = parser.parse_args()
+
+    content = make_page(args.links, args.filler)
+    print(f"page: {len(content) / 1024 / 1024:.1f} MiB, {args.links:,} anchors")
+    results = time_parsers(content)
+    expected = results['bs4 html.parser'][0]
+    print(f"{'extractor':<18}{'links':>8}{'total ms':>11}{'first link ms':>15}")
+    for name, (links, total, first) in results.items():
+        assert links == expected, f"{name} found different links"
+        print(f"{name:<18}{len(links):>8,}{total * 1000:>11.1f}{first * 1000:>15.1f}")
+
+    server, url = serve(content, args.kbps)
+    pool = HttpPool(http2=False)
+    try:
+        count, buffered, first, streamed = asyncio.run(over_network(pool, url))
+    finally:
+        pool.close()
+        server.shutdown()
+    print(f"\nover HTTP at {args.kbps:,.0f} KiB/s ({count:,} links):")
+    print(f"  download, then bs4 html.parser: first link after {buffered * 1000:.0f} ms")
+    print(f"  lxml while downloading:         first link after {first * 1000:.0f} ms, all after {streamed * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
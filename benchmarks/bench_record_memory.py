@@ -0,0 +1,100 @@
+"""Bytes per stored affiliate record: mutable dataclasses vs. compact records vs. the column store.
+
+Each measurement runs in a fresh subprocess that parses a synthetic export (streamed from
+a generator, so the CSV text itself is never held) and reports the growth of its resident
+set size divided by the number of rows kept:
+
+  dataclass  the parser as it was: one AffiliatePerformanceData per row, with its own
+             name string and date object
+  compact    parse_affiliate_csv: slotted, frozen AffiliatePerformanceRecord with interned
+             names and shared dates
+  columnar   parse_affiliate_csv_columns: AffiliateColumnStore
+
+    python benchmarks/bench_record_memory.py --rows 1000000 10000000
+"""
+import argparse
+import csv
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+KINDS = ('dataclass', 'compact', 'columnar')
+
+
+def csv_lines(rows, seed=42):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    yield 'report_date,affiliate_name,impressions,clicks,conversions,commission_amount\n'
+    for i in range(rows):
+        yield (f"{start + timedelta(days=i % 365)},affiliate_{rng.randint(1, 500)},{rng.randint(0, 100000)},"
+               f"{rng.randint(0, 5000)},{rng.randint(0, 200)},{rng.uniform(0, 1000):.2f}\n")
+
+
+def parse_as_dataclasses(lines):
+    """The row parser before compact records: strptime and a fresh name string per row."""
+    from app.models import AffiliatePerformanceData
+    records = []
+    for row in csv.DictReader(lines):
+        records.append(AffiliatePerformanceData(
+            report_date=datetime.strptime(row['report_date'], '%Y-%m-%d').date(),
+            affiliate_name=row['affiliate_name'].strip(),
+            impressions=int(row['impressions']), clicks=int(row['clicks']),
+            conversions=int(row['conversions']), commission_amount=float(row['commission_amount'])))
+    return records
+
+
+def resident_bytes():
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(kind, rows):
+    """Runs in the subprocess: parse rows records of one kind and return bytes per record."""
+    from app import create_app
+    from app.services import parse_affiliate_csv, parse_affiliate_csv_columns
+    app = create_app({'TESTING': True})
+    with app.app_context():
+        gc.collect()
+        before = resident_bytes()
+        if kind == 'dataclass':
+            stored = parse_as_dataclasses(csv_lines(rows))
+        elif kind == 'compact':
+            stored, errors = parse_affiliate_csv(csv_lines(rows))
+        else:
+            stored, errors = parse_affiliate_csv_columns(csv_lines(rows))
+        gc.collect()
+        used = resident_bytes() - before
+    assert len(stored) == rows
+    return used / rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    parser.add_argument('--measure', nargs=2, metavar=('KIND', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        kind, rows = args.measure
+        print(json.dumps(measure(kind, int(rows))))
+        return
+
+    print(f"{'rows':>12}  " + ''.join(f"{kind:>14}" for kind in args.kinds) + "   (bytes/record, RSS growth)")
+    for rows in args.rows:
+        results = []
+        for kind in args.kinds:
+            run = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', kind, str(rows)],
+                                 capture_output=True, text=True)
+            results.append(f"{float(run.stdout.strip().splitlines()[-1]):14.1f}" if run.returncode == 0 else f"{'failed':>14}")
+        print(f"{rows:12,}  " + ''.join(results))
+
+
+if __name__ == '__main__':
+    main()
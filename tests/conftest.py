@@ -0,0 +1,11 @@
+import pytest
+
+from app import create_app
+
+# The local stand-in model (app/ai_local.py) with no latency, so AI routes run without an API key.
+LOCAL_MODEL = {'distribution': 'fixed', 'first_token_ms': 0, 'chunk_ms': 0, 'chunks': 4, 'seed': 0}
+
+
+@pytest.fixture
+def local_app():
+    return create_app({'TESTING': True, 'GEMINI_BACKEND': 'local', 'AI_LOCAL_MODEL': LOCAL_MODEL})
@@ -0,0 +1,42 @@
+from app.ratelimit import TokenBucket
+
+
+def _batch(app, tasks):
+    return app.test_client().post('/ai-services/batch', json={'tasks': tasks})
+
+
+def test_results_in_task_order_with_per_task_errors(local_app):
+    tasks = [
+        {'type': 'generate', 'prompt': 'first'},
+        {'type': 'nope'},
+        {'type': 'social_post', 'description': 'A summer sale'},
+        {'type': 'debug', 'code': 'print(1)'},
+        'not an object',
+        {'type': 'generate', 'prompt': 'last'},
+    ]
+    body = _batch(local_app, tasks).get_json()
+    results = body['results']
+    assert [r['index'] for r in results] == list(range(len(tasks)))
+    assert [r['type'] for r in results] == ['generate', 'nope', 'social_post', 'debug', None, 'generate']
+    assert [('error' in r) for r in results] == [False, True, False, True, True, False]
+    assert 'Unknown task type' in results[1]['error'] and 'language' in results[3]['error']
+    assert body['errors'] == 3
+    assert results[0]['result'] and results[0]['result'] != results[5]['result']
+
+
+def test_rejects_bad_batches(local_app):
+    local_app.config['AI_BATCH_MAX_TASKS'] = 2
+    assert _batch(local_app, []).status_code == 400
+    assert _batch(local_app, {'type': 'generate'}).status_code == 400
+    response = _batch(local_app, [{'type': 'generate', 'prompt': str(i)} for i in range(3)])
+    assert response.status_code == 400 and 'At most 2' in response.get_json()['error']
+
+
+def test_model_calls_share_the_app_rate_limiter(local_app):
+    local_app.ai_rate_limiter = TokenBucket(rate=0.001, capacity=10)
+    tasks = [{'type': 'generate', 'prompt': f'variant {i}'} for i in range(3)]
+    _batch(local_app, tasks)
+    assert local_app.ai_rate_limiter.stats()['tokens'] == 7
+    # Repeats are answered from the response cache and take no tokens.
+    _batch(local_app, tasks)
+    assert local_app.ai_rate_limiter.stats()['tokens'] == 7
@@ -0,0 +1,127 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import ai_cache
+from app.ai_cache import ResponseCache, SingleFlight, cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ai_cache, 'time', SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.put('k', 'answer')
+    clock[0] += 59
+    assert cache.get('k') == 'answer'
+    clock[0] += 2
+    assert cache.get('k') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_evicts_least_recently_used_to_stay_within_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.put('a', 'xxxx')
+    cache.put('b', 'yyyy')
+    assert cache.get('a') == 'xxxx'  # b is now the least recently used
+    cache.put('c', 'zzzz')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'xxxx' and cache.get('c') == 'zzzz'
+    assert cache.stats()['bytes'] == 8 and cache.evictions == 1
+    cache.put('big', 'w' * 11)  # larger than the whole cache: not stored, nothing evicted
+    assert cache.get('big') is None and cache.stats()['entries'] == 2
+
+
+def test_evicts_beyond_max_entries():
+    cache = ResponseCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, key)
+    assert [cache.get(key) for key in 'abc'] == [None, 'b', 'c']
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / 'cache' / 'ai.sqlite3')
+    ResponseCache(path=path).put('k', 'answer')
+    cache = ResponseCache(path=path)  # e.g. after a restart, or in another worker
+    assert cache.get('k') == 'answer'
+    assert cache.get('k') == 'answer'
+    assert (cache.disk_hits, cache.hits, cache.misses) == (1, 1, 0)
+    assert cache.stats()['disk_entries'] == 1
+
+
+def test_expired_disk_rows_are_not_served(tmp_path, clock):
+    path = str(tmp_path / 'ai.sqlite3')
+    ResponseCache(ttl=60, path=path).put('k', 'answer')
+    clock[0] += 61
+    assert ResponseCache(ttl=60, path=path).get('k') is None
+
+
+def test_cache_key_separates_parts():
+    assert cache_key('m', 'ab', b'c') != cache_key('m', 'a', b'bc')
+    assert cache_key('m', 'p') == cache_key('m', 'p', None) != cache_key('other', 'p')
+
+
+def _concurrent(flight, key, followers, func):
+    """Runs func as the leader for key and `followers` callers behind it; returns each
+    caller's (result, error), the leader's first."""
+    outcomes = [None] * (followers + 1)
+
+    def call(i):
+        try:
+            outcomes[i] = (flight.do(key, func), None)
+        except Exception as e:
+            outcomes[i] = (None, e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(followers + 1)]
+    threads[0].start()
+    while flight.stats()['in_flight'] == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['waiting'] < followers:
+        time.sleep(0.001)
+    return threads, outcomes
+
+
+def test_single_flight_shares_the_leader_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = RuntimeError('quota exceeded')
+
+    def fail():
+        release.wait()
+        raise error
+
+    threads, outcomes = _concurrent(flight, 'k', 4, fail)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert all(result is None and e is error for result, e in outcomes)
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0, 'waiting': 0}
+    # The error is not remembered: the next call runs again.
+    assert flight.do('k', lambda: 'ok') == 'ok' and flight.calls == 2
+
+
+def test_single_flight_shares_the_result_per_key():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def answer():
+        calls.append(1)
+        release.wait()
+        return 'shared'
+
+    threads, outcomes = _concurrent(flight, 'k', 3, answer)
+    assert flight.do('other', lambda: 'separate') == 'separate'
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert outcomes == [('shared', None)] * 4 and len(calls) == 1
@@ -0,0 +1,74 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from app.ai_images import ImagePipeline
+
+
+def _encoded(size, mode='RGB', fmt='PNG'):
+    out = io.BytesIO()
+    Image.new(mode, size, (200, 80, 40, 128)[:len(mode)]).save(out, format=fmt)
+    return base64.b64encode(out.getvalue()).decode()
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = ImagePipeline(max_side=64, cache_entries=2)
+    yield pipeline
+    pipeline.shutdown()
+
+
+def test_repeated_image_is_processed_once(pipeline):
+    payload = _encoded((200, 100), fmt='JPEG')
+    first = pipeline.prepare('data:image/jpeg;base64,' + payload)
+    # The same bytes as a bare base64 string hit the cache too.
+    assert pipeline.prepare(payload) is first
+    assert pipeline.stats()['processed'] == 1 and pipeline.dedupe_hits == 1
+
+
+def test_dedupe_cache_is_bounded(pipeline):
+    images = [_encoded((10 + i, 10)) for i in range(3)]
+    for payload in images:
+        pipeline.prepare(payload)
+    pipeline.prepare(images[0])  # evicted by the third image
+    assert pipeline.dedupe_hits == 0 and pipeline.processed == 4
+    pipeline.prepare(images[2])
+    assert pipeline.dedupe_hits == 1 and pipeline.stats()['cached'] == 2
+
+
+def test_large_images_are_downscaled(pipeline):
+    photo = pipeline.prepare(_encoded((640, 320), fmt='JPEG'))
+    assert (photo.mime_type, photo.width, photo.height) == ('image/jpeg', 64, 32)
+    transparent = pipeline.prepare(_encoded((320, 320), mode='RGBA'))
+    assert (transparent.mime_type, transparent.width) == ('image/png', 64)
+    assert Image.open(io.BytesIO(transparent.data)).mode == 'RGBA'
+    assert pipeline.resized == 2
+
+
+def test_small_images_pass_through(pipeline):
+    payload = _encoded((32, 16))
+    image = pipeline.prepare(payload)
+    assert image.mime_type == 'image/png' and image.data == base64.b64decode(payload)
+    assert image.as_part() == {'mime_type': 'image/png', 'data': image.data}
+
+
+def test_bad_input_is_rejected():
+    pipeline = ImagePipeline(max_source_bytes=1024)
+    try:
+        with pytest.raises(ValueError, match='exceeds'):
+            pipeline.prepare('A' * 4096)
+        with pytest.raises(ValueError, match='base64'):
+            pipeline.prepare('data:image/png;base64,abc')
+    finally:
+        pipeline.shutdown()
+
+
+def test_prompt_images_are_deduped_across_requests(local_app):
+    client = local_app.test_client()
+    body = {'prompt': 'A product video', 'image': 'data:image/png;base64,' + _encoded((300, 300))}
+    first = client.post('/api/generate-script', json=body).get_json()['response']
+    assert client.post('/api/generate-script', json=body).get_json()['response'] == first
+    assert local_app.ai_images.stats()['processed'] == 1 and local_app.ai_images.dedupe_hits == 1
+    assert local_app.ai_cache.hits == 1
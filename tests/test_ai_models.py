@@ -0,0 +1,56 @@
+import pytest
+
+from app.ai_local import LocalModel, LocalModelOptions
+from app.ai_models import GeminiModelRegistry, ModelSpec, api_key_configured
+from app.services import generate_content_with_gemini
+
+
+def _registry(**specs):
+    return GeminiModelRegistry(None, specs or {'default': 'm1'}, backend='local',
+                               local_options=LocalModelOptions(distribution='fixed', first_token_ms=0, chunk_ms=0))
+
+
+def test_get_builds_each_alias_once():
+    registry = _registry(default='m1', code={'model_name': 'm2', 'generation_config': {'temperature': 0}})
+    model = registry.get()
+    assert isinstance(model, LocalModel) and model.model_name == 'm1'
+    assert registry.get('default') is model
+    assert registry.get('code').model_name == 'm2'
+    assert registry.aliases() == {'default': 'm1', 'code': 'm2'}
+
+
+def test_register_replaces_the_model_behind_an_alias():
+    registry = _registry()
+    first = registry.get()
+    registry.register('default', ModelSpec('m3', system_instruction='terse'))
+    assert registry.get() is not first and registry.get().model_name == 'm3'
+    assert registry.spec().cache_name != ModelSpec('m3').cache_name
+
+
+def test_unknown_alias_and_backend_are_rejected():
+    with pytest.raises(ValueError, match="alias 'nope'"):
+        _registry().get('nope')
+    with pytest.raises(ValueError, match='GEMINI_BACKEND'):
+        GeminiModelRegistry(None, {}, backend='other')
+
+
+@pytest.mark.parametrize('key, expected', [(None, False), ('', False), ('MOCK_KEY', False),
+                                           ('YOUR_GOOGLE_API_KEY_HERE', False), ('AIza-real', True)])
+def test_api_key_configured(key, expected):
+    assert api_key_configured(key) is expected
+
+
+def test_gemini_backend_without_key_is_not_configured():
+    assert not GeminiModelRegistry('MOCK_KEY', {'default': 'm1'}).configured
+
+
+def test_services_call_the_app_registry_model(local_app, monkeypatch):
+    model = local_app.gemini_models.get()
+    prompts = []
+    generate = model.generate_content
+    monkeypatch.setattr(model, 'generate_content',
+                        lambda content, stream=False: prompts.append(content[0]) or generate(content, stream))
+    with local_app.app_context():
+        texts = [generate_content_with_gemini(prompt) for prompt in ('Write a tagline', 'Write a slogan')]
+    assert prompts == ['Write a tagline', 'Write a slogan']
+    assert all(texts) and not any(text.startswith('Error') for text in texts)
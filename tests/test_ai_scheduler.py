@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from app.ai_scheduler import (BACKGROUND, BATCH, INTERACTIVE, GateTimeout, PriorityGate, call_priority,
+                              current_call)
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_reserved_slots_only_admit_interactive_calls():
+    gate = PriorityGate(capacity=2, reserved=1)
+    gate.acquire(BATCH)
+    with pytest.raises(GateTimeout):
+        gate.acquire(BACKGROUND, timeout=0.01)
+    gate.acquire(INTERACTIVE, timeout=0)
+    stats = gate.stats()
+    assert stats['in_flight'] == 2 and stats['admitted'] == {INTERACTIVE: 1, BACKGROUND: 0, BATCH: 1}
+
+
+def test_timed_out_waiter_is_removed():
+    gate = PriorityGate(capacity=1)
+    gate.acquire(INTERACTIVE)
+    with pytest.raises(GateTimeout):
+        gate.acquire(BATCH, timeout=0.01)
+    assert gate.stats()['waiting'][BATCH] == 0
+    gate.release()
+    # The freed slot is not handed to the waiter that gave up.
+    assert gate.stats()['in_flight'] == 0
+    gate.acquire(BATCH, timeout=0)
+    assert gate.stats()['in_flight'] == 1
+
+
+def test_freed_slots_go_to_the_highest_priority_waiter():
+    gate = PriorityGate(capacity=1)
+    gate.acquire(INTERACTIVE)
+    order = []
+
+    def call(priority):
+        with gate.slot(priority, timeout=5):
+            order.append(priority)
+
+    threads = []
+    for priority in (BATCH, BACKGROUND, BATCH, INTERACTIVE):
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        _wait_for(lambda: sum(gate.stats()['waiting'].values()) == len(threads))
+    gate.release()
+    for thread in threads:
+        thread.join()
+    assert order == [INTERACTIVE, BACKGROUND, BATCH, BATCH]
+    assert gate.stats()['in_flight'] == 0 and gate.stats()['queued'][BATCH] == 2
+
+
+def test_reserved_is_capped_below_capacity():
+    assert PriorityGate(capacity=2, reserved=5).reserved == 1
+    with pytest.raises(ValueError):
+        PriorityGate(capacity=0)
+
+
+def test_call_priority_and_defaults(local_app):
+    assert current_call() == (BACKGROUND, BACKGROUND)
+    with call_priority(BATCH, 'batch.generate'):
+        assert current_call() == (BATCH, 'batch.generate')
+    with local_app.test_request_context('/ai-services/debugger', method='POST'):
+        assert current_call() == (INTERACTIVE, 'main.debugger_route')
+        with call_priority(BACKGROUND):
+            assert current_call() == (BACKGROUND, 'main.debugger_route')
+    with pytest.raises(ValueError):
+        with call_priority('urgent'):
+            pass
@@ -0,0 +1,76 @@
+import pytest
+
+from app.ai_similar import SimilarityCache, lsh_bands, normalize
+from app.services import generate_social_media_post_service
+
+POST = "Announce our summer sale: 20% off all running shoes this weekend only, in every store"
+EDITED = "Announce our summer sale: 25% off all running shoes this weekend only, in every store!"
+
+
+def test_normalize_drops_case_punctuation_and_spacing():
+    assert normalize("  Summer SALE!!  20%\toff ") == "summer sale 20 off"
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.8, 0.9, 0.95])
+def test_lsh_band_midpoint_is_below_threshold(threshold):
+    bands, rows = lsh_bands(64, threshold)
+    assert bands * rows <= 64
+    assert (1 / bands) ** (1 / rows) <= threshold - 0.1
+
+
+def test_hit_depends_on_threshold():
+    probe = SimilarityCache()
+    score = probe.similarity(probe.signature(POST), probe.signature(EDITED))
+    assert 0.5 < score < 1
+    for threshold, hit in ((score, True), (min(1.0, score + 0.05), False)):
+        cache = SimilarityCache(threshold=threshold)
+        cache.store('social_post', cache.lookup('social_post', POST)[1], 'cached post')
+        assert (cache.lookup('social_post', EDITED)[0] == 'cached post') is hit
+
+
+def test_exact_repeats_match_after_normalization():
+    cache = SimilarityCache(threshold=1.0)
+    cache.store('social_post', cache.lookup('social_post', POST)[1], 'cached post')
+    assert cache.lookup('social_post', POST.upper().replace(':', ' - '))[0] == 'cached post'
+    assert cache.lookup('social_post', 'Write a haiku about databases')[0] is None
+
+
+def test_scopes_are_isolated():
+    cache = SimilarityCache()
+    cache.store('social_post', cache.lookup('social_post', POST)[1], 'a post')
+    assert cache.lookup('optimize_ads', POST)[0] is None
+    cache.store('optimize_ads', cache.lookup('optimize_ads', POST)[1], 'an ad')
+    assert cache.lookup('social_post', POST)[0] == 'a post'
+    assert cache.lookup('optimize_ads', POST)[0] == 'an ad'
+
+
+def test_bounded_entries_and_long_inputs():
+    cache = SimilarityCache(max_entries=2, max_chars=100)
+    texts = [f"{topic} launch for the spring collection" for topic in ('Shoes', 'Jackets', 'Hats')]
+    for text in texts:
+        cache.store('s', cache.lookup('s', text)[1], text)
+    assert cache.lookup('s', texts[0])[0] is None
+    assert cache.lookup('s', texts[2])[0] == texts[2]
+    assert cache.stats()['evictions'] == 1
+    # Every bucket only holds live entries.
+    assert set().union(*cache._buckets.values()) == set(cache._entries)
+    assert cache.lookup('s', 'x' * 101) == (None, None) and cache.bypassed == 1
+
+
+def test_expired_entries_are_not_served():
+    cache = SimilarityCache(ttl=-1)
+    cache.store('s', cache.lookup('s', POST)[1], 'stale')
+    assert cache.lookup('s', POST)[0] is None
+
+
+def test_invalid_threshold():
+    with pytest.raises(ValueError):
+        SimilarityCache(threshold=0)
+
+
+def test_near_duplicate_posts_share_one_model_call(local_app):
+    with local_app.app_context():
+        first = generate_social_media_post_service(POST)
+        assert generate_social_media_post_service(POST + '!!') == first
+        assert generate_social_media_post_service('A completely different request about hiking') != first
+    assert local_app.ai_similar.stats()['hits'] == 1 and local_app.ai_similar.stores == 2
@@ -0,0 +1,33 @@
+import pickle
+import sys
+import threading
+from datetime import date
+
+from app.columnar import AffiliateColumnStore
+from app.models import AffiliatePerformanceRecord
+
+
+def test_concurrent_upserts_of_one_key_insert_it_once():
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for _ in range(20):
+            store = AffiliateColumnStore()
+            batches = [[AffiliatePerformanceRecord(date(2024, 1, 1), f'a{i % 300}', clicks=n)
+                        for i in range(600)] for n in range(4)]
+            threads = [threading.Thread(target=store.upsert, args=(batch,)) for batch in batches]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            keys = [(r.report_date, r.affiliate_name) for r in store]
+            assert len(keys) == len(set(keys)) == 300
+    finally:
+        sys.setswitchinterval(interval)
+
+
+def test_store_pickles_without_its_lock():
+    store = AffiliateColumnStore([AffiliatePerformanceRecord(date(2024, 1, 1), 'a', clicks=1)])
+    copy = pickle.loads(pickle.dumps(store))
+    assert list(copy) == list(store)
+    assert copy.upsert([AffiliatePerformanceRecord(date(2024, 1, 1), 'a', clicks=2)]).updated == 1
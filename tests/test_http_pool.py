@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from app.http_pool import HttpPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(server.delay)
+            body = self.path.encode() * 1000
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.lock, server.active, server.peak, server.delay = threading.Lock(), 0, 0, 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def pool():
+    pool = HttpPool(http2=False, per_host=2)
+    yield pool
+    pool.close()
+
+
+def _pool_threads():
+    return [t for t in threading.enumerate() if t.name == 'http-pool']
+
+
+def test_starts_on_first_use_and_reuses_connections(server, pool):
+    assert not pool.stats()['started']
+    for path in ('/a', '/b', '/c'):
+        assert pool.request_sync('GET', server.url + path).content == path.encode() * 1000
+    # Callers on other event loops (one per Flask async view) share the same client.
+    for _ in range(2):
+        assert asyncio.run(pool.get(server.url + '/d')).status_code == 200
+    stats = pool.stats()
+    assert stats['started'] and stats['requests'] == 5 and stats['connects'] == 1
+    assert stats['connections']['open'] == 1 and stats['hosts_active'] == {}
+
+
+def test_stream_delivers_the_body_in_chunks(server, pool):
+    async def download():
+        async with pool.stream('GET', server.url + '/page') as response:
+            assert response.status_code == 200
+            return [chunk async for chunk in response.aiter_bytes()]
+
+    chunks = asyncio.run(download())
+    assert b''.join(chunks) == b'/page' * 1000
+
+
+def test_per_host_limit(server, pool):
+    server.delay = 0.05
+    with ThreadPoolExecutor(6) as executor:
+        responses = list(executor.map(lambda i: pool.request_sync('GET', f'{server.url}/{i}'), range(6)))
+    assert [r.status_code for r in responses] == [200] * 6
+    assert server.peak == 2
+    assert pool.stats()['hosts_active'] == {} and pool.stats()['hosts_waiting'] == {}
+
+
+def test_errors_are_counted(pool):
+    with pytest.raises(httpx.ConnectError):
+        pool.request_sync('GET', 'http://127.0.0.1:9/')
+    assert pool.stats()['errors'] == 1 and pool.stats()['requests'] == 1
+
+
+def test_close_stops_the_loop_and_next_use_restarts(server, pool):
+    before = len(_pool_threads())
+    pool.request_sync('GET', server.url)
+    assert len(_pool_threads()) == before + 1
+    pool.close()
+    assert not pool.stats()['started']
+    deadline = time.monotonic() + 5
+    while len(_pool_threads()) > before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(_pool_threads()) == before
+    assert pool.request_sync('GET', server.url).status_code == 200 and pool.stats()['started']
+    pool.close()
+    pool.close()  # closing twice is harmless
+
+
+def test_forked_child_starts_its_own_loop(server, pool):
+    pool.request_sync('GET', server.url)
+    parent_loop = pool._loop
+    pool._pid = -1  # as seen from a forked gunicorn worker
+    try:
+        assert pool.request_sync('GET', server.url).status_code == 200
+        assert pool._loop is not parent_loop
+    finally:
+        parent_loop.call_soon_threadsafe(parent_loop.stop)
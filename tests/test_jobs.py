@@ -0,0 +1,76 @@
+import time
+
+from app import create_app
+
+CSV = b"report_date,affiliate_name,impressions,clicks,conversions,commission_amount\n" + b"".join(
+    b"2024-01-%02d,a%d,10,%d,1,2.5\n" % (1 + i % 28, i, i) for i in range(500))
+
+
+def test_ingest_job_parses_in_a_process_pool_without_fork(tmp_path):
+    app = create_app({'TESTING': True, 'CSV_INGEST_PROCESSES': 1, 'CSV_INGEST_BATCH_SIZE': 100})
+    manager = app.ingest_jobs
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(CSV)
+    try:
+        job = manager.submit('affiliate', str(path), 'upload.csv')
+        deadline = time.time() + 60
+        while job.status in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.05)
+        assert manager._pool._mp_context.get_start_method() != 'fork'
+    finally:
+        manager.shutdown()
+    assert (job.status, job.progress.rows_processed, job.progress.records_added) == ('done', 500, 500)
+    assert len(app.affiliate_data_store) == 500
+
+
+def _wait(poll, deadline=60):
+    end = time.time() + deadline
+    while time.time() < end:
+        state = poll()
+        if state['status'] in ('done', 'failed'):
+            return state
+        time.sleep(0.05)
+    raise AssertionError('job did not finish')
+
+
+def test_job_status_is_shared_between_sqlite_workers(tmp_path):
+    config = {'TESTING': True, 'STORAGE_BACKEND': 'sqlite', 'STORAGE_SQLITE_PATH': str(tmp_path / 'db.sqlite3'),
+              'CSV_INGEST_PROCESSES': 0, 'CSV_INGEST_BATCH_SIZE': 100}
+    worker_a, worker_b = create_app(config), create_app(config)
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(CSV)
+    try:
+        job = worker_a.ingest_jobs.submit('affiliate', str(path), 'upload.csv')
+        client = worker_b.test_client()
+        state = _wait(lambda: client.get(f'/api/jobs/{job.id}').get_json())
+    finally:
+        worker_a.ingest_jobs.shutdown()
+    assert (state['status'], state['rows_processed'], state['records_added']) == ('done', 500, 500)
+    assert [j['id'] for j in client.get('/api/jobs').get_json()['jobs']] == [job.id]
+    assert len(worker_b.affiliate_data_store) == 500
+
+
+def test_errors_are_reported_while_the_job_runs(tmp_path):
+    app = create_app({'TESTING': True, 'CSV_INGEST_PROCESSES': 0, 'CSV_INGEST_BATCH_SIZE': 100})
+    manager = app.ingest_jobs
+    snapshots = []
+    save = manager._table.save
+    manager._table.save = lambda job: snapshots.append((job.status, job.progress.batches, len(job.errors))) or save(job)
+    path = tmp_path / 'upload.csv'
+    path.write_bytes(CSV.replace(b',a1,10,1,', b',a1,10,x,'))
+    try:
+        job = manager.submit('affiliate', str(path), 'upload.csv')
+        _wait(lambda: job.as_dict())
+    finally:
+        manager.shutdown()
+    assert ('running', 1, 1) in snapshots
+    assert job.errors == ["Row 3: Invalid integer value 'x' for 'clicks'."]
+
+
+def test_default_pool_is_split_between_workers(monkeypatch):
+    monkeypatch.delenv('CSV_INGEST_PROCESSES', raising=False)
+    monkeypatch.setattr('os.cpu_count', lambda: 9)
+    monkeypatch.setenv('WEB_CONCURRENCY', '4')
+    assert create_app({'TESTING': True}).config['CSV_INGEST_PROCESSES'] == 2
+    monkeypatch.setenv('WEB_CONCURRENCY', '16')
+    assert create_app({'TESTING': True}).config['CSV_INGEST_PROCESSES'] == 1
@@ -0,0 +1,10 @@
+import pytest
+
+from app.link_cache import cacheable
+
+
+@pytest.mark.parametrize('status, expected', [(200, True), (301, True), (404, True), (410, True),
+                                              (408, False), (429, False), (500, False), (503, False),
+                                              ('error', False)])
+def test_transient_outcomes_are_not_cached(status, expected):
+    assert cacheable(status) is expected
@@ -0,0 +1,69 @@
+from datetime import date
+
+from app import create_app
+from app.columnar import AdCampaignColumnStore
+from app.models import AdCampaignPerformanceRecord
+from app.pagination import TableQuery, page_after, paginate
+
+
+def _records(platforms):
+    return [AdCampaignPerformanceRecord(date.fromordinal(738886 + i), f'c{i}', platform=p, clicks=i)
+            for i, p in enumerate(platforms)]
+
+
+def test_sort_by_all_null_platform():
+    store = AdCampaignColumnStore(_records([None, None, None]))
+    page = paginate(store, TableQuery(sort='platform'), 1, 2)
+    assert [r.campaign_name for r in page.rows] == ['c0', 'c1']
+    records, cursor, total = page_after(store, TableQuery(sort='platform', descending=True), None, 2)
+    records += page_after(store, TableQuery(), cursor, 2)[0]
+    assert [r.campaign_name for r in records] == ['c0', 'c1', 'c2'] and total == 3
+
+
+def test_null_platforms_sort_last():
+    store = AdCampaignColumnStore(_records([None, 'meta', None, 'google']))
+    for descending in (False, True):
+        rows = paginate(store, TableQuery(sort='platform', descending=descending), 1, 10).rows
+        assert [r.platform for r in rows] == (['google', 'meta'] if not descending else ['meta', 'google']) + [None, None]
+
+
+def test_platform_sort_routes_without_platform_values():
+    app = create_app({'TESTING': True})
+    app.ad_campaign_data_store.extend(_records([None, None]))
+    client = app.test_client()
+    assert client.get('/ads-optimization?sort=platform').status_code == 200
+    response = client.get('/api/data/ad-campaigns?sort=platform')
+    assert response.status_code == 200
+    assert [row['campaign_name'] for row in response.get_json()['data']] == ['c0', 'c1']
+
+
+def test_concurrent_queries_share_the_order_cache(monkeypatch):
+    import sys
+    import threading
+
+    store = AdCampaignColumnStore(_records(['meta', None, 'google'] * 50))
+    queries = [TableQuery(sort=name, descending=d) for name in ('platform', 'clicks', 'campaign_name', 'report_date')
+               for d in (False, True)] + [TableQuery(search=f'c{i}') for i in range(6)]
+    expected = {query: [r.campaign_name for r in paginate(store, query, 1, 5).rows] for query in queries}
+    failures = []
+
+    def run(offset):
+        try:
+            for i in range(1000):
+                query = queries[(i + offset) % len(queries)]
+                assert [r.campaign_name for r in paginate(store, query, 1, 5).rows] == expected[query]
+        except Exception as e:  # noqa: BLE001 - reported below
+            failures.append(e)
+
+    monkeypatch.setattr('app.pagination._ORDER_CACHE_ENTRIES', 2)  # evict constantly
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert not failures
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app import ratelimit
+from app.ratelimit import RateLimitTimeout, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A frozen monotonic clock; sleeps are recorded instead of taken."""
+    fake = SimpleNamespace(now=100.0, sleeps=[])
+    fake.monotonic = lambda: fake.now
+    fake.sleep = fake.sleeps.append
+    monkeypatch.setattr(ratelimit, 'time', fake)
+    return fake
+
+
+def test_waiters_are_served_in_arrival_order(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    for _ in range(5):
+        bucket.acquire()
+    # The burst is free; each later caller reserves the next token, half a second apart.
+    assert clock.sleeps == [0.5, 1.0, 1.5]
+    assert bucket.stats()['tokens'] == -3
+    clock.now += 2
+    assert bucket.stats()['tokens'] == 1 and bucket.waits == 3
+
+
+def test_timeout_raises_without_taking_a_token(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    bucket.acquire()
+    bucket.acquire()
+    with pytest.raises(RateLimitTimeout):
+        bucket.acquire(timeout=1.5)
+    bucket.acquire(timeout=2)
+    assert clock.sleeps == [1.0, 2.0]
+
+
+def test_try_acquire_does_not_wait(clock):
+    bucket = TokenBucket.per_minute(60, 1)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 1
+    assert bucket.try_acquire()
+    assert clock.sleeps == []
+
+
+def test_non_positive_rate_disables_limiting(clock):
+    bucket = TokenBucket(rate=0, capacity=1)
+    for _ in range(10):
+        bucket.acquire(timeout=0)
+    assert clock.sleeps == [] and bucket.try_acquire()
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+
+from app import create_app
+
+
+@pytest.fixture
+def client():
+    return create_app({'TESTING': True}).test_client()
+
+
+@pytest.mark.parametrize('field, value', [('max_depth', 'two'), ('max_pages', -1), ('max_pages', 1.5), ('max_depth', True)])
+def test_system_analyzer_rejects_bad_limits(client, field, value):
+    response = client.post('/ai-services/system-analyzer',
+                           json={'url': 'http://127.0.0.1:9/', 'crawl': True, field: value})
+    assert response.status_code == 400
+    assert field in response.get_json()['error']
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_ad_csv_upload_without_platform_column(tmp_path, backend):
+    app = create_app({'TESTING': True, 'CSV_INGEST_BACKGROUND': False, 'STORAGE_BACKEND': backend,
+                      'STORAGE_SQLITE_PATH': str(tmp_path / 'db.sqlite3')})
+    client = app.test_client()
+    body = b'report_date,campaign_name,clicks\n2024-01-01,Spring,3\n2024-01-02,Spring,4\n'
+    for _ in range(2):  # the second upload matches the stored rows by key
+        response = client.post('/ads-optimization/upload-csv', data={'file': (io.BytesIO(body), 'ads.csv')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+    assert [(r.campaign_name, r.platform, r.clicks) for r in app.ad_campaign_data_store] == [
+        ('Spring', None, 3), ('Spring', None, 4)]
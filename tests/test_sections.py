@@ -0,0 +1,57 @@
+import random
+import re
+
+import pytest
+
+from app.sections import SectionExtractor, extract_sections
+
+
+def regex_sections(text):
+    """The regex parser parse_website_response used before SectionExtractor."""
+    found = {}
+    for name in ('html', 'css'):
+        match = (re.search(rf'\[{name}\](.*?)\[/{name}\]', text, re.DOTALL | re.IGNORECASE)
+                 or re.search(rf'```{name}\n(.*?)```', text, re.DOTALL | re.IGNORECASE))
+        found[name] = match.group(1).strip() if match else ''
+    return found['html'], found['css']
+
+
+SAMPLES = [
+    "[HTML]\n<p>a</p>\n[/HTML]\n[CSS]\np{}\n[/CSS]",
+    "Here:\n```html\n<div>x</div>\n```\nand\n```css\n.x{color:red}\n```\n",
+    "```html\n<b>f</b>```\n[html]<i>tag</i>[/Html] [css]a{}[/CSS]",
+    "```html\n[HTML]\n<p>tagged</p>\n[/HTML]\n[CSS]\np{color:red}\n[/CSS]\n```",
+    "[HTML]<p>[CSS]inner[/CSS]</p>[/HTML]",
+    "```css\n.a{}\n```\n```html\n<p>[CSS]b{}[/CSS]</p>\n```",
+    "[HTML]first[HTML]second[/HTML]",
+    "no sections",
+    "[HTML]unclosed",
+    "[CSS]c[/CSS][HTML]h[/HTML]",
+]
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_matches_regex_parser_in_any_chunking(text):
+    expected = regex_sections(text)
+    whole = extract_sections(text)
+    assert (whole.get('html'), whole.get('css')) == expected
+    rng = random.Random(text)
+    for _ in range(100):
+        extractor, i = SectionExtractor(), 0
+        while i < len(text):
+            size = rng.randint(1, 6)
+            extractor.feed(text[i:i + size])
+            i += size
+        assert (extractor.get('html'), extractor.get('css')) == expected
+
+
+def test_tags_inside_fence_take_precedence():
+    sections = extract_sections("```html\n[HTML]\n<p>x</p>\n[/HTML]\n[CSS]\np{}\n[/CSS]\n```")
+    assert (sections.get('html'), sections.get('css')) == ('<p>x</p>', 'p{}')
+
+
+def test_reports_each_section_when_it_closes():
+    extractor = SectionExtractor()
+    assert extractor.feed("[HTML]<p>a</p>[/HT") == []
+    assert extractor.feed("ML] [CSS]p{}") == [('html', '<p>a</p>')]
+    assert extractor.feed("[/CSS]") == [('css', 'p{}')]
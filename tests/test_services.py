@@ -0,0 +1,95 @@
+import csv
+import io
+
+import pytest
+
+from app import create_app
+from app.columnar import AffiliateColumnStore
+from app.services import CsvIngestError, ingest_affiliate_csv_stream, parse_affiliate_csv, parse_affiliate_rows
+
+HEADER = ['report_date', 'affiliate_name', 'impressions', 'clicks', 'conversions', 'commission_amount']
+
+
+@pytest.mark.parametrize('clicks, valid', [('9223372036854775807', True), ('-9223372036854775808', True),
+                                           ('9223372036854775808', False), ('-' + '9' * 30, False)])
+def test_integers_outside_int64_are_invalid_not_fatal(clicks, valid):
+    rows = [['2024-01-01', 'a', '1', '2', '0', '1.5'], ['2024-01-02', 'b', '1', clicks, '0', '1.5']]
+    batch, errors = parse_affiliate_rows(rows, {name: i for i, name in enumerate(HEADER)}, 2)
+    expected = [] if valid else [f"Row 3: Invalid integer value '{clicks}' for 'clicks'."]
+    assert errors == expected
+    assert [r.clicks for r in batch] == [2, int(clicks) if valid else None]
+
+    text = io.StringIO()
+    csv.writer(text).writerows([HEADER] + rows)
+    text.seek(0)
+    records, row_errors = parse_affiliate_csv(text)
+    assert row_errors == errors
+    assert [r.clicks for r in records] == [r.clicks for r in batch]
+
+
+def test_invalid_utf8_reports_the_rows_already_saved():
+    lines = [','.join(HEADER).encode()] + [b'2024-01-01,a%d,1,2,0,1.5' % i for i in range(250)]
+    lines[201] = b'2024-01-01,caf\xe9,1,2,0,1.5'
+    store = AffiliateColumnStore()
+    with create_app({'TESTING': True}).app_context():
+        with pytest.raises(CsvIngestError) as raised:
+            ingest_affiliate_csv_stream(io.BytesIO(b'\n'.join(lines)), store, batch_size=100, chunk_size=64)
+    progress = raised.value.progress
+    # Whole blocks read before the bad bytes are saved, and the error says how many rows that was.
+    assert 0 < progress.rows_processed < 201
+    assert len(store) == progress.rows_processed == progress.records_added
+    assert 'not valid UTF-8' in str(raised.value)
+    assert f'stopped after {progress.rows_processed} rows' in str(raised.value)
+
+
+class _Model:
+    def generate_content(self, content, stream=False):
+        response = type('Response', (), {'text': 'ok'})()
+        return [response] if stream else response
+
+
+class _Registry:
+    configured = True
+
+    def spec(self, model):
+        return type('Spec', (), {'cache_name': model})()
+
+    def get(self, model):
+        return _Model()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_quota_wait_does_not_hold_a_gate_slot(stream):
+    from app.services import generate_content_with_gemini, stream_content_with_gemini
+
+    app = create_app({'TESTING': True, 'AI_CACHE_ENABLED': False})
+    app.gemini_models = _Registry()
+    in_flight_at_wait = []
+    acquire = app.ai_rate_limiter.acquire
+
+    def recording_acquire(*args, **kwargs):
+        in_flight_at_wait.append(app.ai_gate._in_flight)
+        return acquire(*args, **kwargs)
+
+    app.ai_rate_limiter.acquire = recording_acquire
+    with app.app_context():
+        text = ''.join(stream_content_with_gemini('hi')) if stream else generate_content_with_gemini('hi')
+    assert text == 'ok'
+    assert in_flight_at_wait == [0]
+
+
+def test_row_and_batch_parsers_share_one_date_cache():
+    from app import services
+
+    rows = [['2031-02-03', 'a', '1', '2', '0', '1.5'], ['2031-02-30', 'b', '1', '2', '0', '1.5']]
+    text = io.StringIO()
+    csv.writer(text).writerows([HEADER] + rows)
+    text.seek(0)
+    services._report_dates.clear()
+    records, row_errors = parse_affiliate_csv(text)
+    cached = dict(services._report_dates)
+    assert set(cached) == {'2031-02-03', '2031-02-30'}
+    batch, errors = parse_affiliate_rows(rows, {name: i for i, name in enumerate(HEADER)}, 2)
+    assert services._report_dates == cached
+    assert errors == row_errors and len(errors) == 1
+    assert [r.report_date for r in batch] == [r.report_date for r in records]
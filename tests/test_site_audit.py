@@ -0,0 +1,51 @@
+import codecs
+
+import pytest
+
+from app.site_audit import LinkExtractor, extract_links, sniff_encoding
+
+BASE = 'http://e.com/'
+
+
+def _feed(content: bytes, chunk: int, encoding=None):
+    extractor = LinkExtractor(BASE, encoding)
+    links = []
+    for start in range(0, len(content), chunk):
+        links += extractor.feed(content[start:start + chunk])
+    return links + extractor.close()
+
+
+def test_undeclared_utf8_is_not_read_as_latin1():
+    assert extract_links(BASE, '<a href="/café">crème</a>'.encode()) == [
+        {'url': 'http://e.com/café', 'text': 'crème'}]
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 100, 5000])
+def test_utf8_sniffed_across_chunks(chunk):
+    page = ('<html><body>' + '<p>filler</p>' * 200 + '<a href="/naïve">ü</a></body></html>').encode()
+    assert _feed(page, chunk) == [{'url': 'http://e.com/naïve', 'text': 'ü'}]
+
+
+def test_meta_charset_is_honoured():
+    page = '<html><head><meta charset="windows-1252"></head><a href="/café">é</a>'.encode('cp1252')
+    assert extract_links(BASE, page) == [{'url': 'http://e.com/café', 'text': 'é'}]
+
+
+def test_bom_and_header_encoding():
+    assert sniff_encoding(codecs.BOM_UTF16_LE + '<a>'.encode('utf-16-le')) == 'UTF-16LE'
+    assert sniff_encoding(b'<meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-1">') == 'ISO-8859-1'
+    assert sniff_encoding(b'<p>plain</p>') == 'utf-8'
+    page = '<a href="/é">é</a>'.encode('latin-1')
+    assert _feed(page, 4, encoding='latin-1') == [{'url': 'http://e.com/é', 'text': 'é'}]
+    assert extract_links(BASE, codecs.BOM_UTF8 + '<a href="/é">x</a>'.encode()) == [{'url': 'http://e.com/é', 'text': 'x'}]
+
+
+def test_encoding_unknown_to_libxml2():
+    page = '<a href="/é">é</a>'.encode('euc_jp')
+    assert _feed(page, 3, encoding='euc_jp') == [{'url': 'http://e.com/é', 'text': 'é'}]
+    # Not an encoding at all: sniffed, so still read as UTF-8.
+    assert _feed('<a href="/é">é</a>'.encode(), 3, encoding='x-bogus') == [{'url': 'http://e.com/é', 'text': 'é'}]
+
+
+def test_empty_page():
+    assert extract_links(BASE, b'') == []
@@ -0,0 +1,83 @@
+import json
+
+from app.routes import _sse_response
+
+
+def _events(body):
+    """(event name, payload) of each Server-Sent Event in body, 'message' for unnamed ones."""
+    events = []
+    for block in body.decode().split('\n\n'):
+        if not block:
+            continue
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        assert set(fields) <= {'event', 'data'}
+        events.append((fields.get('event', 'message'), json.loads(fields['data'])))
+    return events
+
+
+class _Chunks:
+    """An iterator of text chunks that records whether it was closed, optionally failing partway."""
+
+    def __init__(self, chunks, fail_after=None):
+        self._chunks = iter(chunks)
+        self._left = fail_after
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._left == 0:
+            raise RuntimeError('model went away')
+        if self._left is not None:
+            self._left -= 1
+        return next(self._chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def _stream(app, chunks, **kwargs):
+    with app.test_request_context():
+        response = _sse_response(chunks, **kwargs)
+        assert response.mimetype == 'text/event-stream'
+        assert response.headers['Cache-Control'] == 'no-cache'
+        return _events(response.get_data())
+
+
+def test_chunks_then_done(local_app):
+    chunks = _Chunks(['Hel', 'lo\nworld', '"quoted"'])
+    events = _stream(local_app, chunks, finish=lambda text: {'length': len(text)})
+    assert events == [('message', {'text': 'Hel'}), ('message', {'text': 'lo\nworld'}),
+                      ('message', {'text': '"quoted"'}), ('done', {'chunks': 3, 'length': 19})]
+    assert chunks.closed
+
+
+def test_error_event_after_partial_stream(local_app):
+    chunks = _Chunks(['a', 'b', 'c'], fail_after=2)
+    events = _stream(local_app, chunks, finish=lambda text: {'unreachable': True})
+    assert events == [('message', {'text': 'a'}), ('message', {'text': 'b'}),
+                      ('error', {'error': 'model went away'})]
+    assert chunks.closed
+
+
+def test_generate_script_stream_matches_buffered_response(local_app):
+    client = local_app.test_client()
+    local_app.config['AI_CACHE_ENABLED'] = False
+    streamed = client.post('/api/generate-script?stream=1', json={'prompt': 'A launch video'})
+    events = _events(streamed.get_data())
+    texts = [payload['text'] for name, payload in events if name == 'message']
+    assert events[-1] == ('done', {'chunks': len(texts)}) and len(texts) > 1
+    buffered = client.post('/api/generate-script', json={'prompt': 'A launch video'}).get_json()
+    assert ''.join(texts) == buffered['response']
+
+
+def test_website_stream_sends_sections_as_they_close(local_app):
+    client = local_app.test_client()
+    response = client.post('/ai-services/software-engineer', json={'action': 'website', 'prompt': 'A bakery', 'stream': True},
+                           headers={'Accept': 'text/event-stream'})
+    events = _events(response.get_data())
+    sections = {payload['name']: payload['content'] for name, payload in events if name == 'section'}
+    assert set(sections) == {'html', 'css'}
+    name, done = events[-1]
+    assert name == 'done' and done['html'] == sections['html'] and done['css'] == sections['css']
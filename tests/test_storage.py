@@ -0,0 +1,79 @@
+import logging
+import sqlite3
+from datetime import date
+
+from app import create_app
+from app.columnar import AffiliateColumnStore
+from app.models import AffiliatePerformanceRecord
+from app.services import get_mailchimp_campaigns_mock, get_mock_cloud_service_data
+from app.storage import SQLiteDatabase, SQLiteRecordStore
+
+
+def _store(path):
+    return SQLiteRecordStore(SQLiteDatabase(str(path)), 'affiliate_performance', AffiliatePerformanceRecord,
+                             AffiliateColumnStore, ['report_date'])
+
+
+def test_duplicate_keys_are_moved_aside_and_logged(tmp_path, caplog):
+    path = tmp_path / 'db.sqlite3'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE affiliate_performance (id INTEGER PRIMARY KEY, seq INTEGER NOT NULL, report_date TEXT, '
+                 'affiliate_name TEXT, impressions INTEGER, clicks INTEGER, conversions INTEGER, commission_amount REAL)')
+    conn.executemany('INSERT INTO affiliate_performance VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [
+        (1, 1, '2024-01-01', 'a', 10, 1, 0, 0.0),
+        (2, 2, '2024-01-01', 'a', 20, 2, 0, 0.0),
+        (3, 3, '2024-01-01', 'b', 30, 3, 0, 0.0),
+    ])
+    conn.commit()
+    conn.close()
+
+    with caplog.at_level(logging.WARNING, logger='app.storage'):
+        store = _store(path)
+    assert 'moved 1 rows' in caplog.text
+    assert sorted((r.affiliate_name, r.clicks) for r in store) == [('a', 2), ('b', 3)]
+
+    conn = sqlite3.connect(path)
+    assert conn.execute('SELECT id, clicks FROM affiliate_performance_duplicates').fetchall() == [(1, 1)]
+    assert conn.execute("SELECT sql FROM sqlite_master WHERE name = 'ux_affiliate_performance_key'").fetchone()[0] \
+        .startswith('CREATE UNIQUE INDEX')
+
+    caplog.clear()
+    with caplog.at_level(logging.WARNING, logger='app.storage'):
+        _store(path)
+    assert not caplog.text
+
+
+def test_upsert_with_unique_index(tmp_path):
+    store = _store(tmp_path / 'db.sqlite3')
+    day = date(2024, 1, 1)
+    store.upsert([AffiliatePerformanceRecord(day, 'a', clicks=1)])
+    counts = store.upsert([AffiliatePerformanceRecord(day, 'a', clicks=2), AffiliatePerformanceRecord(day, 'b')])
+    assert (counts.inserted, counts.updated) == (1, 1)
+    assert sorted((r.affiliate_name, r.clicks) for r in store) == [('a', 2), ('b', None)]
+
+
+def test_mock_data_is_seeded_once(tmp_path):
+    config = {'TESTING': True, 'STORAGE_BACKEND': 'sqlite', 'STORAGE_SQLITE_PATH': str(tmp_path / 'db.sqlite3')}
+    create_app(config)
+    app = create_app(config)  # a second worker starting on the same database
+    assert len(app.cloud_service_data_store) == len(get_mock_cloud_service_data())
+    assert len(app.mailchimp_data_store) == len(get_mailchimp_campaigns_mock())
+    assert app.test_client().get('/cloud-optimization').status_code == 200
+    assert len(app.cloud_service_data_store) == len(get_mock_cloud_service_data())
+
+
+def test_mirror_syncs_once_per_request(tmp_path, monkeypatch):
+    app = create_app({'TESTING': True, 'STORAGE_BACKEND': 'sqlite', 'STORAGE_SQLITE_PATH': str(tmp_path / 'db.sqlite3')})
+    store = app.affiliate_data_store
+    other = _store(tmp_path / 'db.sqlite3')  # another worker's view of the table
+    calls = []
+    sync = store._sync
+    monkeypatch.setattr(store, '_sync', lambda: calls.append(1) or sync())
+    with app.test_request_context():
+        len(store), list(store), store.fields
+        assert len(calls) == 1
+        other.upsert([AffiliatePerformanceRecord(date(2024, 1, 1), 'a', clicks=1)])
+        assert len(store) == 0
+    with app.test_request_context():
+        assert len(store) == 1
+    assert len(calls) == 2